@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Aggregate the profiles of sampled requests to report of the hottest
+functions.
+"""
+# Imports =====================================================================
+import sys
+import os.path
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../src/edeposit/amqp"))
+try:
+    from rest import profiler
+except ImportError:
+    from edeposit.amqp.rest import profiler
+
+
+# Main program ================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="Profiles or directories with them. Default PROFILE_DIR."
+    )
+    parser.add_argument(
+        "-f",
+        "--filter",
+        default=None,
+        help="Regexp matching the names of the profiles, for example "
+             "`^GET_api_v1_track` or `^CacheTick`."
+    )
+    parser.add_argument(
+        "-s",
+        "--sort",
+        default="cumulative",
+        choices=["cumulative", "tottime", "calls", "ncalls"],
+        help="Sort the functions by. Default `cumulative`."
+    )
+    parser.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=30,
+        help="Number of reported functions. Default 30."
+    )
+    parser.add_argument(
+        "--callers",
+        action="store_true",
+        help="Also print who called the reported functions."
+    )
+    args = parser.parse_args()
+
+    stats, count = profiler.load_stats(
+        args.paths or [profiler.profile_dir()],
+        name_filter=args.filter,
+    )
+    if stats is None:
+        sys.stderr.write("No profiles found.\n")
+        sys.exit(1)
+
+    print "Aggregated %d profiles.\n" % count
+
+    stats.strip_dirs()
+    stats.sort_stats(args.sort)
+    stats.print_stats(args.top)
+
+    if args.callers:
+        stats.print_callers(args.top)
@@ -3,12 +3,26 @@
 #
 # Interpreter version: python 2.7
 #
+"""
+Run the ZEO server with the configuration from ``ZEO_SERVER_CONF_FILE``.
+
+ZEO resolves the write conflicts on the server, so the server process has to
+be able to import the persistent classes of this package (for example
+``StatusInfo._p_resolveConflict`` from ``rest.database.status_handler``).
+Otherwise, every concurrent status update fails with ``ConflictError``.
+
+Because of that, ``runzeo`` has to be installed in the same Python
+environment as this package, and it is started with the package in the
+``PYTHONPATH``.
+"""
 # Imports =====================================================================
+import os
 import sys
 import os.path
 import subprocess
 
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../src/edeposit/amqp"))
+SRC_PATH = os.path.join(os.path.dirname(__file__), "../src/edeposit/amqp")
+sys.path.insert(0, SRC_PATH)
 try:
     from rest import settings
 except ImportError:
@@ -24,4 +38,14 @@ assert settings.ZEO_SERVER_CONF_FILE, settings._format_error(
 
 # Main program ================================================================
 if __name__ == '__main__':
-    subprocess.check_call(["runzeo", "-C", settings.ZEO_SERVER_CONF_FILE])
+    # conflict resolution on the server needs to import the persistent classes
+    python_path = [os.path.abspath(SRC_PATH), os.environ.get("PYTHONPATH")]
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(path for path in python_path if path),
+    )
+
+    subprocess.check_call(
+        ["runzeo", "-C", settings.ZEO_SERVER_CONF_FILE],
+        env=env,
+    )
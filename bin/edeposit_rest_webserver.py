@@ -6,27 +6,98 @@
 # Imports =====================================================================
 from __future__ import unicode_literals
 
+import os
 import sys
+import gzip
 import json
 import time
 import uuid
+import hashlib
+import threading
 import traceback
+from io import BytesIO
 from os.path import join
 from os.path import dirname
+from functools import wraps
+from contextlib import contextmanager
+
+sys.path.insert(0, join(dirname(__file__), "../src/edeposit/amqp"))
+
+try:
+    from rest import settings
+except ImportError:
+    from edeposit.amqp.rest import settings
+
+# cooperative mode has to patch the sockets before bottle is imported; threads
+# stay native, because they are used for the blocking ZEO and bcrypt calls
+COOPERATIVE = settings.WEB_SERVER == "gevent"
+if COOPERATIVE:
+    import gevent
+    import gevent.local
+    import gevent.monkey
+    from gevent.threadpool import ThreadPool
+
+    gevent.monkey.patch_all(thread=False)
+
+    import bottle
+
+    def _greenlet_local(cls):
+        """
+        Return instance of bottle's `cls` with its thread-local properties
+        stored in greenlet-local storage instead.
+
+        Only bottle's `request` and `response` are replaced, other
+        thread-locals (like the :attr:`DB_POOL`) stay native, because they
+        are used from the threads of the :attr:`BLOCKING_POOL`.
+        """
+        def greenlet_local_property():
+            storage = gevent.local.local()
+
+            def fget(self):
+                try:
+                    return storage.var
+                except AttributeError:
+                    raise RuntimeError("Request context not initialized.")
+
+            def fset(self, value):
+                storage.var = value
+
+            def fdel(self):
+                del storage.var
+
+            return property(fget, fset, fdel, "Greenlet-local property")
+
+        properties = {
+            name: greenlet_local_property()
+            for name, value in vars(cls).items()
+            if isinstance(value, property)
+        }
+
+        return type(str(cls.__name__), (cls,), properties)()
+
+    bottle.request = _greenlet_local(bottle.LocalRequest)
+    bottle.response = _greenlet_local(bottle.LocalResponse)
 
 from bottle import run
 from bottle import get
+from bottle import put
 from bottle import post
 from bottle import route
 from bottle import abort
+from bottle import install
 from bottle import request
+from bottle import response
+from bottle import http_date
+from bottle import parse_date
 from bottle import auth_basic
 from bottle import HTTPResponse
+from bottle import ServerAdapter
 
 from bottle_rest import form_to_params
 
 import dhtmlparser
 from docutils.core import publish_parts
+from ZODB.POSException import ConflictError
 
 try:
     from models import SchemaError
@@ -43,18 +114,31 @@ except ImportError:
     from edeposit.amqp.models.libraries import LIBRARY_MAP
     from edeposit.amqp.models.libraries import DEFAULT_LIBRARY
 
-sys.path.insert(0, join(dirname(__file__), "../src/edeposit/amqp"))
-
 try:
-    from rest import settings
     from rest.database import UserHandler
     from rest.database import CacheHandler
     from rest.database import StatusHandler
+    from rest.database import ThreadHandlerPool
+    from rest.database import write_temp_file
+    from rest.database import remove_temp_file
+    from rest.database import start_notification_broker
+    from rest.database.cache_handler import UploadTooLargeException
+    from rest.database.user_handler import CREDENTIAL_CACHE
+    from rest import metrics
+    from rest import profiler
 except ImportError:
-    from edeposit.amqp.rest import settings
     from edeposit.amqp.rest.database import UserHandler
     from edeposit.amqp.rest.database import CacheHandler
     from edeposit.amqp.rest.database import StatusHandler
+    from edeposit.amqp.rest.database import ThreadHandlerPool
+    from edeposit.amqp.rest.database import write_temp_file
+    from edeposit.amqp.rest.database import remove_temp_file
+    from edeposit.amqp.rest.database import start_notification_broker
+    from edeposit.amqp.rest.database.cache_handler import \
+        UploadTooLargeException
+    from edeposit.amqp.rest.database.user_handler import CREDENTIAL_CACHE
+    from edeposit.amqp.rest import metrics
+    from edeposit.amqp.rest import profiler
 
 
 # Variables ===================================================================
@@ -62,23 +146,117 @@ TEMPLATE_PATH = join(
     dirname(__file__), "../src/edeposit/amqp/rest/html_templates"
 )
 V1_PATH = "/api/v1/"  # TODO: api_v1
-USER_DB = None
+
+# handlers are created lazily in each worker thread, because ZEO connections
+# can't be shared between threads (and processes spawned by reloader)
+DB_POOL = ThreadHandlerPool(
+    size=settings.WEB_DB_POOL_SIZE,
+    max_requests=settings.WEB_DB_POOL_RECYCLE,
+)
+
+# in cooperative mode, the calls blocking the event loop are made in threads
+BLOCKING_POOL = ThreadPool(settings.WEB_DB_POOL_SIZE) if COOPERATIVE else None
+
+# in threaded mode, each waiting long-poll holds one of the worker threads
+LONG_POLL_SLOTS = None
+if not COOPERATIVE and settings.WEB_MAX_LONG_POLLS:
+    LONG_POLL_SLOTS = threading.BoundedSemaphore(settings.WEB_MAX_LONG_POLLS)
+
+ROUTE_LATENCY = metrics.REGISTRY.histogram(
+    "edeposit_rest_http_request_seconds",
+    "Duration of the HTTP requests.",
+    ["method", "route", "status"],
+)
 
 
 # Functions & classes =========================================================
+@contextmanager
+def database(handler_cls):
+    """
+    Yield instance of `handler_cls` from the :attr:`DB_POOL`.
+    """
+    with DB_POOL.checkout() as handlers:
+        yield handlers.get(
+            handler_cls,
+            conf_path=settings.ZEO_CLIENT_CONF_FILE,
+            project_key=settings.PROJECT_KEY,
+        )
+
+
+def blocking(fn, *args, **kwargs):
+    """
+    Call `fn`, which blocks on ZEO or CPU. In cooperative mode, the call is
+    made in thread from :attr:`BLOCKING_POOL`, so other connections are
+    served meanwhile.
+
+    Warning:
+        Bottle's `request` is not available in the `fn`.
+
+    Returns:
+        obj: Value returned by `fn`.
+    """
+    if BLOCKING_POOL is None:
+        return fn(*args, **kwargs)
+
+    return BLOCKING_POOL.apply(fn, args, kwargs)
+
+
+def in_database(handler_cls, fn):
+    """
+    Call `fn` with instance of `handler_cls` using :func:`blocking`.
+
+    The `fn` should return only plain data, not the persistent objects, as
+    they can't leave the thread of the handler.
+
+    Args:
+        handler_cls (class): Class of the database handler.
+        fn (fn): Function taking the handler as the only parameter.
+
+    Returns:
+        obj: Value returned by `fn`.
+    """
+    def call_with_handler():
+        with database(handler_cls) as handler:
+            return fn(handler)
+
+    return blocking(call_with_handler)
+
+
+def cooperative_sleep():
+    """
+    Return sleep function for the waiting in the cooperative mode, or None.
+    """
+    return gevent.sleep if COOPERATIVE else None
+
+
+class CooperativeServer(ServerAdapter):
+    """
+    Gevent WSGI server handling each connection in its own greenlet. Number
+    of connections is limited by :attr:`.settings.WEB_MAX_CONNECTIONS`.
+    """
+    def run(self, handler):
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+
+        server = WSGIServer(
+            (self.host, self.port),
+            handler,
+            spawn=Pool(settings.WEB_MAX_CONNECTIONS),
+            log=None if self.quiet else "default",
+        )
+        server.serve_forever()
+
+
 def check_auth(username, password):
     request.environ["username"] = username
     request.environ["password"] = password
 
-    # for some strange reason, this has to be initialized in the function, not
-    # at the beginning of the file
-    global USER_DB
-    if not USER_DB:
-        USER_DB = UserHandler(conf_path=settings.ZEO_CLIENT_CONF_FILE)
-
-    return USER_DB.is_valid_user(
-        username=username,
-        password=password
+    return in_database(
+        UserHandler,
+        lambda user_db: user_db.is_valid_user(
+            username=username,
+            password=password
+        )
     )
 
 
@@ -107,13 +285,21 @@ def process_metadata(json_metadata):
     return czech_to_edeposit_dict(metadata)
 
 
-def status_info_to_dict(si):
+def status_info_to_dict(si, summary=False):
     def msg_to_dict(msg):
         return {
             "message": msg.message,
             "timestamp": msg.timestamp,
         }
 
+    if summary:
+        return {
+            "rest_id": si.rest_id,
+            "pub_url": si.pub_url,
+            "book_name": si.book_name,
+            "registered_ts": si.registered_ts,
+        }
+
     return {
         "pub_url": si.pub_url,
         "book_name": si.book_name,
@@ -124,11 +310,296 @@ def status_info_to_dict(si):
     }
 
 
+def query_param(name, conversion):
+    """
+    Read optional query parameter `name` and convert it using `conversion`.
+
+    Raises:
+        ValueError: If the parameter can't be converted.
+    """
+    value = request.query.get(name, None)
+    if value is None or value == "":
+        return None
+
+    try:
+        return conversion(value)
+    except ValueError:
+        raise ValueError("Invalid value of parameter `%s`!" % name)
+
+
+def register_publication(username, metadata, file_obj, size=None):
+    """
+    Store the `file_obj` to cache and register the tracking of the new
+    request.
+
+    Args:
+        username (str): Name of the user.
+        metadata (dict): Metadata from :func:`process_metadata`.
+        file_obj (file): File-like object or stream with the data.
+        size (int, default None): Number of bytes to read from `file_obj`.
+
+    Returns:
+        str: ID of the REST request.
+    """
+    # generate the ID for the REST request
+    rest_id = str(uuid.uuid4())
+    metadata["rest_id"] = rest_id
+
+    # file is streamed to cache in one pass, outside of the transaction
+    tmp_path, bds_id = write_temp_file(
+        file_obj,
+        cache_dir=settings.WEB_CACHE,
+        max_size=settings.WEB_MAX_UPLOAD_SIZE,
+        size=size,
+    )
+
+    # move it to the storage and put it into the cache database at once, so
+    # the ack of the request with the same content can't remove it meanwhile
+    try:
+        in_database(
+            CacheHandler,
+            lambda cache_db: cache_db.add_temp_file(
+                username=username,
+                rest_id=rest_id,
+                metadata=metadata,
+                tmp_path=tmp_path,
+                bds_id=bds_id,
+                cache_dir=settings.WEB_CACHE,
+            )
+        )
+    finally:
+        # the handler may fail before it takes care of the file
+        remove_temp_file(tmp_path)
+
+    # put the tracking request to the StatusHandler
+    def register_tracking(status_db):
+        status_db.register_status_tracking(
+            username=username,
+            rest_id=rest_id
+        )
+        status_db.save_status_update(
+            rest_id=rest_id,
+            book_name=metadata["title"],
+            timestamp=time.time(),
+            message="Ohlaseno pres REST.",
+        )
+
+    in_database(StatusHandler, register_tracking)
+
+    return rest_id
+
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Check the conditional headers of the request.
+
+    Args:
+        etag (str): Quoted ETag of the current representation.
+        last_modified (float, default None): Timestamp of the last change.
+
+    Returns:
+        bool: True if the client already has the current representation.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or "W/" + etag in tags
+
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since and last_modified is not None:
+        since = parse_date(if_modified_since.split(";")[0].strip())
+        return since is not None and int(last_modified) <= since
+
+    return False
+
+
+def cached_response(body, etag, last_modified=None, **headers):
+    """
+    Return `body` with the validators, or empty 304 response, if the client
+    already has it.
+
+    Args:
+        body (str): Data of the response.
+        etag (str): Quoted ETag of the `body`.
+        last_modified (float, default None): Timestamp of the last change.
+        **headers: Other headers of the response.
+
+    Returns:
+        obj: :class:`bottle.HTTPResponse` instance.
+    """
+    headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if is_not_modified(etag, last_modified):
+        return HTTPResponse(status=304, **headers)
+
+    return HTTPResponse(body, **headers)
+
+
+def accepts_gzip():
+    """
+    Check the ``Accept-Encoding`` header of the request.
+
+    Returns:
+        bool: True if the client accepts gzip encoded response.
+    """
+    for coding in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = coding.partition(";")
+        if coding.strip().lower() != "gzip":
+            continue
+
+        params = params.replace(" ", "")
+        if not params.startswith("q="):
+            return True
+
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+
+    return False
+
+
+class StaticJSON(object):
+    """
+    Data structure serialized to JSON only once, with the gzip encoded
+    variant.
+
+    Attributes:
+        body (str): JSON.
+        etag (str): Quoted strong ETag of the :attr:`body`.
+        gzip_body (str): Gzip encoded :attr:`body`.
+        gzip_etag (str): Quoted strong ETag of the :attr:`gzip_body`.
+    """
+    def __init__(self, data):
+        self.body = json.dumps(data)
+        if isinstance(self.body, unicode):
+            self.body = self.body.encode("utf-8")
+
+        checksum = hashlib.sha1(self.body).hexdigest()
+        self.etag = '"%s"' % checksum
+
+        buff = BytesIO()
+        with gzip.GzipFile(fileobj=buff, mode="wb", mtime=0) as gzip_file:
+            gzip_file.write(self.body)
+
+        self.gzip_body = buff.getvalue()
+        self.gzip_etag = '"%s-gzip"' % checksum
+
+    def response(self):
+        """
+        Return the data in encoding accepted by the client.
+
+        Returns:
+            obj: :class:`bottle.HTTPResponse` from :func:`cached_response`.
+        """
+        headers = {
+            "content_type": "application/json; charset=utf-8",
+            "Cache-Control": "public, max-age=%d" % (
+                settings.WEB_STRUCTURES_MAX_AGE
+            ),
+            "Vary": "Accept-Encoding",
+        }
+
+        if not accepts_gzip():
+            return cached_response(self.body, self.etag, **headers)
+
+        headers["Content-Encoding"] = "gzip"
+        return cached_response(self.gzip_body, self.gzip_etag, **headers)
+
+
+def static_structure(name, data):
+    """
+    Serve `data`, which change only with deploy, at
+    ``/api/v1/structures/<name>``.
+
+    Args:
+        name (str): Name of the structure.
+        data (obj): JSON-serializable data.
+
+    Returns:
+        fn: Callback of the route.
+    """
+    document = StaticJSON(data)
+
+    def static_structure_callback():
+        return document.response()
+
+    return get(join(V1_PATH, "structures", name))(static_structure_callback)
+
+
+class RenderedPage(object):
+    """
+    Template with the ``<rst>`` blocks rendered by docutils.
+
+    Rendering is expensive, so the result is kept in memory and the template
+    is rendered again only when its mtime changes.
+
+    Attributes:
+        path (str): Path to the template.
+        mtime (float): Modification time of the rendered template.
+        body (str): Rendered page.
+        etag (str): Quoted ETag of the :attr:`body`.
+    """
+    def __init__(self, path):
+        self.path = path
+
+        self.mtime = None
+        self.body = None
+        self.etag = None
+
+        self._lock = threading.Lock()
+
+    def _render(self):
+        with open(self.path) as f:
+            content = f.read()
+
+        dom = dhtmlparser.parseString(content)
+        for rst in dom.find("rst"):
+            rst_content = publish_parts(rst.getContent(), writer_name='html')
+            rst_content = rst_content['html_body'].encode("utf-8")
+            rst.replaceWith(dhtmlparser.HTMLElement(rst_content))
+
+        body = dom.prettify()
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+
+        return body
+
+    def get(self):
+        """
+        Return the rendered page, render it again if the template was changed.
+
+        Returns:
+            tuple: ``(body, etag, mtime)``.
+        """
+        mtime = os.path.getmtime(self.path)
+
+        with self._lock:
+            if mtime != self.mtime:
+                self.body = self._render()
+                self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()
+                self.mtime = mtime
+
+            return self.body, self.etag, self.mtime
+
+
 def handle_errors(fn):
     def handle_errors_decorator(*args, **kwargs):
         try:
             return fn(*args, **kwargs)
+        except ConflictError as e:
+            # retries in the database handlers didn't help, try again later
+            msg = {"error": str(e)}
+            raise HTTPResponse(json.dumps(msg), 503, Retry_After=1)
+        except UploadTooLargeException as e:
+            raise HTTPResponse(json.dumps({"error": e.message}), 413)
         except Exception as e:
+            # explicit status was set; abort() without status defaults to 500
+            if isinstance(e, HTTPResponse) and e.status_code != 500:
+                raise
+
             msg = {"error": e.message}
             if settings.WEB_DEBUG:
                 msg["traceback"] = traceback.format_exc().strip()
@@ -138,7 +609,223 @@ def handle_errors(fn):
     return handle_errors_decorator
 
 
+class RouteMetricsPlugin(object):
+    """
+    Bottle plugin recording the duration of each route to
+    :attr:`ROUTE_LATENCY`.
+    """
+    name = "route_metrics"
+    api = 2
+
+    def apply(self, callback, route):
+        method = route.method
+        rule = route.rule
+
+        @wraps(callback)
+        def route_metrics_wrapper(*args, **kwargs):
+            if not metrics.is_enabled():
+                return callback(*args, **kwargs)
+
+            start = time.time()
+            status = 500
+            try:
+                result = callback(*args, **kwargs)
+                if isinstance(result, HTTPResponse):
+                    status = result.status_code
+                else:
+                    status = response.status_code
+
+                return result
+            except HTTPResponse as e:
+                status = e.status_code
+                raise
+            finally:
+                ROUTE_LATENCY.observe(
+                    time.time() - start,
+                    method,
+                    rule,
+                    status,
+                )
+
+        return route_metrics_wrapper
+
+
+class ProfilerPlugin(object):
+    """
+    Bottle plugin running the sampled requests under the profiler. See
+    :mod:`.profiler` for details.
+    """
+    name = "profiler"
+    api = 2
+
+    def apply(self, callback, route):
+        name = "%s %s" % (route.method, route.rule)
+
+        @wraps(callback)
+        def profiler_wrapper(*args, **kwargs):
+            with profiler.profiled(name):
+                return callback(*args, **kwargs)
+
+        return profiler_wrapper
+
+
+def numeric_stats(stats_fn):
+    """
+    Convert the numeric values of dict returned by `stats_fn` to values of
+    the :class:`.metrics.Gauge`.
+    """
+    def numeric_stats_callback():
+        return {
+            (key,): value
+            for key, value in stats_fn().items()
+            if isinstance(value, (int, long, float)) and
+            not isinstance(value, bool)
+        }
+
+    return numeric_stats_callback
+
+
+def cache_queue_stats():
+    """
+    Read :meth:`.CacheHandler.queue_stats` just once per scrape of the
+    ``/metrics``, no matter how many gauges use it.
+    """
+    key = "edeposit.cache_queue_stats"
+    if key not in request.environ:
+        request.environ[key] = in_database(
+            CacheHandler,
+            lambda cache_db: cache_db.queue_stats(),
+        )
+
+    return request.environ[key]
+
+
+def cache_queue_size():
+    stats = cache_queue_stats()
+
+    return {
+        ("queued",): stats["queued"],
+        ("claimed",): stats["claimed"],
+    }
+
+
+def cache_oldest_age():
+    return cache_queue_stats()["oldest_age"]
+
+
+metrics.REGISTRY.gauge(
+    "edeposit_rest_cache_queue_size",
+    "Number of the uploads in the cache queue.",
+    cache_queue_size,
+    ["state"],
+)
+metrics.REGISTRY.gauge(
+    "edeposit_rest_cache_oldest_age_seconds",
+    "Age of the oldest upload waiting in the cache queue.",
+    cache_oldest_age,
+)
+metrics.REGISTRY.gauge(
+    "edeposit_rest_db_pool",
+    "Statistics of the pool of the database handlers.",
+    numeric_stats(DB_POOL.stats),
+    ["stat"],
+)
+metrics.REGISTRY.gauge(
+    "edeposit_rest_auth_cache",
+    "Statistics of the cache of the verified logins.",
+    numeric_stats(CREDENTIAL_CACHE.stats),
+    ["stat"],
+)
+
+
 # API definition ==============================================================
+install(RouteMetricsPlugin())
+install(ProfilerPlugin())
+
+
+def version_etag(version):
+    """
+    Convert `version` of the tracking to quoted ETag.
+
+    Args:
+        version (int): Version from the :class:`.StatusHandler`.
+
+    Returns:
+        str: ETag.
+    """
+    return '"v%d"' % version
+
+
+def wait_for_version(username, since, timeout, version):
+    """
+    Wait for the change of the `username`'s trackings using the
+    :class:`.NotificationBroker`.
+
+    Number of the waiting clients is limited by the
+    :attr:`.settings.WEB_MAX_LONG_POLLS` in the threaded mode, so they can't
+    take all the worker threads.
+
+    Raises:
+        HTTPResponse: 503, if there are too many waiting clients.
+
+    Returns:
+        int: Last known version.
+    """
+    if LONG_POLL_SLOTS is not None and not LONG_POLL_SLOTS.acquire(False):
+        msg = {"error": "Too many waiting clients, try it later."}
+        raise HTTPResponse(json.dumps(msg), 503, Retry_After=1)
+
+    try:
+        broker = start_notification_broker(
+            conf_path=settings.ZEO_CLIENT_CONF_FILE,
+            project_key=settings.PROJECT_KEY,
+        )
+        return broker.wait(
+            username,
+            since,
+            timeout,
+            version=version,
+            sleep=cooperative_sleep(),
+        )
+    finally:
+        if LONG_POLL_SLOTS is not None:
+            LONG_POLL_SLOTS.release()
+
+
+@get(join(V1_PATH, "track/poll"))
+@auth_basic(check_auth)
+@handle_errors
+def track_poll():
+    """
+    Long-poll for the changes of user's trackings.
+
+    Query parameters are `since` (version from the previous response) and
+    `timeout` in seconds. The response is returned as soon as the version is
+    higher than `since`, or when the timeout expires.
+    """
+    username = request.environ["username"]
+    since = query_param("since", int)
+    timeout = query_param("timeout", float)
+
+    max_timeout = settings.WEB_LONG_POLL_TIMEOUT
+    if timeout is None or timeout > max_timeout:
+        timeout = max_timeout
+
+    # the database is not used while waiting, so the slot is returned
+    version = in_database(
+        StatusHandler,
+        lambda status_db: status_db.query_user_version(username)
+    )
+
+    if since is not None and version <= since and timeout > 0:
+        version = wait_for_version(username, since, timeout, version)
+
+    return {
+        "version": version,
+        "changed": since is None or version > since,
+    }
+
+
 @get(join(V1_PATH, "track/<rest_id>"))
 @auth_basic(check_auth)
 @handle_errors
@@ -146,25 +833,89 @@ def track_publication(rest_id=None):
     if not rest_id:
         return track_publications()
 
-    status_db = StatusHandler()
-    return status_info_to_dict(
-        status_db.query_status(
-            rest_id=rest_id,
-            username=request.environ["username"],
+    username = request.environ["username"]
+
+    # version is read first, so the ETag is never newer than the data
+    etag = version_etag(
+        in_database(
+            StatusHandler,
+            lambda status_db: status_db.query_status_version(
+                rest_id,
+                username=username
+            )
         )
     )
 
+    if is_not_modified(etag):
+        return HTTPResponse(status=304, ETag=etag)
+
+    def read_status_info(status_db):
+        status_info = status_db.query_status_info(rest_id, username=username)
+        if status_info is None:
+            raise IndexError("There is no status for '%s'." % rest_id)
+
+        return status_info_to_dict(status_info)
+
+    data = in_database(StatusHandler, read_status_info)
+
+    response.set_header("ETag", etag)
+    return data
+
 
 @get(join(V1_PATH, "track"))
 @auth_basic(check_auth)
 @handle_errors
 def track_publications():
-    status_db = StatusHandler()
+    limit = query_param("limit", int)
+    since = query_param("since", float)
+    cursor = query_param("cursor", str)
+    summary = query_param("summary", int)
+    username = request.environ["username"]
 
-    return {
-        status.rest_id: status_info_to_dict(status)
-        for status in status_db.query_statuses(request.environ["username"])
-    }
+    # version of all user's trackings is used for all variants of the query
+    etag = version_etag(
+        in_database(
+            StatusHandler,
+            lambda status_db: status_db.query_user_version(username)
+        )
+    )
+
+    if is_not_modified(etag):
+        return HTTPResponse(status=304, ETag=etag)
+
+    response.set_header("ETag", etag)
+
+    # old format of the response, without pagination
+    if all(param is None for param in [limit, since, cursor, summary]):
+        return in_database(
+            StatusHandler,
+            lambda status_db: {
+                status.rest_id: status_info_to_dict(status)
+                for status in status_db.query_statuses(username)
+            }
+        )
+
+    def read_page(status_db):
+        statuses, next_cursor = status_db.query_statuses_page(
+            username=username,
+            limit=limit,
+            cursor=cursor,
+            since=since,
+        )
+
+        items = []
+        for status in statuses:
+            status_dict = status_info_to_dict(status, summary=bool(summary))
+            status_dict["rest_id"] = status.rest_id
+            status_dict["registered_ts"] = status.registered_ts
+            items.append(status_dict)
+
+        return {
+            "items": items,
+            "next_cursor": next_cursor,
+        }
+
+    return in_database(StatusHandler, read_page)
 
 
 @get(join(V1_PATH, "submit"))  # TODO: remove
@@ -184,67 +935,93 @@ def submit_publication(json_metadata):
     file_key = request.files.keys()[0]
     upload_file = request.files[file_key].file
 
-    # generate the ID for the REST request
-    rest_id = str(uuid.uuid4())
-    metadata["rest_id"] = rest_id
+    return register_publication(username, metadata, upload_file)
 
-    # put it into the cache database
-    cache_db = CacheHandler()
-    cache_db.add(
-        username=username,
-        rest_id=rest_id,
-        metadata=metadata,
-        file_obj=upload_file,
-    )
 
-    # put the tracking request to the StatusHandler
-    status_db = StatusHandler()
-    status_db.register_status_tracking(
-        username=username,
-        rest_id=rest_id
-    )
-    status_db.save_status_update(
-        rest_id=rest_id,
-        book_name=metadata["title"],
-        timestamp=time.time(),
-        message="Ohlaseno pres REST.",
-    )
+@put(join(V1_PATH, "submit"))
+@auth_basic(check_auth)
+@handle_errors
+def submit_publication_stream():
+    """
+    Submit the file sent as raw request body, with the metadata in the
+    `json_metadata` query parameter. The body is streamed directly to the
+    cache.
+    """
+    username = request.environ["username"]
 
-    return rest_id
+    size = request.content_length
+    if size < 0:
+        abort(411, "Hlavička `Content-Length` je povinná!")
+
+    max_size = settings.WEB_MAX_UPLOAD_SIZE
+    if max_size and size > max_size:
+        abort(413, "Soubor je větší než %d bajtů!" % max_size)
 
+    json_metadata = request.query.get("json_metadata", None)
+    if not json_metadata:
+        abort(text="Parametr `json_metadata` je povinný!")
+
+    metadata = process_metadata(json_metadata)
+
+    return register_publication(
+        username,
+        metadata,
+        request.environ["wsgi.input"],
+        size=size,
+    )
 
-@get(join(V1_PATH, "structures", "riv"))
-def riv_structure():
-    return dict(RIV_CATEGORIES)
 
+riv_structure = static_structure("riv", dict(RIV_CATEGORIES))
+library_structure = static_structure("library_map", LIBRARY_MAP)
 
-@get(join(V1_PATH, "structures", "library_map"))
-def library_structure():
-    return LIBRARY_MAP
+
+DESCRIPTION_PAGE = RenderedPage(join(TEMPLATE_PATH, "index.html"))
 
 
 @route("/")
 def description_page():
-    with open(join(TEMPLATE_PATH, "index.html")) as f:
-        content = f.read()
+    body, etag, mtime = DESCRIPTION_PAGE.get()
+
+    return cached_response(
+        body,
+        etag,
+        last_modified=mtime,
+        content_type="text/html; charset=utf-8",
+    )
 
-    dom = dhtmlparser.parseString(content)
-    for rst in dom.find("rst"):
-        rst_content = publish_parts(rst.getContent(), writer_name='html')
-        rst_content = rst_content['html_body'].encode("utf-8")
-        rst.replaceWith(dhtmlparser.HTMLElement(rst_content))
 
-    return dom.prettify()
+@get("/metrics")
+def metrics_page():
+    """
+    Metrics in the Prometheus text format.
+    """
+    if not metrics.is_enabled():
+        abort(404, "Metrics are disabled.")
+
+    return HTTPResponse(
+        metrics.REGISTRY.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
 
 
 # Main program ================================================================
 if __name__ == '__main__':
+    DESCRIPTION_PAGE.get()  # render the page before the first request
+
+    server = settings.WEB_SERVER
+    server_options = {}
+    if server == "paste":
+        server_options["threadpool_workers"] = settings.WEB_THREADS
+    elif COOPERATIVE:
+        server = CooperativeServer
+
     # run the server
     run(
-        server=settings.WEB_SERVER,
+        server=server,
         host=settings.WEB_ADDR,
         port=settings.WEB_PORT,
         debug=settings.WEB_DEBUG,
         reloader=settings.WEB_RELOADER,
         quiet=settings.WEB_BE_QUIET,
+        **server_options
     )
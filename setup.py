@@ -45,6 +45,7 @@ setup(
     scripts=[
         'bin/edeposit_rest_runzeo.py',
         'bin/edeposit_rest_webserver.py',
+        'bin/edeposit_rest_profile_report.py',
     ],
 
     zip_safe=False,
@@ -60,6 +61,9 @@ setup(
         "docs": [
             "sphinx",
             "sphinxcontrib-napoleon",
-        ]
+        ],
+        "gevent": [
+            "gevent",
+        ],
     },
 )
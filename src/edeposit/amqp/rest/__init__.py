@@ -11,13 +11,20 @@ from structures import CacheTick
 from structures import SaveLogin
 from structures import RemoveLogin
 from structures import StatusUpdate
+from structures import UploadReferenceAck
 from structures import UploadRequest
+from structures import UploadRequestChunk
+from structures import UploadRequestReference
 from structures import AfterDBCleanupRequest
 
 import settings
+import metrics as _metrics
+import profiler as _profiler
 from database import UserHandler as _UserHandler
 from database import CacheHandler as _CacheHandler
 from database import StatusHandler as _StatusHandler
+from database import get_handler as _get_handler
+from database import start_pack_scheduler as _start_pack_scheduler
 
 
 # Functions & classes =========================================================
@@ -28,6 +35,113 @@ def _instanceof(instance, cls):
     return type(instance).__name__ == cls.__name__
 
 
+def _handler(handler_cls):
+    """
+    Get `handler_cls` instance from the process-wide handler pool.
+
+    The settings are read on each call, so the reloaded configuration is
+    respected.
+    """
+    return _get_handler(
+        handler_cls,
+        conf_path=settings.ZEO_CLIENT_CONF_FILE,
+        project_key=settings.PROJECT_KEY,
+    )
+
+
+def _to_upload_request(cached_request):
+    """
+    Convert cached :class:`.database.cache_handler.UploadRequest` to
+    :class:`.structures.UploadRequest` structure with base64 encoded data.
+    """
+    cached_file = cached_request.get_file_obj()
+
+    # convert the file to base64 memory-efficient way
+    with tempfile.TemporaryFile() as tmp_file:
+        base64.encode(cached_file, tmp_file)
+
+        tmp_file.seek(0)
+        req = UploadRequest(
+            username=cached_request.username,
+            rest_id=cached_request.rest_id,
+            b64_data=tmp_file.read(),
+            metadata=cached_request.metadata,
+        )
+
+    cached_file.close()
+
+    return req
+
+
+def _to_upload_request_chunks(cached_request, chunk_size):
+    """
+    Generate :class:`.structures.UploadRequestChunk` structures for cached
+    :class:`.database.cache_handler.UploadRequest`.
+
+    Only one chunk of the file is held in the memory at time.
+
+    Args:
+        cached_request (obj): Cached UploadRequest.
+        chunk_size (int): Size of the chunk in bytes (before encoding).
+
+    Yields:
+        obj: :class:`.structures.UploadRequestChunk` instances.
+    """
+    if chunk_size <= 0:
+        raise ValueError("`chunk_size` has to be positive number!")
+
+    total_size = cached_request.get_file_size()
+    checksum = cached_request.get_checksum()
+    chunks = max(1, (total_size + chunk_size - 1) // chunk_size)
+
+    with cached_request.get_file_obj() as cached_file:
+        for seq in xrange(chunks):
+            yield UploadRequestChunk(
+                username=cached_request.username,
+                rest_id=cached_request.rest_id,
+                seq=seq,
+                chunks=chunks,
+                total_size=total_size,
+                checksum=checksum,
+                b64_data=base64.b64encode(cached_file.read(chunk_size)),
+                metadata=cached_request.metadata if seq == 0 else None,
+            )
+
+
+def _to_responses(cached_request, chunk_size=None):
+    """
+    Generate response structures for cached
+    :class:`.database.cache_handler.UploadRequest` - one
+    :class:`.structures.UploadRequest`, or sequence of
+    :class:`.structures.UploadRequestChunk` if `chunk_size` is set.
+    """
+    if not chunk_size:
+        yield _to_upload_request(cached_request)
+        return
+
+    for chunk in _to_upload_request_chunks(cached_request, chunk_size):
+        yield chunk
+
+
+def _to_upload_request_reference(lease):
+    """
+    Convert :class:`.database.cache_handler.Lease` of the cached request to
+    :class:`.structures.UploadRequestReference`.
+    """
+    cached_request = lease.upload_request
+
+    return UploadRequestReference(
+        username=cached_request.username,
+        rest_id=cached_request.rest_id,
+        checksum=cached_request.get_checksum(),
+        size=cached_request.get_file_size(),
+        file_path=str(cached_request.get_file_path()),
+        bds_id=cached_request.bds_id,
+        lease_id=lease.lease_id,
+        metadata=cached_request.metadata,
+    )
+
+
 # Main function ===============================================================
 def reactToAMQPMessage(message, send_back):
     """
@@ -49,57 +163,99 @@ def reactToAMQPMessage(message, send_back):
     Raises:
         ValueError: if bad type of `message` structure is given.
     """
-    user_db = _UserHandler(
-        conf_path=settings.ZEO_CLIENT_CONF_FILE,
-        project_key=settings.PROJECT_KEY,
-    )
-    status_db = _StatusHandler(
-        conf_path=settings.ZEO_CLIENT_CONF_FILE,
-        project_key=settings.PROJECT_KEY,
-    )
-    cache_db = _CacheHandler(
-        conf_path=settings.ZEO_CLIENT_CONF_FILE,
-        project_key=settings.PROJECT_KEY,
-    )
+    message_type = type(message).__name__
+
+    with _profiler.profiled(message_type):
+        if not _metrics.is_enabled():
+            return _dispatch(message, send_back)
+
+        with _metrics.AMQP_LATENCY.time(message_type):
+            return _dispatch(message, send_back)
+
+
+def _dispatch(message, send_back):
+    """
+    Process the `message`. See :func:`reactToAMQPMessage` for details.
+    """
+    if settings.PACK_ENABLED:
+        _start_pack_scheduler(conf_path=settings.ZEO_CLIENT_CONF_FILE)
 
     if _instanceof(message, SaveLogin):
+        user_db = _handler(_UserHandler)
         return user_db.add_user(
             username=message.username,
             pw_hash=message.password_hash,
         )
 
     elif _instanceof(message, RemoveLogin):
+        user_db = _handler(_UserHandler)
+        status_db = _handler(_StatusHandler)
         status_db.remove_user(username=message.username)
         return user_db.remove_user(username=message.username)
 
     elif _instanceof(message, CacheTick):
+        user_db = _handler(_UserHandler)
         if user_db.is_empty():
             return AfterDBCleanupRequest()
 
+        cache_db = _handler(_CacheHandler)
         if cache_db.is_empty():
             return
 
-        # this will pop the RequestInfo from `cache_db` if success
-        with cache_db.pop_manager() as cached_request:
-            cached_file = cached_request.get_file_obj()
+        batch_mode = message.max_items is not None or \
+            message.max_bytes is not None
+
+        # files are removed after the UploadReferenceAck
+        if message.by_reference:
+            leases = cache_db.claim(
+                max_items=message.max_items if batch_mode else 1,
+                max_bytes=message.max_bytes,
+                timeout=settings.CACHE_REFERENCE_TIMEOUT,
+            )
+            references = [
+                _to_upload_request_reference(lease)
+                for lease in leases
+            ]
+
+            if not batch_mode:
+                return references[0] if references else None
+
+            for reference in references:
+                send_back(reference)
+
+            return
+
+        # single request is returned, everything else goes thru `send_back`
+        if not batch_mode and not message.chunk_size:
+            with cache_db.pop_batch_manager(max_items=1) as cached_requests:
+                # everything may be claimed by other consumers
+                if not cached_requests:
+                    return
 
-            # convert the file to base64 memory-efficient way
-            with tempfile.TemporaryFile() as tmp_file:
-                base64.encode(cached_file, tmp_file)
+                req = _to_upload_request(cached_requests[0])
 
-                tmp_file.seek(0)
-                req = UploadRequest(
-                    username=cached_request.username,
-                    rest_id=cached_request.rest_id,
-                    b64_data=tmp_file.read(),
-                    metadata=cached_request.metadata,
-                )
+            return req
 
-            cached_file.close()
+        # drain the batch thru `send_back`, all items are removed at once
+        batch_manager = cache_db.pop_batch_manager(
+            max_items=message.max_items if batch_mode else 1,
+            max_bytes=message.max_bytes,
+        )
+        with batch_manager as cached_requests:
+            for cached_request in cached_requests:
+                for response in _to_responses(cached_request,
+                                              message.chunk_size):
+                    send_back(response)
+
+        return
 
-        return req
+    elif _instanceof(message, UploadReferenceAck):
+        cache_db = _handler(_CacheHandler)
+        cache_db.ack_by_id([(message.rest_id, message.lease_id)])
+        return
 
     elif _instanceof(message, StatusUpdate):
+        status_db = _handler(_StatusHandler)
         status_db.save_status_update(
             rest_id=message.rest_id,
             message=message.message,
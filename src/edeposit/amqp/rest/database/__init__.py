@@ -6,4 +6,19 @@
 # Imports =====================================================================
 from user_handler import UserHandler
 from cache_handler import CacheHandler
+from cache_handler import store_file
+from cache_handler import write_temp_file
+from cache_handler import remove_temp_file
 from status_handler import StatusHandler
+from handler_pool import HandlerPool
+from handler_pool import ThreadHandlerPool
+from handler_pool import get_handler
+from handler_pool import get_handler_pool
+from pack_scheduler import PackScheduler
+from pack_scheduler import notify_garbage
+from pack_scheduler import get_pack_scheduler
+from pack_scheduler import start_pack_scheduler
+from notification_broker import NotificationBroker
+from notification_broker import notify_version
+from notification_broker import get_notification_broker
+from notification_broker import start_notification_broker
@@ -4,30 +4,251 @@
 # Interpreter version: python 2.7
 #
 # Imports =====================================================================
+import os
 import time
+import uuid
+import fcntl
+import tempfile
 from functools import total_ordering
 from contextlib import contextmanager
+from collections import namedtuple
 
 import transaction
+from BTrees.Length import Length
 from persistent import Persistent
 
-from zeo_connector import transaction_manager
 from zeo_connector.examples import DatabaseHandler
 
 from BalancedDiscStorage import BalancedDiscStorage
 
+from .transaction_manager import transaction_manager
+from .pack_scheduler import notify_garbage
 from ..settings import WEB_CACHE
 from ..settings import PROJECT_KEY
 from ..settings import ZEO_CLIENT_CONF_FILE
+from ..settings import CACHE_LEASE_TIMEOUT
+
+
+# Exceptions ==================================================================
+class UploadTooLargeException(ValueError):
+    """
+    Exception raised in case that the uploaded file exceeds the size limit.
+    """
 
 
 # Functions & classes =========================================================
+def _file_mode():
+    """
+    Return mode of the new files respecting the current umask, as used by
+    ``open()``.
+
+    Returns:
+        int: Mode.
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+
+    return 0666 & ~umask
+
+
+def _iter_chunks(file_obj, size=None, chunk_size=2**16):
+    """
+    Read `file_obj` in chunks.
+
+    Args:
+        file_obj (file): File-like object with ``.read()``.
+        size (int, default None): Number of bytes to read. If not set, the
+            `file_obj` is read until the end.
+        chunk_size (int, default 2**16): Size of one read.
+
+    Raises:
+        IOError: If the `file_obj` ends before `size` bytes were read.
+
+    Yields:
+        str: Chunks of data.
+    """
+    remaining = size
+    while remaining is None or remaining > 0:
+        to_read = chunk_size
+        if remaining is not None:
+            to_read = min(chunk_size, remaining)
+
+        chunk = file_obj.read(to_read)
+        if not chunk:
+            if remaining:
+                raise IOError("Incomplete data, %d bytes missing." % remaining)
+
+            return
+
+        if remaining is not None:
+            remaining -= len(chunk)
+
+        yield chunk
+
+
+@contextmanager
+def cache_lock(cache_dir=WEB_CACHE):
+    """
+    Exclusive lock of the files in the `cache_dir`, shared by all threads and
+    processes.
+
+    Files are shared by the requests with the same content, so adding of the
+    request (the file is stored and its reference commited) and removing of
+    the file (when there are no references) has to be serialized.
+    Otherwise, the file may be removed just after the new request started
+    using it.
+
+    Warning:
+        The lock is not reentrant.
+
+    Args:
+        cache_dir (str): Path to the directory for BalancedDiscStorage.
+            Default :attr:`.settings.WEB_CACHE`.
+    """
+    with open(os.path.join(cache_dir, ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_temp_file(file_obj, cache_dir=WEB_CACHE, max_size=None, size=None):
+    """
+    Stream the content of `file_obj` to temporary file in the `cache_dir`
+    and hash it in one pass.
+
+    The file is linked to the storage by :func:`link_to_storage`.
+
+    Args:
+        file_obj (file): File-like object. It is rewinded, if it supports
+            ``.seek()``, so it may also be non-seekable stream.
+        cache_dir (str): Path to the directory for BalancedDiscStorage.
+            Default :attr:`.settings.WEB_CACHE`.
+        max_size (int, default None): Maximal size of the file in bytes.
+        size (int, default None): Number of bytes to read from the
+            `file_obj`. Whole `file_obj` is read if not set.
+
+    Raises:
+        UploadTooLargeException: If the data are bigger than `max_size`.
+        IOError: If the `file_obj` ends before `size` bytes were read.
+
+    Returns:
+        tuple: ``(tmp_path, bds_id)``, where `bds_id` is the hash of the file \
+               in BalancedDiscStorage.
+    """
+    bds = BalancedDiscStorage(cache_dir)
+    hash_builder = bds.hash_builder()
+
+    if hasattr(file_obj, "seek"):
+        try:
+            file_obj.seek(0)
+        except (IOError, OSError):  # sockets and pipes
+            pass
+
+    tmp_file = tempfile.NamedTemporaryFile(
+        dir=cache_dir,
+        prefix=".upload_",
+        delete=False,
+    )
+    try:
+        written = 0
+        with tmp_file:
+            for chunk in _iter_chunks(file_obj, size, bds.read_bs):
+                written += len(chunk)
+                if max_size and written > max_size:
+                    raise UploadTooLargeException(
+                        "File exceeds the size limit (%d bytes)." % max_size
+                    )
+
+                hash_builder.update(chunk)
+                tmp_file.write(chunk)
+
+        # temporary files are created only with 0600
+        os.chmod(tmp_file.name, _file_mode())
+    except Exception:
+        remove_temp_file(tmp_file.name)
+        raise
+
+    return tmp_file.name, "%s_%x" % (hash_builder.hexdigest(), written)
+
+
+def remove_temp_file(tmp_path):
+    """
+    Remove the temporary file from :func:`write_temp_file`, if it exists.
+    """
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+
+
+def link_to_storage(tmp_path, bds_id, cache_dir=WEB_CACHE):
+    """
+    Atomically link the file from :func:`write_temp_file` to its final
+    location in the BalancedDiscStorage. Existing file with the same content
+    is replaced.
+
+    The temporary file is kept, so it can be linked again, if the
+    transaction using the file is retried. Remove it by
+    :func:`remove_temp_file`.
+
+    Warning:
+        Use :func:`cache_lock`, or :meth:`CacheHandler.add_temp_file`, if the
+        file is going to be used by the :class:`UploadRequest`.
+
+    Args:
+        tmp_path (str): Path to the temporary file.
+        bds_id (str): Hash of the file.
+        cache_dir (str): Path to the directory for BalancedDiscStorage.
+            Default :attr:`.settings.WEB_CACHE`.
+
+    Returns:
+        str: `bds_id`.
+    """
+    dir_path = BalancedDiscStorage(cache_dir)._create_dir_path(bds_id)
+
+    link_path = tmp_path + ".link"
+    remove_temp_file(link_path)
+    os.link(tmp_path, link_path)
+    os.rename(link_path, os.path.join(dir_path, bds_id))
+
+    return bds_id
+
+
+def store_file(file_obj, cache_dir=WEB_CACHE, max_size=None, size=None):
+    """
+    Store the content of `file_obj` to BalancedDiscStorage in one pass.
+
+    The data are hashed while they are written to temporary file in the
+    `cache_dir`, which is then atomically renamed to its final location in
+    the storage. The file gets the same permissions as files created by
+    BalancedDiscStorage, so it is readable by consumers of the
+    :class:`.structures.UploadRequestReference`.
+
+    See :func:`write_temp_file` for the description of the arguments.
+
+    Raises:
+        UploadTooLargeException: If the data are bigger than `max_size`.
+        IOError: If the `file_obj` ends before `size` bytes were read.
+
+    Returns:
+        str: Hash of the file in BalancedDiscStorage.
+    """
+    tmp_path, bds_id = write_temp_file(file_obj, cache_dir, max_size, size)
+    try:
+        with cache_lock(cache_dir):
+            return link_to_storage(tmp_path, bds_id, cache_dir)
+    finally:
+        remove_temp_file(tmp_path)
+
+
 @total_ordering
 class UploadRequest(Persistent):
     """
     This object works as container for metadata and file uploaded thru REST.
 
-    Uploaded files are automatically put into BalancedDiscStorage.
+    Uploaded files are automatically put into BalancedDiscStorage, unless
+    they were already stored using :func:`store_file`. Files are addressed by
+    their content, so more requests may share the same file.
 
     Attributes:
         cache_dir (str): Directory for BalancedDiscStorage.
@@ -37,9 +258,14 @@ class UploadRequest(Persistent):
         rest_id (str): ID of the request.
         bds_id (str): Hash of the file in BalancedDiscStorage.
         created (float): Timestamp when the object was created.
+        lease_id (str): ID of the lease, if the object is claimed by consumer.
+        lease_expires (float): Timestamp when the lease expires.
     """
-    def __init__(self, username, rest_id, metadata, file_obj,
-                 cache_dir=WEB_CACHE):
+    lease_id = None
+    lease_expires = None
+
+    def __init__(self, username, rest_id, metadata, file_obj=None,
+                 cache_dir=WEB_CACHE, bds_id=None):
         """
         Constructor.
 
@@ -51,14 +277,22 @@ class UploadRequest(Persistent):
             file_obj (file): Reference to opened file object.
             cache_dir (str): Path to the directory for BalancedDiscStorage.
                 Default :attr:`.settings.WEB_CACHE`.
+            bds_id (str, default None): Hash of the file already stored by
+                :func:`store_file`. Used instead of `file_obj`.
         """
         self.cache_dir = cache_dir
         self.metadata = metadata
         self.username = username
         self.rest_id = rest_id
 
+        if bds_id is None and file_obj is None:
+            raise ValueError("`file_obj` or `bds_id` has to be set!")
+
         # save the file to the BalancedDiscStorage
-        self.bds_id = self._bds().add_file(file_obj).hash
+        if bds_id is None:
+            bds_id = store_file(file_obj, cache_dir)
+
+        self.bds_id = bds_id
 
         self.created = time.time()
 
@@ -83,6 +317,26 @@ class UploadRequest(Persistent):
         """
         return self._bds().file_path_from_hash(self.bds_id)
 
+    def get_file_size(self):
+        """
+        Return size of the file in bytes.
+
+        Returns:
+            int: Size of the file.
+        """
+        return os.path.getsize(self.get_file_path())
+
+    def get_checksum(self):
+        """
+        Return SHA256 hexdigest of the file.
+
+        The hash is taken from the :attr:`bds_id`, so the file is not read.
+
+        Returns:
+            str: Hexdigest.
+        """
+        return self.bds_id.split("_")[0]
+
     @transaction_manager
     def get_file_obj(self):
         """
@@ -98,26 +352,54 @@ class UploadRequest(Persistent):
         Remove the file from BalancedDiscStorage.
 
         Warning:
-            You should do this before you will garbage collect this object,
-            because otherwise you will have a lot of files hanging in your
-            BalancedDiscStorage.
+            The file may be shared with other requests, use
+            :meth:`CacheHandler.remove_file`, which checks the references.
         """
         self._bds().delete_by_hash(self.bds_id)
 
     def __eq__(self, obj):
-        return self.bds_id == obj.bds_id
+        return self.rest_id == obj.rest_id
 
     def __lt__(self, obj):
         return float(self.created).__lt__(obj.created)
 
 
+class Lease(namedtuple("Lease", ["lease_id", "expires", "upload_request"])):
+    """
+    Claim of the :class:`UploadRequest` by one consumer.
+
+    Attributes:
+        lease_id (str): Unique ID of the lease.
+        expires (float): Timestamp when the item is returned back to queue.
+        upload_request (obj): Claimed :class:`UploadRequest`.
+    """
+
+
 class CacheHandler(DatabaseHandler):
     """
     Small queue-like database for the :class:`UploadRequest` objects.
 
+    Files of the requests are deduplicated by their content. Each file is
+    stored only once and removed when the last request using it leaves the
+    queue.
+
     Attributes:
         cache_key (str): Key used to access the ZEO `path`.
-        cache (obj): ZEO tree object.
+        cache (obj): ZEO tree mapping ``rest_id`` to :class:`UploadRequest`.
+        created_index_key (str): Key used to access the :attr:`created_index`.
+        created_index (obj): ZEO tree mapping ``(created, rest_id)`` to
+            :class:`UploadRequest`. Used to access the oldest items without
+            loading the whole queue.
+        lease_index_key (str): Key used to access the :attr:`lease_index`.
+        lease_index (obj): ZEO tree mapping ``(lease_expires, rest_id)`` to
+            claimed :class:`UploadRequest` objects.
+        file_refs_key (str): Key used to access the :attr:`file_refs`.
+        file_refs (obj): ZEO tree mapping ``bds_id`` to number of requests
+            in the queue, which use the file.
+        counters_key (str): Key used to access the :attr:`counters`.
+        counters (obj): ZEO tree with ``"size"`` and ``"claimed"``
+            :class:`BTrees.Length.Length` counters of the queue, so the
+            statistics don't have to count the items.
     """
     def __init__(self, conf_path=ZEO_CLIENT_CONF_FILE,
                  project_key=PROJECT_KEY):
@@ -139,50 +421,464 @@ class CacheHandler(DatabaseHandler):
         self.cache_key = "cache"
         self.cache = self._get_key_or_create(self.cache_key)
 
+        # index for the time ordered access to the queue
+        self.created_index_key = "cache created index"
+        with transaction.manager:
+            index_exists = self.created_index_key in self.zeo
+
+        self.created_index = self._get_key_or_create(self.created_index_key)
+
+        # index for the items claimed by consumers
+        self.lease_index_key = "cache lease index"
+        self.lease_index = self._get_key_or_create(self.lease_index_key)
+
+        # reference counts of the deduplicated files
+        self.file_refs_key = "cache file refcount"
+        with transaction.manager:
+            refs_exist = self.file_refs_key in self.zeo
+
+        self.file_refs = self._get_key_or_create(self.file_refs_key)
+
+        # sizes of the queue
+        self.counters_key = "cache counters"
+        with transaction.manager:
+            counters_exist = self.counters_key in self.zeo
+
+        self.counters = self._get_key_or_create(self.counters_key)
+
+        # migration of databases created before the indexes were introduced
+        if not index_exists or not refs_exist or not counters_exist:
+            self.rebuild_index()
+
+    @staticmethod
+    def _index_key(upload_request):
+        """
+        Return key for the :attr:`created_index`.
+
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+
+        Returns:
+            tuple: ``(created, rest_id)``.
+        """
+        return (float(upload_request.created), upload_request.rest_id)
+
+    @staticmethod
+    def _lease_key(upload_request):
+        """
+        Return key for the :attr:`lease_index`.
+
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+
+        Returns:
+            tuple: ``(lease_expires, rest_id)``.
+        """
+        return (float(upload_request.lease_expires), upload_request.rest_id)
+
+    def _unindex(self, upload_request):
+        """
+        Remove `upload_request` from :attr:`created_index` and
+        :attr:`lease_index`.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+        """
+        self.created_index.pop(self._index_key(upload_request), None)
+
+        if upload_request.lease_expires is None:
+            return
+
+        lease_key = self._lease_key(upload_request)
+        if self.lease_index.pop(lease_key, None) is not None:
+            self.counters["claimed"].change(-1)
+
+    def _return_to_queue(self, upload_request):
+        """
+        Drop the lease of the `upload_request` and put it back to the queue.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+        """
+        self._unindex(upload_request)
+
+        upload_request.lease_id = None
+        upload_request.lease_expires = None
+
+        self.created_index[self._index_key(upload_request)] = upload_request
+
+    def _requeue_expired(self, now):
+        """
+        Return all items with expired lease back to the queue.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            now (float): Current timestamp.
+        """
+        expired = list(self.lease_index.values(max=(now,)))
+
+        for upload_request in expired:
+            self._return_to_queue(upload_request)
+
+    def _iter_oldest(self):
+        """
+        Iterate over the queue from the oldest item.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Returns:
+            iterator: :class:`UploadRequest` objects.
+        """
+        return self.created_index.itervalues()
+
+    def _add_file_ref(self, upload_request):
+        """
+        Increment the reference count of the file of `upload_request`.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+
+        Returns:
+            int: New reference count.
+        """
+        refs = self.file_refs.get(upload_request.bds_id, 0) + 1
+        self.file_refs[upload_request.bds_id] = refs
+
+        return refs
+
+    def _drop_file_ref(self, upload_request):
+        """
+        Decrement the reference count of the file of `upload_request`.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+
+        Returns:
+            bool: True if the file is not used by any other request.
+        """
+        refs = self.file_refs.get(upload_request.bds_id, 0) - 1
+
+        if refs > 0:
+            self.file_refs[upload_request.bds_id] = refs
+            return False
+
+        self.file_refs.pop(upload_request.bds_id, None)
+        return True
+
+    @staticmethod
+    def _file_key(upload_request):
+        """
+        Return plain identification of the file of the `upload_request`,
+        which can be used outside of the transaction.
+
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+
+        Returns:
+            tuple: ``(cache_dir, bds_id)``.
+        """
+        return (upload_request.cache_dir, upload_request.bds_id)
+
+    @contextmanager
+    def _locked_transaction(self, cache_dir):
+        """
+        Run the rest of the current transaction under the :func:`cache_lock`.
+
+        The transaction is started again after the lock is acquired, so it
+        sees everything commited under the lock, and it is commited before
+        the lock is released. Use it inside :func:`.transaction_manager`
+        methods, so the lock is not held during the backoff before the
+        retry after ConflictError.
+
+        Args:
+            cache_dir (str): Path to the directory for BalancedDiscStorage.
+        """
+        with cache_lock(cache_dir):
+            transaction.begin()
+            yield
+            transaction.commit()
+
+    def _remove_unused_files(self, files):
+        """
+        Remove the `files`, which are not used by any request.
+
+        The references are checked again in new transaction under the
+        :func:`cache_lock`, because request with the same content may have
+        been added since the transaction, which dropped the last reference.
+
+        Args:
+            files (list): ``(cache_dir, bds_id)`` tuples from
+                :meth:`_file_key`.
+
+        Returns:
+            int: Number of unused files.
+        """
+        by_dir = {}
+        for cache_dir, bds_id in files:
+            by_dir.setdefault(cache_dir, []).append(bds_id)
+
+        return sum(
+            self._remove_unused_dir_files(cache_dir, bds_ids)
+            for cache_dir, bds_ids in by_dir.items()
+        )
+
+    @transaction_manager
+    def _remove_unused_dir_files(self, cache_dir, bds_ids):
+        """
+        Remove the files `bds_ids` from the `cache_dir`, which are not used
+        by any request. See :meth:`_remove_unused_files`.
+
+        Returns:
+            int: Number of unused files.
+        """
+        bds = BalancedDiscStorage(cache_dir)
+
+        with self._locked_transaction(cache_dir):
+            unused = [
+                bds_id
+                for bds_id in bds_ids
+                if bds_id not in self.file_refs
+            ]
+
+            for bds_id in unused:
+                try:
+                    bds.delete_by_hash(bds_id)
+                except (IOError, OSError):  # already removed
+                    pass
+
+        return len(unused)
+
+    @staticmethod
+    def _notify_garbage_after_commit(count=1):
+        """
+        Report `count` removed objects by :func:`.notify_garbage`, when the
+        current transaction is successfully commited. Aborted and retried
+        transactions are not counted.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            count (int, default 1): Number of removed objects.
+        """
+        def notify(success):
+            if success:
+                notify_garbage(count)
+
+        transaction.get().addAfterCommitHook(notify)
+
+    def _remove_upload_request(self, upload_request):
+        """
+        Remove `upload_request` from the queue and from the index and drop
+        the reference to its file.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+
+        Returns:
+            bool: True if the file is not used by any other request.
+        """
+        self._unindex(upload_request)
+        del self.cache[upload_request.rest_id]
+        self.counters["size"].change(-1)
+
+        return self._drop_file_ref(upload_request)
+
     @transaction_manager
-    def add(self, username, rest_id, metadata, file_obj):
+    def rebuild_index(self):
+        """
+        Build the :attr:`created_index`, :attr:`lease_index`,
+        :attr:`file_refs` and :attr:`counters` from the scratch.
+
+        This is done automatically, when the handler is connected to database
+        without the indexes. Items of the queue stored under their `bds_id`
+        by the older versions are moved under their `rest_id`.
+        """
+        upload_requests = list(self.cache.values())
+
+        self.cache.clear()
+        self.created_index.clear()
+        self.lease_index.clear()
+        self.file_refs.clear()
+
+        for upload_request in upload_requests:
+            self.cache[upload_request.rest_id] = upload_request
+            self._add_file_ref(upload_request)
+
+            if upload_request.lease_expires is not None:
+                key = self._lease_key(upload_request)
+                self.lease_index[key] = upload_request
+            else:
+                key = self._index_key(upload_request)
+                self.created_index[key] = upload_request
+
+        self.counters["size"] = Length(len(self.cache))
+        self.counters["claimed"] = Length(len(self.lease_index))
+
+    def add(self, username, rest_id, metadata, file_obj=None, bds_id=None):
         """
         Create and add new item at the bottom of the queue.
 
+        The `file_obj` is stored before the transaction is started, so the
+        transaction can be retried after ConflictError.
+
         Args:
             username (str): Username which is later used to direct the request
                 to proper user account in Edeposit.
             rest_id (str): ID of the request.
             metadata (dict/obj): Metadata structure.
             file_obj (file): Opened file with data.
+            bds_id (str, default None): Hash of the file already stored by
+                :func:`store_file`. Used instead of `file_obj`.
 
         Returns:
             obj: :class:`UploadRequest` instance.
         """
+        if bds_id is None and file_obj is not None:
+            tmp_path, bds_id = write_temp_file(file_obj)
+
+            return self.add_temp_file(
+                username=username,
+                rest_id=rest_id,
+                metadata=metadata,
+                tmp_path=tmp_path,
+                bds_id=bds_id,
+            )
+
         return self.add_upload_request(
             UploadRequest(
                 username=username,
                 rest_id=rest_id,
                 metadata=metadata,
-                file_obj=file_obj,
+                bds_id=bds_id,
             )
         )
 
-    @transaction_manager
+    def add_temp_file(self, username, rest_id, metadata, tmp_path, bds_id,
+                      cache_dir=WEB_CACHE):
+        """
+        Link the file from :func:`write_temp_file` to the storage and add new
+        item using it at the bottom of the queue.
+
+        Both is done under the :func:`cache_lock`, so the file can't be
+        removed by the acknowledgement of other request with the same
+        content in the meantime.
+
+        Args:
+            username (str): Username which is later used to direct the request
+                to proper user account in Edeposit.
+            rest_id (str): ID of the request.
+            metadata (dict/obj): Metadata structure.
+            tmp_path (str): Path to the temporary file. It is always removed.
+            bds_id (str): Hash of the file.
+            cache_dir (str): Path to the directory for BalancedDiscStorage.
+                Default :attr:`.settings.WEB_CACHE`.
+
+        Returns:
+            obj: :class:`UploadRequest` instance.
+        """
+        upload_request = UploadRequest(
+            username=username,
+            rest_id=rest_id,
+            metadata=metadata,
+            cache_dir=cache_dir,
+            bds_id=bds_id,
+        )
+
+        try:
+            return self._commit_upload_request(upload_request, tmp_path)
+        finally:
+            remove_temp_file(tmp_path)
+
     def add_upload_request(self, upload_request):
         """
         Add new :class:`UploadRequest` at the bottom of the queue.
 
+        Request with the same `rest_id` is replaced. The file is shared with
+        other requests with the same content.
+
         Args:
             upload_request (obj): :class:`UploadRequest` instance.
 
         Raises:
             AssertionError: In case that `upload_request` is not
                 :class:`UploadRequest` instance.
+            IOError: If the file was removed, because the last request using
+                it left the queue in the meantime.
 
         Returns:
             obj: :class:`UploadRequest` instance.
         """
+        return self._commit_upload_request(upload_request)
+
+    @transaction_manager
+    def _commit_upload_request(self, upload_request, tmp_path=None):
+        """
+        Add new :class:`UploadRequest` in its own transaction commited under
+        the :func:`cache_lock`.
+
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+            tmp_path (str, default None): Temporary file from
+                :func:`write_temp_file` linked to the storage under the lock.
+        """
+        with self._locked_transaction(upload_request.cache_dir):
+            if tmp_path:
+                link_to_storage(
+                    tmp_path,
+                    upload_request.bds_id,
+                    upload_request.cache_dir,
+                )
+
+            self._add_upload_request(upload_request)
+
+        return upload_request
+
+    def _add_upload_request(self, upload_request):
+        """
+        Add new :class:`UploadRequest` at the bottom of the queue. See
+        :meth:`add_upload_request` for details.
+
+        Warning:
+            Has to be used inside transaction.
+        """
         error_msg = "`upload_request` parameter have to be instance of "
         error_msg += "UploadRequest!"
         assert isinstance(upload_request, UploadRequest), error_msg
 
-        self.cache[upload_request.bds_id] = upload_request
+        old_request = self.cache.get(upload_request.rest_id, None)
+        if old_request is not None:
+            self._unindex(old_request)
+            self._drop_file_ref(old_request)
+        else:
+            self.counters["size"].change(1)
+
+        # first reference - make sure the file wasn't removed by the ack of
+        # the previous request with the same content
+        if self._add_file_ref(upload_request) == 1:
+            upload_request.get_file_path()
+
+        self.cache[upload_request.rest_id] = upload_request
+        self.created_index[self._index_key(upload_request)] = upload_request
+
         return upload_request
 
     @transaction_manager
@@ -193,47 +889,68 @@ class CacheHandler(DatabaseHandler):
         Returns:
             bool: True if the queue is empty.
         """
-        return len(self.cache.keys()) == 0
+        return self.counters["size"]() == 0
 
     @transaction_manager
     def top(self):
         """
         Get the oldest item from the queue, but leave the item at its position.
 
+        Items claimed by :meth:`claim` are skipped, unless their lease
+        expired.
+
         Raises:
             ValueError: In case that there is no request cached.
 
         Returns:
             obj: :class:`UploadRequest` instance.
         """
-        if not self.cache.keys():
-            raise ValueError("There is no cached upload request.")
+        self._requeue_expired(time.time())
 
-        oldest = min(self.cache.values(), key=lambda x: x.created)
+        for oldest in self._iter_oldest():
+            return oldest
 
-        return oldest
+        raise ValueError("There is no cached upload request.")
 
     @transaction_manager
     def pop(self):
         """
         Remove the oldest item from the queue and return it.
 
+        Items claimed by :meth:`claim` are skipped, unless their lease
+        expired.
+
         Warning:
-            YOU HAVE TO CALL :meth:`UploadRequest.remove_file` IN ORDER TO
-            REMOVE THE FILE FROM DISC!
+            YOU HAVE TO CALL :meth:`remove_file` IN ORDER TO REMOVE THE FILE
+            FROM DISC!
 
         Returns:
             obj: :class:`UploadRequest` instance.
         """
-        if not self.cache.keys():
-            return None
+        self._requeue_expired(time.time())
 
-        oldest = min(self.cache.values(), key=lambda x: x.created)
+        for oldest in self._iter_oldest():
+            self._remove_upload_request(oldest)
+            self._notify_garbage_after_commit()
 
-        del self.cache[oldest.bds_id]
-        self.zeo.pack()
+            return oldest
+
+        return None
+
+    def remove_file(self, upload_request):
+        """
+        Remove the file of the `upload_request` returned by :meth:`pop`, if
+        it is not used by any other request in the queue.
 
-        return oldest
+        Args:
+            upload_request (obj): :class:`UploadRequest` instance.
+
+        Returns:
+            bool: True if the file was removed.
+        """
+        return bool(
+            self._remove_unused_files([self._file_key(upload_request)])
+        )
 
     @contextmanager
     def pop_manager(self):
@@ -249,17 +966,254 @@ class CacheHandler(DatabaseHandler):
         Yeilds:
             obj: :class:`UploadRequest`
         """
-        with transaction.manager:
-            oldest = min(self.cache.values(), key=lambda x: x.created)
+        with self.pop_batch_manager(max_items=1) as batch:
+            if not batch:
+                raise ValueError("There is no cached upload request.")
 
-        yield oldest
+            yield batch[0]
 
-        with transaction.manager:
-            self.cache[oldest.bds_id].remove_file()
-            del self.cache[oldest.bds_id]
+    @transaction_manager
+    def claim(self, max_items=1, max_bytes=None, timeout=CACHE_LEASE_TIMEOUT):
+        """
+        Atomically claim the oldest items from the queue.
+
+        Claimed items are not visible for other consumers until the `timeout`
+        expires, or until they are returned by :meth:`release`. Processed
+        items have to be removed by :meth:`ack`.
+
+        If two consumers claim the same item at the same time, one of them
+        gets ``ConflictError`` when the transaction is commited.
+
+        Args:
+            max_items (int, default 1): Maximal number of items. None for all.
+            max_bytes (int, default None): Maximal sum of file sizes. At least
+                one item is always claimed, if the queue is not empty.
+            timeout (float): Visibility timeout in seconds. Default
+                :attr:`.settings.CACHE_LEASE_TIMEOUT`.
+
+        Returns:
+            list: :class:`Lease` objects sorted from the oldest item.
+        """
+        now = time.time()
+        self._requeue_expired(now)
+
+        batch = []
+        batch_size = 0
+        for upload_request in self._iter_oldest():
+            if max_items is not None and len(batch) >= max_items:
+                break
+
+            if max_bytes is not None:
+                batch_size += upload_request.get_file_size()
+
+                if batch and batch_size > max_bytes:
+                    break
+
+            batch.append(upload_request)
+
+        leases = []
+        for upload_request in batch:
+            self._unindex(upload_request)
+
+            upload_request.lease_id = str(uuid.uuid4())
+            upload_request.lease_expires = now + timeout
+            self.lease_index[self._lease_key(upload_request)] = upload_request
+            self.counters["claimed"].change(1)
+
+            leases.append(
+                Lease(
+                    lease_id=upload_request.lease_id,
+                    expires=upload_request.lease_expires,
+                    upload_request=upload_request,
+                )
+            )
+
+        return leases
+
+    def _leased_request(self, rest_id, lease_id):
+        """
+        Return the :class:`UploadRequest` for `rest_id`, if the lease
+        `lease_id` is still valid.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            rest_id (str): :attr:`UploadRequest.rest_id`.
+            lease_id (str): :attr:`Lease.lease_id`.
+
+        Returns:
+            obj: :class:`UploadRequest` or None if the lease was lost.
+        """
+        upload_request = self.cache.get(rest_id, None)
+
+        if upload_request is None or upload_request.lease_id != lease_id:
+            return None
+
+        return upload_request
+
+    def ack(self, leases):
+        """
+        Remove claimed items from the queue. Files, which are not used by
+        other requests are removed, after the transaction is commited.
+
+        Items with lost lease (expired and claimed by other consumer) are
+        skipped.
+
+        Args:
+            leases (list): :class:`Lease` objects from :meth:`claim`.
+
+        Returns:
+            int: Number of removed items.
+        """
+        return self.ack_by_id([
+            (lease.upload_request.rest_id, lease.lease_id)
+            for lease in leases
+        ])
+
+    def ack_by_id(self, ids):
+        """
+        Same as :meth:`ack`, but the claimed items are identified only by
+        their IDs. This is used, when the acknowledgement is received in other
+        process, than the claim was made.
+
+        Args:
+            ids (list): List of ``(rest_id, lease_id)`` tuples.
+
+        Returns:
+            int: Number of removed items.
+        """
+        removed, files = self._ack_by_id(ids)
+        self._remove_unused_files(files)
+
+        return removed
+
+    @transaction_manager
+    def _ack_by_id(self, ids):
+        """
+        Remove the claimed items. See :meth:`ack_by_id`.
+
+        Returns:
+            tuple: ``(removed, files)``, where `files` are the \
+                   :meth:`_file_key` of the files without references.
+        """
+        removed = 0
+        files = []
+        for rest_id, lease_id in ids:
+            upload_request = self._leased_request(rest_id, lease_id)
+            if upload_request is None:
+                continue
+
+            if self._remove_upload_request(upload_request):
+                files.append(self._file_key(upload_request))
+
+            removed += 1
+
+        self._notify_garbage_after_commit(removed)
+
+        return removed, files
+
+    @transaction_manager
+    def release(self, leases):
+        """
+        Return claimed items back to the queue.
+
+        Items with lost lease are skipped, as they already belong to other
+        consumer.
+
+        Args:
+            leases (list): :class:`Lease` objects from :meth:`claim`.
+
+        Returns:
+            int: Number of returned items.
+        """
+        returned = 0
+        for lease in leases:
+            upload_request = self._leased_request(
+                lease.upload_request.rest_id,
+                lease.lease_id
+            )
+            if upload_request is None:
+                continue
+
+            self._return_to_queue(upload_request)
+            returned += 1
+
+        return returned
+
+    @contextmanager
+    def pop_batch_manager(self, max_items=None, max_bytes=None,
+                          timeout=CACHE_LEASE_TIMEOUT):
+        """
+        Context manager which claims the oldest items in the queue, yields
+        them and then removes all of them (and their files) in one
+        transaction. Files are removed only if they are not used by other
+        requests in the queue.
+
+        If there is an exception inside the ``with`` block, the items are
+        returned back to the queue.
+
+        The database is not packed here, see :mod:`.pack_scheduler`.
+
+        Example::
+
+            with cache_db.pop_batch_manager(max_items=10) as upload_requests:
+                for upload_request in upload_requests:
+                    # do something
+
+        Args:
+            max_items (int, default None): Maximal number of items. If not set,
+                whole queue is used.
+            max_bytes (int, default None): Maximal sum of file sizes. At least
+                one item is always yielded, if the queue is not empty.
+            timeout (float): Lease timeout, see :meth:`claim`.
+
+        Yields:
+            list: :class:`UploadRequest` objects sorted from the oldest.
+        """
+        leases = self.claim(
+            max_items=max_items,
+            max_bytes=max_bytes,
+            timeout=timeout,
+        )
+
+        try:
+            yield [lease.upload_request for lease in leases]
+        except Exception:
+            self.release(leases)
+            raise
+
+        if leases:
+            self.ack(leases)
+
+    @transaction_manager
+    def queue_stats(self):
+        """
+        Return the size of the queue and the age of the oldest item waiting
+        in the queue.
+
+        Only the :attr:`counters` and the first key of the
+        :attr:`created_index` are read, so it is cheap enough to be called by
+        each scrape of the metrics.
+
+        Returns:
+            dict: ``{"queued": int, "claimed": int, "oldest_age": float}``, \
+                  `oldest_age` is None, if no item is waiting.
+        """
+        oldest = None
+        for created, _ in self.created_index.keys():
+            oldest = created
+            break
+
+        size = self.counters["size"]()
+        claimed = self.counters["claimed"]()
 
-        self.zeo.pack()
+        return {
+            "queued": size - claimed,
+            "claimed": claimed,
+            "oldest_age": time.time() - oldest if oldest is not None else None,
+        }
 
     @transaction_manager
     def __len__(self):
-        return len(self.cache)
+        return self.counters["size"]()
@@ -0,0 +1,315 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Pool of long-lived database handlers.
+
+Each handler opens its own ZEO connection and reads its root keys in the
+constructor, which is expensive to do for every AMQP message or HTTP request.
+The pool creates the handlers lazily and keeps them for the whole lifetime of
+the process.
+
+ZODB connections are bound to the thread, which opened them, so the threaded
+webserver uses :class:`ThreadHandlerPool`, which keeps separate
+:class:`HandlerPool` for each worker thread. Worker threads of the webserver
+are not accessible before the server is started, so the handlers can't be
+opened in advance. The first request served by each thread opens them.
+"""
+# Imports =====================================================================
+import time
+import threading
+from contextlib import contextmanager
+
+from ZODB.POSException import POSError
+
+from ..settings import PROJECT_KEY
+from ..settings import ZEO_CLIENT_CONF_FILE
+
+
+# Functions & classes =========================================================
+def _is_connected(handler):
+    """
+    Check whether the ZEO connection of the `handler` is still usable.
+
+    Args:
+        handler (obj): Instance of the database handler.
+
+    Returns:
+        bool: True if the connection is open and the storage is connected.
+    """
+    connection = getattr(handler.zeo, "_connection", None)
+
+    if connection is None or getattr(connection, "opened", None) is None:
+        return False
+
+    is_connected = getattr(connection.db().storage, "is_connected", None)
+    if is_connected is None:
+        return True
+
+    return bool(is_connected())
+
+
+def _close(handler):
+    """
+    Close the database used by the `handler`.
+
+    Closing the whole database is used instead of closing the connection,
+    because the connection would be automatically reopened by ZEO connector.
+
+    Args:
+        handler (obj): Instance of the database handler.
+    """
+    try:
+        handler.zeo._connection.db().close()
+    except Exception:
+        pass
+
+
+class HandlerPool(object):
+    """
+    Process-wide pool of database handlers keyed by ``(conf_path,
+    project_key)``.
+
+    Attributes:
+        hits (int): How many times was existing handler reused.
+        misses (int): How many times was new handler created.
+        reconnects (int): How many handlers were replaced, because their
+            connection to the ZEO server was lost.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+
+        self._handlers = {}
+        self._lock = threading.Lock()
+
+    def get(self, handler_cls, conf_path=ZEO_CLIENT_CONF_FILE,
+            project_key=PROJECT_KEY):
+        """
+        Return instance of `handler_cls` connected to given database. The
+        instance is created only if there is no usable one in the pool.
+
+        Args:
+            handler_cls (class): :class:`.UserHandler`, :class:`.CacheHandler`
+                or :class:`.StatusHandler` class.
+            conf_path (str): Path to the file with ZEO client configuration.
+                Default :attr:`.ZEO_CLIENT_CONF_FILE`.
+            project_key (str): Key used to access the ZEO `root`. Default
+                :attr:`.PROJECT_KEY`.
+
+        Returns:
+            obj: Instance of the `handler_cls`.
+        """
+        key = (conf_path, project_key)
+
+        with self._lock:
+            handlers = self._handlers.setdefault(key, {})
+            handler = handlers.get(handler_cls)
+
+            if handler is not None and _is_connected(handler):
+                self.hits += 1
+                return handler
+
+            if handler is not None:
+                _close(handler)
+                self.reconnects += 1
+
+            self.misses += 1
+            handler = handler_cls(
+                conf_path=conf_path,
+                project_key=project_key,
+            )
+            handlers[handler_cls] = handler
+
+            return handler
+
+    def discard(self, conf_path=ZEO_CLIENT_CONF_FILE, project_key=PROJECT_KEY):
+        """
+        Forget all handlers for given database, so they are created again on
+        next :meth:`get`.
+
+        Args:
+            conf_path (str): Path to the file with ZEO client configuration.
+            project_key (str): Key used to access the ZEO `root`.
+        """
+        with self._lock:
+            handlers = self._handlers.pop((conf_path, project_key), {})
+
+        for handler in handlers.values():
+            _close(handler)
+
+    def clear(self):
+        """
+        Close and forget all handlers and reset the counters.
+        """
+        with self._lock:
+            for handlers in self._handlers.values():
+                for handler in handlers.values():
+                    _close(handler)
+
+            self._handlers.clear()
+
+            self.hits = 0
+            self.misses = 0
+            self.reconnects = 0
+
+    def stats(self):
+        """
+        Return the counters.
+
+        Returns:
+            dict: ``{"hits": int, "misses": int, "reconnects": int, \
+                  "handlers": int}``.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reconnects": self.reconnects,
+                "handlers": sum(len(x) for x in self._handlers.values()),
+            }
+
+
+class ThreadHandlerPool(object):
+    """
+    Pool of :class:`HandlerPool` objects, one for each thread.
+
+    Number of threads using the database at the same time is limited by
+    `size`. Handlers of the thread are recycled after `max_requests`
+    checkouts, or when there was a database error during the checkout.
+
+    Attributes:
+        size (int): How many threads may use the database concurrently.
+        max_requests (int): Recycle handlers after this many checkouts.
+            0 = never.
+        checkouts (int): Number of checkouts.
+        recycled (int): How many times were the handlers recycled.
+        wait_total (float): Sum of the time spent waiting for free slot.
+        wait_max (float): Longest wait for the free slot.
+    """
+    def __init__(self, size, max_requests=0):
+        """
+        Constructor.
+
+        Args:
+            size (int): See :attr:`size`.
+            max_requests (int, default 0): See :attr:`max_requests`.
+        """
+        self.size = size
+        self.max_requests = max_requests
+
+        self.checkouts = 0
+        self.recycled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _thread_pool(self):
+        """
+        Return :class:`HandlerPool` of the current thread.
+        """
+        pool = getattr(self._local, "pool", None)
+
+        if pool is None:
+            pool = HandlerPool()
+            self._local.pool = pool
+            self._local.uses = 0
+
+        return pool
+
+    def _recycle(self):
+        """
+        Close handlers of the current thread.
+        """
+        self._thread_pool().clear()
+        self._local.uses = 0
+
+        with self._lock:
+            self.recycled += 1
+
+    @contextmanager
+    def checkout(self):
+        """
+        Wait for free slot and yield :class:`HandlerPool` of current thread.
+
+        Example::
+
+            with pool.checkout() as handlers:
+                status_db = handlers.get(StatusHandler)
+
+        Yields:
+            obj: :class:`HandlerPool` instance.
+        """
+        start = time.time()
+        self._slots.acquire()
+        wait = time.time() - start
+
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+        try:
+            pool = self._thread_pool()
+            self._local.uses += 1
+
+            try:
+                yield pool
+            except POSError:
+                self._recycle()
+                raise
+
+            if self.max_requests and self._local.uses >= self.max_requests:
+                self._recycle()
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        """
+        Return the counters.
+
+        Returns:
+            dict: ``{"size": int, "checkouts": int, "recycled": int, \
+                  "wait_total": float, "wait_max": float}``.
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "checkouts": self.checkouts,
+                "recycled": self.recycled,
+                "wait_total": self.wait_total,
+                "wait_max": self.wait_max,
+            }
+
+
+_POOL = HandlerPool()
+
+
+def get_handler(handler_cls, conf_path=ZEO_CLIENT_CONF_FILE,
+                project_key=PROJECT_KEY):
+    """
+    Return handler from the process-wide :class:`HandlerPool`.
+
+    See :meth:`HandlerPool.get` for details.
+    """
+    return _POOL.get(
+        handler_cls,
+        conf_path=conf_path,
+        project_key=project_key,
+    )
+
+
+def get_handler_pool():
+    """
+    Return the process-wide :class:`HandlerPool` instance.
+
+    Returns:
+        obj: :class:`HandlerPool`.
+    """
+    return _POOL
@@ -0,0 +1,276 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Notifications about the changes of the user's trackings.
+
+Status updates are saved by the AMQP process, but the clients are waiting in
+the webserver processes. The :class:`NotificationBroker` thread watches the
+version counters of the users (see :meth:`.StatusHandler.query_user_version`)
+with its own ZEO connection and wakes up the waiting clients. Only the
+counters of the users with waiting clients are read, all of them in one
+transaction per check, and they are served from the ZEO client cache, until
+the ZEO server invalidates them.
+
+Changes commited in the same process are announced immediately by
+:func:`notify_version`.
+"""
+# Imports =====================================================================
+import time
+import threading
+
+from .. import settings
+
+
+# Functions & classes =========================================================
+class NotificationBroker(threading.Thread):
+    """
+    Daemon thread, which wakes up clients waiting for the change of the user's
+    trackings.
+
+    Attributes:
+        conf_path (str): Path to the file with ZEO client configuration.
+        project_key (str): Key used to access the ZEO `root`.
+        poll_interval (float): How often check the versions in the database.
+        checks (int): Number of checks of the database.
+        last_error (str): Error from the last failed check, or None.
+    """
+    def __init__(self, conf_path, project_key=settings.PROJECT_KEY,
+                 poll_interval=settings.WEB_NOTIFY_POLL_INTERVAL):
+        """
+        Constructor.
+
+        Args:
+            conf_path (str): See :attr:`conf_path`.
+            project_key (str): See :attr:`project_key`. Default
+                :attr:`.settings.PROJECT_KEY`.
+            poll_interval (float): See :attr:`poll_interval`. Default
+                :attr:`.settings.WEB_NOTIFY_POLL_INTERVAL`.
+        """
+        super(NotificationBroker, self).__init__(name="NotificationBroker")
+        self.daemon = True
+
+        self.conf_path = conf_path
+        self.project_key = project_key
+        self.poll_interval = poll_interval
+
+        self.checks = 0
+        self.last_error = None
+
+        self._handler = None
+        self._versions = {}  # username -> last known version
+        self._waiters = {}  # username -> number of waiting clients
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def _status_handler(self):
+        """
+        Return :class:`.StatusHandler` of this thread.
+        """
+        if self._handler is None:
+            # imported here, because status_handler imports this module
+            from .status_handler import StatusHandler
+
+            self._handler = StatusHandler(
+                conf_path=self.conf_path,
+                project_key=self.project_key,
+            )
+
+        return self._handler
+
+    def _drop_handler(self):
+        """
+        Close the connection of the handler, new one is created on the next
+        check.
+        """
+        try:
+            self._handler.zeo._connection.db().close()
+        except Exception:
+            pass
+
+        self._handler = None
+
+    def notify(self, username, version):
+        """
+        Announce new `version` of the trackings of the `username`.
+
+        Only users with waiting clients are remembered.
+
+        Args:
+            username (str): Name of the user.
+            version (int): New version.
+        """
+        with self._condition:
+            if username not in self._waiters:
+                return
+
+            if version > self._versions.get(username, 0):
+                self._versions[username] = version
+                self._condition.notify_all()
+
+    def wait(self, username, since, timeout, version=0, sleep=None):
+        """
+        Wait until the version of the `username`'s trackings is higher than
+        `since`, or the `timeout` expires.
+
+        Args:
+            username (str): Name of the user.
+            since (int): Version already known to the client.
+            timeout (float): Maximal time of the wait in seconds. The wait
+                may be longer by up to :attr:`poll_interval`.
+            version (int, default 0): Current version, if the caller knows it.
+            sleep (fn, default None): Cooperative sleep function (for example
+                ``gevent.sleep``). If set, the version is checked each
+                :attr:`poll_interval` instead of blocking on the condition.
+
+        Returns:
+            int: Last known version.
+        """
+        deadline = time.time() + timeout
+
+        with self._condition:
+            self._waiters[username] = self._waiters.get(username, 0) + 1
+            self._versions[username] = max(
+                version,
+                self._versions.get(username, 0)
+            )
+
+            try:
+                while self._versions[username] <= since:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+
+                    if sleep is not None:
+                        self._condition.release()
+                        try:
+                            sleep(min(self.poll_interval, remaining))
+                        finally:
+                            self._condition.acquire()
+
+                    # untimed wait doesn't poll, the waiters are woken up at
+                    # least once per `poll_interval` by the thread
+                    elif self.is_alive():
+                        self._condition.wait()
+                    else:
+                        self._condition.wait(remaining)
+
+                return self._versions[username]
+            finally:
+                self._waiters[username] -= 1
+
+                if not self._waiters[username]:
+                    del self._waiters[username]
+                    del self._versions[username]
+
+    def check(self):
+        """
+        Read the versions of the users with waiting clients from the database
+        in one transaction and wake up all waiting clients.
+        """
+        with self._condition:
+            usernames = list(self._waiters.keys())
+
+        try:
+            if usernames:
+                status_db = self._status_handler()
+                versions = status_db.query_user_versions(usernames)
+
+                for username, version in versions.items():
+                    self.notify(username, version)
+
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            self._drop_handler()
+        finally:
+            self.checks += 1
+
+            # let the waiters check their timeouts
+            with self._condition:
+                self._condition.notify_all()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.check()
+            self._stop_event.wait(self.poll_interval)
+
+    def stop(self):
+        """
+        Stop the thread after current check.
+        """
+        self._stop_event.set()
+
+    def stats(self):
+        """
+        Return the statistics of the broker.
+
+        Returns:
+            dict: ``{"users": int, "waiters": int, "checks": int, \
+                  "last_error": str}``.
+        """
+        with self._condition:
+            return {
+                "users": len(self._waiters),
+                "waiters": sum(self._waiters.values()),
+                "checks": self.checks,
+                "last_error": self.last_error,
+            }
+
+
+_BROKER = None
+_BROKER_LOCK = threading.Lock()
+
+
+def start_notification_broker(conf_path=settings.ZEO_CLIENT_CONF_FILE,
+                              project_key=settings.PROJECT_KEY):
+    """
+    Start the process-wide :class:`NotificationBroker`, if not already
+    running.
+
+    Args:
+        conf_path (str): Path to the file with ZEO client configuration.
+            Default :attr:`.settings.ZEO_CLIENT_CONF_FILE`.
+        project_key (str): Key used to access the ZEO `root`. Default
+            :attr:`.settings.PROJECT_KEY`.
+
+    Returns:
+        obj: :class:`NotificationBroker` instance.
+    """
+    global _BROKER
+
+    with _BROKER_LOCK:
+        if _BROKER is None or not _BROKER.is_alive():
+            _BROKER = NotificationBroker(
+                conf_path=conf_path,
+                project_key=project_key,
+                poll_interval=settings.WEB_NOTIFY_POLL_INTERVAL,
+            )
+            _BROKER.start()
+
+        return _BROKER
+
+
+def get_notification_broker():
+    """
+    Return the process-wide :class:`NotificationBroker`.
+
+    Returns:
+        obj: :class:`NotificationBroker` instance or None if not started.
+    """
+    return _BROKER
+
+
+def notify_version(username, version):
+    """
+    Announce new `version` of the `username`'s trackings to the process-wide
+    broker. Nothing happens, if the broker is not running.
+
+    Args:
+        username (str): Name of the user.
+        version (int): New version.
+    """
+    if _BROKER is not None:
+        _BROKER.notify(username, version)
@@ -0,0 +1,300 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Background packing of the ZEO database.
+
+Packing rewrites the whole storage, so it is not done by the handlers after
+each removal. Handlers just report how many objects they removed using
+:func:`notify_garbage` and the :class:`PackScheduler` thread decides when to
+pack, according to the policies from :mod:`.settings`.
+
+The scheduler is started by the AMQP reactor (:func:`.reactToAMQPMessage`),
+which does all the removals, but only if :attr:`.settings.PACK_ENABLED` is
+set. Packing rewrites the whole shared storage, so enable it in just one of
+the reactor processes. Garbage reported in the processes without the
+scheduler (the webserver, other consumers) is only counted there.
+"""
+# Imports =====================================================================
+import time
+import threading
+
+from ZODB import DB
+from ZODB.config import storageFromFile
+
+from .. import settings
+
+
+# Functions & classes =========================================================
+def _parse_quiet_hours(quiet_hours):
+    """
+    Parse the `quiet_hours` string.
+
+    Args:
+        quiet_hours (str): String in format ``"from-to"``, for example
+            ``"22-4"``. Blank string means no restriction.
+
+    Raises:
+        ValueError: If the format is wrong, or if the interval is empty.
+
+    Returns:
+        tuple: ``(from, to)`` integers, or None for blank `quiet_hours`.
+    """
+    if not quiet_hours or not quiet_hours.strip():
+        return None
+
+    try:
+        start, end = (int(hour) for hour in quiet_hours.split("-"))
+    except ValueError:
+        raise ValueError(
+            "Quiet hours have to be in format `from-to`, not %r!" % quiet_hours
+        )
+
+    if not (0 <= start <= 23 and 0 <= end <= 23):
+        raise ValueError("Quiet hours have to be in range 0-23!")
+
+    # `to` is exclusive, so the database would be never packed
+    if start == end:
+        raise ValueError(
+            "Quiet hours `%s` are empty, use blank string for no restriction!"
+            % quiet_hours
+        )
+
+    return start, end
+
+
+def _in_quiet_hours(hour, quiet_hours):
+    """
+    Is the `hour` inside `quiet_hours`?
+
+    Args:
+        hour (int): Hour of the day.
+        quiet_hours (tuple): ``(from, to)`` from :func:`_parse_quiet_hours`.
+            ``to`` is exclusive, the interval may wrap around midnight.
+
+    Returns:
+        bool: True if it is, or if there are no `quiet_hours`.
+    """
+    if quiet_hours is None:
+        return True
+
+    start, end = quiet_hours
+    if start <= end:
+        return start <= hour < end
+
+    return hour >= start or hour < end
+
+
+class PackScheduler(threading.Thread):
+    """
+    Daemon thread, which packs the database, when one of the policies says
+    so.
+
+    Attributes:
+        conf_path (str): Path to the file with ZEO client configuration.
+        interval (int): Pack at least each `interval` seconds, if there is
+            any garbage. 0 = disabled.
+        garbage_threshold (int): Pack, when this many objects were removed
+            since the last pack. 0 = disabled.
+        quiet_hours (tuple): ``(from, to)`` hours, when the packing is allowed.
+        check_period (float): How often check the policies.
+        pending_garbage (int): Number of objects removed since the last pack.
+        last_run (float): Timestamp of the last pack, or None.
+        last_duration (float): How long the last pack took in seconds.
+        last_error (str): Error from the last failed pack, or None.
+        runs (int): How many times was the database packed.
+    """
+    def __init__(self, conf_path, interval=settings.PACK_INTERVAL,
+                 garbage_threshold=settings.PACK_GARBAGE_THRESHOLD,
+                 quiet_hours=settings.PACK_QUIET_HOURS,
+                 check_period=settings.PACK_CHECK_PERIOD):
+        """
+        Constructor.
+
+        Args:
+            conf_path (str): See :attr:`conf_path`.
+            interval (int): See :attr:`interval`.
+                Default :attr:`.settings.PACK_INTERVAL`.
+            garbage_threshold (int): See :attr:`garbage_threshold`.
+                Default :attr:`.settings.PACK_GARBAGE_THRESHOLD`.
+            quiet_hours (str): ``"from-to"`` string. Default
+                :attr:`.settings.PACK_QUIET_HOURS`.
+            check_period (float): See :attr:`check_period`. Default
+                :attr:`.settings.PACK_CHECK_PERIOD`.
+        """
+        super(PackScheduler, self).__init__(name="PackScheduler")
+        self.daemon = True
+
+        self.conf_path = conf_path
+        self.interval = interval
+        self.garbage_threshold = garbage_threshold
+        self.quiet_hours = _parse_quiet_hours(quiet_hours)
+        self.check_period = check_period
+
+        self.pending_garbage = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+        self.runs = 0
+
+        self._created = time.time()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def add_garbage(self, count=1):
+        """
+        Report `count` of removed objects.
+
+        Args:
+            count (int, default 1): Number of removed objects.
+        """
+        with self._lock:
+            self.pending_garbage += count
+
+    def should_pack(self, now=None):
+        """
+        Decide whether to pack now.
+
+        Args:
+            now (float, default None): Timestamp. Current time if not set.
+
+        Returns:
+            bool: True if the database should be packed.
+        """
+        now = time.time() if now is None else now
+
+        if not _in_quiet_hours(time.localtime(now).tm_hour, self.quiet_hours):
+            return False
+
+        if self.garbage_threshold and \
+           self.pending_garbage >= self.garbage_threshold:
+            return True
+
+        # there is nothing to pack
+        if not self.pending_garbage:
+            return False
+
+        last_run = self.last_run if self.last_run is not None else \
+            self._created
+
+        return bool(self.interval) and now - last_run >= self.interval
+
+    def pack(self):
+        """
+        Pack the database and update the statistics.
+        """
+        with self._lock:
+            garbage = self.pending_garbage
+            self.pending_garbage = 0
+
+        start = time.time()
+        try:
+            with open(self.conf_path) as conf_file:
+                db = DB(storageFromFile(conf_file))
+
+            try:
+                db.pack()
+            finally:
+                db.close()
+
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            self.add_garbage(garbage)
+        finally:
+            self.last_run = time.time()
+            self.last_duration = self.last_run - start
+            self.runs += 1
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self.should_pack():
+                self.pack()
+
+            self._stop_event.wait(self.check_period)
+
+    def stop(self):
+        """
+        Stop the thread after current check.
+        """
+        self._stop_event.set()
+
+    def stats(self):
+        """
+        Return the statistics of the packing.
+
+        Returns:
+            dict: ``{"pending_garbage": int, "last_run": float, \
+                  "last_duration": float, "last_error": str, "runs": int}``.
+        """
+        return {
+            "pending_garbage": self.pending_garbage,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "runs": self.runs,
+        }
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+_PENDING_GARBAGE = [0]  # garbage reported before the scheduler was started
+
+
+def start_pack_scheduler(conf_path=settings.ZEO_CLIENT_CONF_FILE):
+    """
+    Start the process-wide :class:`PackScheduler`, if not already running.
+
+    Args:
+        conf_path (str): Path to the file with ZEO client configuration.
+            Default :attr:`.settings.ZEO_CLIENT_CONF_FILE`.
+
+    Returns:
+        obj: :class:`PackScheduler` instance.
+    """
+    global _SCHEDULER
+
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None or not _SCHEDULER.is_alive():
+            _SCHEDULER = PackScheduler(
+                conf_path=conf_path,
+                interval=settings.PACK_INTERVAL,
+                garbage_threshold=settings.PACK_GARBAGE_THRESHOLD,
+                quiet_hours=settings.PACK_QUIET_HOURS,
+                check_period=settings.PACK_CHECK_PERIOD,
+            )
+            _SCHEDULER.add_garbage(_PENDING_GARBAGE[0])
+            _PENDING_GARBAGE[0] = 0
+            _SCHEDULER.start()
+
+        return _SCHEDULER
+
+
+def get_pack_scheduler():
+    """
+    Return the process-wide :class:`PackScheduler`.
+
+    Returns:
+        obj: :class:`PackScheduler` instance or None if not started.
+    """
+    return _SCHEDULER
+
+
+def notify_garbage(count=1):
+    """
+    Report `count` removed objects to the process-wide scheduler.
+
+    If the scheduler is not running in this process, the `count` is kept
+    until it is started by :func:`start_pack_scheduler`.
+
+    Args:
+        count (int, default 1): Number of removed objects.
+    """
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _PENDING_GARBAGE[0] += count
+            return
+
+    _SCHEDULER.add_garbage(count)
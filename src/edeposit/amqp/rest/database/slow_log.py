@@ -0,0 +1,143 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Log of the slow calls of the database handlers.
+
+Each call of the method decorated by :func:`.transaction_manager` is timed
+and the ZODB objects it loaded and stored are counted. Calls slower than
+:attr:`.settings.SLOW_OPERATION_TIME`, or loading more objects than
+:attr:`.settings.SLOW_OPERATION_LOADS` are logged as one JSON line::
+
+    slow_operation {"handler": "StatusHandler", "method": "query_statuses",
+    "duration": 1.52, "loads": 48211, "stores": 0, "conflicts": 0, ..}
+
+Records go to the :attr:`LOGGER`, or to :attr:`.settings.SLOW_OPERATION_LOG`
+file, if set.
+"""
+# Imports =====================================================================
+import os
+import json
+import time
+import logging
+import threading
+
+from .. import settings
+
+
+# Variables ===================================================================
+LOGGER = logging.getLogger("edeposit.amqp.rest.slow_operations")
+_FILE_HANDLER = None
+_FILE_HANDLER_LOCK = threading.Lock()
+
+
+# Functions & classes =========================================================
+def is_enabled():
+    """
+    Is any of the thresholds set?
+    """
+    return bool(settings.SLOW_OPERATION_TIME or settings.SLOW_OPERATION_LOADS)
+
+
+def transfer_counts(handler):
+    """
+    Return the number of objects loaded and stored by the ZODB connection of
+    the `handler`.
+
+    Args:
+        handler (obj): Database handler.
+
+    Returns:
+        tuple: ``(loads, stores)`` or None if the `handler` is not connected.
+    """
+    zeo = getattr(handler, "zeo", None)
+    connection = getattr(zeo, "_connection", None)
+    if connection is None:
+        return None
+
+    return connection.getTransferCounts()
+
+
+def is_slow(duration, loads):
+    """
+    Check the call against the thresholds from the settings.
+
+    Args:
+        duration (float): Duration of the call in seconds.
+        loads (int): Number of loaded objects, or None if unknown.
+
+    Returns:
+        bool: True if any of the thresholds was crossed.
+    """
+    max_time = settings.SLOW_OPERATION_TIME
+    if max_time and duration >= max_time:
+        return True
+
+    max_loads = settings.SLOW_OPERATION_LOADS
+    return bool(max_loads and loads is not None and loads >= max_loads)
+
+
+def _logger():
+    """
+    Return :attr:`LOGGER` with handler for the
+    :attr:`.settings.SLOW_OPERATION_LOG`, if set.
+    """
+    global _FILE_HANDLER
+
+    if not settings.SLOW_OPERATION_LOG:
+        return LOGGER
+
+    path = os.path.abspath(settings.SLOW_OPERATION_LOG)
+
+    with _FILE_HANDLER_LOCK:
+        if _FILE_HANDLER is None or _FILE_HANDLER.baseFilename != path:
+            if _FILE_HANDLER is not None:
+                LOGGER.removeHandler(_FILE_HANDLER)
+                _FILE_HANDLER.close()
+
+            _FILE_HANDLER = logging.FileHandler(path)
+            _FILE_HANDLER.setFormatter(
+                logging.Formatter("%(asctime)s %(message)s")
+            )
+            LOGGER.addHandler(_FILE_HANDLER)
+            LOGGER.setLevel(logging.WARNING)
+
+    return LOGGER
+
+
+def record(handler_name, method, duration, loads=None, stores=None,
+           conflicts=0):
+    """
+    Log the call, if it crossed the thresholds.
+
+    Args:
+        handler_name (str): Name of the handler class.
+        method (str): Name of the method.
+        duration (float): Duration of the call in seconds.
+        loads (int, default None): Number of loaded objects.
+        stores (int, default None): Number of stored objects.
+        conflicts (int, default 0): Number of ConflictErrors.
+
+    Returns:
+        bool: True if the call was logged.
+    """
+    if not is_slow(duration, loads):
+        return False
+
+    _logger().warning(
+        "slow_operation %s",
+        json.dumps({
+            "handler": handler_name,
+            "method": method,
+            "duration": round(duration, 6),
+            "loads": loads,
+            "stores": stores,
+            "conflicts": conflicts,
+            "thread": threading.current_thread().name,
+            "timestamp": time.time(),
+        }, sort_keys=True)
+    )
+
+    return True
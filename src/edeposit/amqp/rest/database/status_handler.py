@@ -6,15 +6,22 @@
 # Imports =====================================================================
 import time
 import random
+from itertools import islice
 from functools import total_ordering
+from collections import namedtuple
 
 import transaction
 from persistent import Persistent
+from ZODB.POSException import ConflictError
+from BTrees.Length import Length
 from BTrees.OOBTree import OOSet
+from BTrees.OOBTree import OOBTree
 
-from zeo_connector import transaction_manager
 from zeo_connector.examples import DatabaseHandler
 
+from .transaction_manager import transaction_manager
+from .pack_scheduler import notify_garbage
+from .notification_broker import notify_version
 from ..settings import PROJECT_KEY
 from ..settings import ZEO_CLIENT_CONF_FILE
 
@@ -33,6 +40,19 @@ class AccessDeniedException(ValueError):
 
 
 # Functions & classes =========================================================
+class GarbageCollectionResult(namedtuple("GarbageCollectionResult",
+                                         ["removed", "batches", "finished"])):
+    """
+    Result of the :meth:`StatusHandler.trigger_garbage_collection`.
+
+    Attributes:
+        removed (int): Number of removed :class:`StatusInfo` objects.
+        batches (int): Number of commited transactions.
+        finished (bool): False if the run was interrupted by the time budget
+            and there may be more garbage for next run.
+    """
+
+
 @total_ordering
 class StatusMessage(Persistent):
     """
@@ -66,6 +86,30 @@ class StatusMessage(Persistent):
         return self.timestamp.__lt__(obj.timestamp)
 
 
+class MessageLog(OOBTree):
+    """
+    Persistent log of :class:`StatusMessage` objects keyed by ``(timestamp,
+    message)``.
+
+    Messages are kept in buckets, so adding new message doesn't re-pickle the
+    whole history. Concurrent additions of different messages are merged by
+    the conflict resolution of the buckets (``_p_resolveConflict``) instead of
+    raising ``ConflictError``.
+    """
+    @staticmethod
+    def _key(status_message):
+        return (status_message.timestamp, status_message.message)
+
+    def add(self, status_message):
+        """
+        Add `status_message` to the log.
+
+        Args:
+            status_message (obj): :class:`StatusMessage` instance.
+        """
+        self[self._key(status_message)] = status_message
+
+
 @total_ordering
 class StatusInfo(Persistent):
     """
@@ -75,9 +119,14 @@ class StatusInfo(Persistent):
         rest_id (str): REST id for which the messages are tracked.
         pub_url (str): URL of the tracked ebook.
         book_name (str): Name of the book in human readable form.
-        messages (list): List of :class:`StatusMessage` objects.
+        messages (obj): :class:`MessageLog` with :class:`StatusMessage`
+            objects. Objects stored in older versions may contain `set`,
+            which is converted when new message is added.
         registered_ts (float): Python timestamp format.
+        version (int): Counter incremented with each change of the object.
     """
+    version = 0
+
     def __init__(self, rest_id, pub_url=None, book_name=None,
                  registered_ts=None):
         """
@@ -93,7 +142,7 @@ class StatusInfo(Persistent):
         self.rest_id = rest_id
         self.pub_url = pub_url
         self.book_name = book_name
-        self.messages = set()
+        self.messages = MessageLog()
 
         if registered_ts:
             self.registered_ts = float(registered_ts)  # for __lt__ operator
@@ -107,8 +156,26 @@ class StatusInfo(Persistent):
         Args:
             status_message (obj): :class:`StatusMessage` instance.
         """
+        # migrate messages stored in `set` by older versions
+        if not isinstance(self.messages, MessageLog):
+            message_log = MessageLog()
+            for old_message in self.messages:
+                message_log.add(old_message)
+
+            self.messages = message_log
+
         self.messages.add(status_message)
 
+    def bump_version(self):
+        """
+        Increment the :attr:`version`.
+
+        Returns:
+            int: New version.
+        """
+        self.version += 1
+        return self.version
+
     def add_message(self, message, timestamp):
         """
         Add new :class:`StatusMessage` instance created from `message` and
@@ -129,13 +196,51 @@ class StatusInfo(Persistent):
         Returns:
             list: :class:`.StatusMessage` instances.
         """
+        if isinstance(self.messages, MessageLog):
+            return list(self.messages.values())
+
         return sorted(self.messages, key=lambda x: x.timestamp)
 
+    def _p_resolveConflict(self, old_state, saved_state, new_state):
+        """
+        Merge concurrent changes of different attributes (for example
+        `pub_url` and `book_name` set by two status updates). Increments of
+        the :attr:`version` are summed.
+
+        Note:
+            Conflicts are resolved by the ZEO server, so the server has to
+            be able to import this module. See ``edeposit_rest_runzeo.py``.
+
+        Raises:
+            ConflictError: If the same attribute was changed to different
+                values.
+        """
+        resolved = dict(saved_state)
+
+        for key, new_value in new_state.iteritems():
+            old_value = old_state.get(key)
+            if new_value == old_value:
+                continue
+
+            if key == "version":
+                resolved[key] = saved_state.get(key, 0) + new_value - \
+                    (old_value or 0)
+                continue
+
+            saved_value = saved_state.get(key)
+            if saved_value != old_value and saved_value != new_value:
+                raise ConflictError
+
+            resolved[key] = new_value
+
+        return resolved
+
     def __eq__(self, obj):
         if not isinstance(obj, StatusInfo):
             return False
 
-        return self.rest_id == obj.rest_id and self.messages == obj.messages
+        return self.rest_id == obj.rest_id and \
+            self.get_messages() == obj.get_messages()
 
     def __ne__(self, obj):
         return not self.__eq__(obj)
@@ -148,6 +253,10 @@ class StatusHandler(DatabaseHandler):
     """
     Database handler for tracking :class:`StatusInfo` and
     :class:`StatusMessage` objects sent tru AMQP.
+
+    Each change of the :class:`StatusInfo` increments its
+    :attr:`StatusInfo.version` and also the version of all trackings of the
+    user, so the clients can check for changes without loading the messages.
     """
     def __init__(self, conf_path=ZEO_CLIENT_CONF_FILE,
                  project_key=PROJECT_KEY):
@@ -179,12 +288,132 @@ class StatusHandler(DatabaseHandler):
             self.status_username_key
         )
 
+        # index for mapping username->version of all user's trackings
+        self.status_version_key = "status username->version"
+        self.username_to_version = self._get_key_or_create(
+            self.status_version_key
+        )
+
         # index for log
         self.log_key = "status log"
         self.log_db = self._get_key_or_create(
             self.log_key
         )
 
+        # index for mapping username->(registered_ts, rest_id)->StatusInfo
+        self.status_timeline_key = "status username->timeline"
+
+        # index for mapping (registered_ts, rest_id)->StatusInfo
+        self.status_registered_key = "status registered_ts->info"
+
+        with transaction.manager:
+            indexes_exist = all([
+                self.status_timeline_key in self.zeo,
+                self.status_registered_key in self.zeo,
+            ])
+
+        self.username_to_timeline = self._get_key_or_create(
+            self.status_timeline_key
+        )
+        self.registered_index = self._get_key_or_create(
+            self.status_registered_key
+        )
+
+        # migration of databases created before the indexes were introduced
+        if not indexes_exist:
+            self.rebuild_indexes()
+
+    @staticmethod
+    def _timeline_key(status_info):
+        """
+        Return key for the user's timeline index.
+
+        Args:
+            status_info (obj): :class:`StatusInfo` instance.
+
+        Returns:
+            tuple: ``(registered_ts, rest_id)``.
+        """
+        return (float(status_info.registered_ts), status_info.rest_id)
+
+    def _add_to_timeline(self, username, status_info):
+        """
+        Put `status_info` to the timeline of the `username`.
+
+        Warning:
+            Has to be used inside transaction.
+        """
+        timeline = self.username_to_timeline.get(username, None)
+        if timeline is None:
+            timeline = OOBTree()
+            self.username_to_timeline[username] = timeline
+
+        timeline[self._timeline_key(status_info)] = status_info
+
+    def _remove_from_timeline(self, username, status_info):
+        """
+        Remove `status_info` from the timeline of the `username`.
+
+        Warning:
+            Has to be used inside transaction.
+        """
+        timeline = self.username_to_timeline.get(username, None)
+        if timeline is None:
+            return
+
+        timeline.pop(self._timeline_key(status_info), None)
+
+        if not timeline:
+            del self.username_to_timeline[username]
+
+    def _bump_user_version(self, username):
+        """
+        Increment the version of the trackings of the `username`.
+
+        The counter is never removed, so the version keeps growing even when
+        the user is removed and registered again.
+
+        Warning:
+            Has to be used inside transaction.
+        """
+        counter = self.username_to_version.get(username, None)
+        if counter is None:
+            counter = Length()
+            self.username_to_version[username] = counter
+
+        counter.change(1)
+
+        # wake up the clients waiting in this process after the commit
+        version = counter()
+
+        def notify_after_commit(success):
+            if success:
+                notify_version(username, version)
+
+        transaction.get().addAfterCommitHook(notify_after_commit)
+
+    @transaction_manager
+    def rebuild_indexes(self):
+        """
+        Build the indexes of :class:`StatusInfo` objects ordered by the
+        registration time (global and for each user) from the scratch.
+
+        This is done automatically, when the handler is connected to database
+        without the indexes.
+        """
+        self.username_to_timeline.clear()
+        self.registered_index.clear()
+
+        for status_info in self.status_db.values():
+            key = self._timeline_key(status_info)
+            self.registered_index[key] = status_info
+
+        for rest_id, username in self.id_to_username.items():
+            status_info = self.status_db.get(rest_id, None)
+
+            if status_info is not None:
+                self._add_to_timeline(username, status_info)
+
     def log(self, msg, session=None):
         """
         Log the message to the database.
@@ -207,6 +436,25 @@ class StatusHandler(DatabaseHandler):
             username (str): Name of the user.
             rest_id (str): Unique identificator of given REST request.
         """
+        self._register_status_tracking(username, rest_id)
+
+    def _register_status_tracking(self, username, rest_id,
+                                  registered_ts=None):
+        """
+        Register `username` for tracking states of given `rest_id`.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            username (str): Name of the user.
+            rest_id (str): Unique identificator of given REST request.
+            registered_ts (float, default None): Time of the registration.
+                Current time is used if not set.
+
+        Returns:
+            obj: New :class:`StatusInfo` instance.
+        """
         self.log("Registering user '%s' to track '%s'." % (username, rest_id))
 
         # handle id->username mapping
@@ -221,7 +469,28 @@ class StatusHandler(DatabaseHandler):
         # add new rest_id to set
         uname_to_ids.add(rest_id)
 
-        self.status_db[rest_id] = StatusInfo(rest_id=rest_id)
+        # re-registration of the same rest_id replaces the old record
+        old_status_info = self.status_db.get(rest_id, None)
+        if old_status_info is not None:
+            self._remove_from_timeline(username, old_status_info)
+            self.registered_index.pop(
+                self._timeline_key(old_status_info),
+                None
+            )
+
+        status_info = StatusInfo(rest_id=rest_id, registered_ts=registered_ts)
+        if old_status_info is not None:
+            status_info.version = old_status_info.version
+
+        status_info.bump_version()
+
+        self.status_db[rest_id] = status_info
+        self._add_to_timeline(username, status_info)
+        self.registered_index[self._timeline_key(status_info)] = status_info
+
+        self._bump_user_version(username)
+
+        return status_info
 
     @transaction_manager
     def save_status_update(self, rest_id, message, timestamp, book_name=None,
@@ -253,16 +522,18 @@ class StatusHandler(DatabaseHandler):
             status_info_obj.book_name = book_name
 
         status_info_obj.add_message(message, timestamp)
+        status_info_obj.bump_version()
 
-    @transaction_manager
-    def query_status(self, rest_id, username=None):
+        username = self.id_to_username.get(rest_id, None)
+        if username:
+            self._bump_user_version(username)
+
+    def _query_status_info(self, rest_id, username=None):
         """
-        List all messages stored in given `rest_id` for given `username`.
+        Return :class:`StatusInfo` for `rest_id`, check the `username`.
 
-        Args:
-            rest_id (str): Unique identificator of given REST request.
-            username (str, default None): Name of the user. If not set, the
-                username will not be checked.
+        Warning:
+            Has to be used inside transaction.
 
         Raises:
             IndexError: If the user wasn't registered to receive status
@@ -271,7 +542,7 @@ class StatusHandler(DatabaseHandler):
                 fit to given `rest_id`.
 
         Returns:
-            obj: :class:`StatusInfo` for given `rest_id`.
+            obj: :class:`StatusInfo` or None.
         """
         status_info_obj = self.status_db.get(rest_id, None)
         db_username = self.id_to_username.get(rest_id, None)
@@ -288,11 +559,126 @@ class StatusHandler(DatabaseHandler):
                 "Item '%s' is not owned by '%s'!" % (rest_id, username)
             )
 
+        return status_info_obj
+
+    @transaction_manager
+    def query_status(self, rest_id, username=None):
+        """
+        List all messages stored in given `rest_id` for given `username`.
+
+        Args:
+            rest_id (str): Unique identificator of given REST request.
+            username (str, default None): Name of the user. If not set, the
+                username will not be checked.
+
+        Raises:
+            IndexError: If the user wasn't registered to receive status
+                updates.
+            AccessDeniedException: If the optional parameter `username` doesn't
+                fit to given `rest_id`.
+
+        Returns:
+            list: :class:`StatusMessage` objects for given `rest_id`.
+        """
+        status_info_obj = self._query_status_info(rest_id, username)
+
         if not status_info_obj:
             return []
 
         return status_info_obj.get_messages()
 
+    @transaction_manager
+    def query_status_info(self, rest_id, username=None):
+        """
+        Return :class:`StatusInfo` for given `rest_id`.
+
+        Args:
+            rest_id (str): Unique identificator of given REST request.
+            username (str, default None): Name of the user. If not set, the
+                username will not be checked.
+
+        Raises:
+            IndexError: If the user wasn't registered to receive status
+                updates.
+            AccessDeniedException: If the optional parameter `username` doesn't
+                fit to given `rest_id`.
+
+        Returns:
+            obj: :class:`StatusInfo` or None.
+        """
+        return self._query_status_info(rest_id, username)
+
+    @transaction_manager
+    def query_status_version(self, rest_id, username=None):
+        """
+        Return :attr:`StatusInfo.version` of given `rest_id`. Messages are not
+        loaded from the database.
+
+        Args:
+            rest_id (str): Unique identificator of given REST request.
+            username (str, default None): Name of the user. If not set, the
+                username will not be checked.
+
+        Raises:
+            IndexError: If the user wasn't registered to receive status
+                updates.
+            AccessDeniedException: If the optional parameter `username` doesn't
+                fit to given `rest_id`.
+
+        Returns:
+            int: Version.
+        """
+        status_info_obj = self._query_status_info(rest_id, username)
+
+        if not status_info_obj:
+            return 0
+
+        return status_info_obj.version
+
+    @transaction_manager
+    def query_user_version(self, username):
+        """
+        Return version of all trackings of the `username`. The version is
+        incremented by each registration, status update or removal.
+
+        Args:
+            username (str): Selected username.
+
+        Returns:
+            int: Version. 0 for unknown user.
+        """
+        return self._user_version(username)
+
+    @transaction_manager
+    def query_user_versions(self, usernames):
+        """
+        Same as :meth:`query_user_version`, but for more users in one
+        transaction.
+
+        Args:
+            usernames (list): Selected usernames.
+
+        Returns:
+            dict: ``{username: version}``.
+        """
+        return {
+            username: self._user_version(username)
+            for username in usernames
+        }
+
+    def _user_version(self, username):
+        """
+        Return version of all trackings of the `username`.
+
+        Warning:
+            Has to be used inside transaction.
+        """
+        counter = self.username_to_version.get(username, None)
+        if counter is None:
+            return 0
+
+        return counter()
+
     @transaction_manager
     def query_statuses(self, username):
         """
@@ -307,27 +693,94 @@ class StatusHandler(DatabaseHandler):
         Returns:
             list: List of :class:`StatusInfo` objects sorted by creation time.
         """
-        ids = self.username_to_ids.get(username, None)
+        if username not in self.username_to_ids:
+            raise IndexError(
+                "Username '%s' is not registered for tracking!" % username
+            )
 
-        if ids is None:
+        timeline = self.username_to_timeline.get(username, None)
+        if timeline is None:
+            return []
+
+        return list(timeline.values())
+
+    @staticmethod
+    def _parse_cursor(cursor):
+        """
+        Convert `cursor` from :meth:`query_statuses_page` back to the key of
+        the timeline.
+
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        try:
+            registered_ts, rest_id = cursor.split(",", 1)
+            return (float(registered_ts), rest_id)
+        except (ValueError, AttributeError):
+            raise ValueError("Invalid cursor '%s'!" % cursor)
+
+    @transaction_manager
+    def query_statuses_page(self, username, limit=None, cursor=None,
+                            since=None):
+        """
+        Get one page of informations about the trackings for given `username`.
+
+        Only the :class:`StatusInfo` objects on the page are loaded from the
+        database.
+
+        Args:
+            username (str): Selected username.
+            limit (int, default None): Maximal size of the page. All records
+                if not set.
+            cursor (str, default None): Cursor returned with previous page.
+            since (float, default None): Return only records registered at
+                this timestamp or later.
+
+        Raises:
+            IndexError: If username was not found in database.
+            ValueError: If the `cursor` or `limit` is invalid.
+
+        Returns:
+            tuple: ``(status_infos, next_cursor)``, where `status_infos` is \
+                   list of :class:`StatusInfo` objects sorted by creation \
+                   time and `next_cursor` is string for next page, or None \
+                   for last page.
+        """
+        if username not in self.username_to_ids:
             raise IndexError(
                 "Username '%s' is not registered for tracking!" % username
             )
 
-        # convert list of rest_ids to StatusInfo objects from DB
-        status_infos = (
-            self.status_db.get(rest_id, None)
-            for rest_id in ids
-        )
+        if limit is not None and limit <= 0:
+            raise ValueError("`limit` has to be positive number!")
 
-        # filter None elements
-        status_infos = (
-            status_info
-            for status_info in status_infos
-            if status_info is not None
-        )
+        timeline = self.username_to_timeline.get(username, None)
+        if timeline is None:
+            return [], None
 
-        return sorted(status_infos, key=lambda x: x.registered_ts)
+        min_key = None
+        exclude_min = False
+        if since is not None:
+            min_key = (float(since),)
+
+        if cursor:
+            cursor_key = self._parse_cursor(cursor)
+
+            if min_key is None or cursor_key >= min_key:
+                min_key = cursor_key
+                exclude_min = True
+
+        items = timeline.items(min=min_key, excludemin=exclude_min)
+        if limit is None:
+            return [status_info for _, status_info in items], None
+
+        page = list(islice(items, limit + 1))
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = "%r,%s" % page[-1][0]
+
+        return [status_info for _, status_info in page], next_cursor
 
     @transaction_manager
     def remove_status_info(self, rest_id, username=None):
@@ -362,9 +815,26 @@ class StatusHandler(DatabaseHandler):
                     )
                 )
 
+        self._remove_status_info(rest_id, username)
+
+        self.log("StatusInfo(%s) successfully removed." % rest_id, session)
+
+    def _remove_status_info(self, rest_id, username=None):
+        """
+        Remove `rest_id` from all indexes without any checks and logging.
+
+        Warning:
+            Has to be used inside transaction.
+
+        Args:
+            rest_id (str): Unique identificator of given REST request.
+            username (str, default None): Name of the user, used in case that
+                the `rest_id` is not in id->username mapping.
+        """
         # remove StatusInfo object
-        if rest_id in self.status_db:
-            del self.status_db[rest_id]
+        status_info = self.status_db.pop(rest_id, None)
+        if status_info is not None:
+            self.registered_index.pop(self._timeline_key(status_info), None)
 
         # remove from id->username mapping
         stored_username = self.id_to_username.get(rest_id, None)
@@ -372,20 +842,23 @@ class StatusHandler(DatabaseHandler):
             del self.id_to_username[rest_id]
             username = stored_username
 
+        # remove from the username->timeline index
+        if username and status_info is not None:
+            self._remove_from_timeline(username, status_info)
+            self._bump_user_version(username)
+
         # remove from username->ids mapping
         if username:
             ids = self.username_to_ids.get(username, None)
 
             # remove `rest_id` from ids
             if ids is not None and rest_id in ids:
-                self.username_to_ids[username].remove(rest_id)
+                ids.remove(rest_id)
 
             # remove empty sets of ids
-            if not self.username_to_ids[username]:
+            if ids is not None and not ids:
                 del self.username_to_ids[username]
 
-        self.log("StatusInfo(%s) successfully removed." % rest_id, session)
-
     @transaction_manager
     def remove_user(self, username):
         """
@@ -405,30 +878,113 @@ class StatusHandler(DatabaseHandler):
         for rest_id in ids:
             self.remove_status_info(rest_id)
 
-    def trigger_garbage_collection(self, interval=YEAR/2):
+    @transaction_manager
+    def _collect_garbage_batch(self, max_key, batch_size, batch, session):
+        """
+        Remove up to `batch_size` oldest keys of the :attr:`registered_index`
+        lower than `max_key` together with their :class:`StatusInfo` objects.
+
+        Keys are removed from the index directly, so orphaned keys without
+        the :class:`StatusInfo` don't come back in the next batch.
+
+        Args:
+            max_key (tuple): Maximal key of the :attr:`registered_index`.
+            batch_size (int): Maximal number of processed keys.
+            batch (int): Number of the batch, used in the log.
+            session (int): Session number used in the log.
+
+        Returns:
+            tuple: ``(processed_keys, removed_rest_ids)``.
+        """
+        garbage_keys = list(
+            islice(self.registered_index.keys(max=max_key), batch_size)
+        )
+
+        removed_rest_ids = []
+        for key in garbage_keys:
+            self.registered_index.pop(key, None)
+
+            rest_id = key[1]
+            status_info = self.status_db.get(rest_id, None)
+            if status_info is None or self._timeline_key(status_info) != key:
+                continue
+
+            self._remove_status_info(rest_id)
+            removed_rest_ids.append(rest_id)
+
+        if garbage_keys:
+            self.log(
+                "Garbage collection batch %d: %d objects: %s" % (
+                    batch,
+                    len(removed_rest_ids),
+                    ", ".join(removed_rest_ids)
+                ),
+                session
+            )
+
+        return len(garbage_keys), removed_rest_ids
+
+    @transaction_manager
+    def _log_garbage_collection(self, removed, batches, finished, session):
+        self.log(
+            "Garbage collection %s. Removed %d objects in %d batches." % (
+                "finished" if finished else "interrupted",
+                removed,
+                batches,
+            ),
+            session
+        )
+
+    def trigger_garbage_collection(self, interval=YEAR/2, batch_size=500,
+                                   time_budget=None):
         """
         Do a garbage collection run and remove all :class:`StatusInfo` objects
         which are stored longer than `interval`.
 
+        Objects are found using the index ordered by the registration time and
+        removed in batches, each in its own transaction. If the `time_budget`
+        is exceeded, the run stops after current batch and next run continues
+        with the rest.
+
         Args:
             interval (int/float): Inteval in seconds. Default YEAR/2.
+            batch_size (int, default 500): Number of objects removed in one
+                transaction.
+            time_budget (float, default None): Maximal duration of the run in
+                seconds. Unlimited if not set.
+
+        Returns:
+            obj: :class:`GarbageCollectionResult` instance.
         """
-        with transaction.manager:
-            garbage_rest_ids = [
-                status_info.rest_id
-                for status_info in self.status_db.values()
-                if status_info.registered_ts + interval <= time.time()
-            ]
+        start = time.time()
+        max_key = (start - interval,)
+        session = random.randint(0, 100000)
 
-            self.log(
-                "Garbage collection triggered. Cleaning %d objects: %s" % (
-                    len(garbage_rest_ids),
-                    ", ".join(garbage_rest_ids)
-                )
+        removed = 0
+        batches = 0
+        finished = False
+        while not finished:
+            processed, removed_rest_ids = self._collect_garbage_batch(
+                max_key,
+                batch_size,
+                batches + 1,
+                session,
             )
 
-        for rest_id in garbage_rest_ids:
-            self.remove_status_info(rest_id)
+            if processed:
+                removed += len(removed_rest_ids)
+                batches += 1
 
-        with transaction.manager:
-            self.zeo.pack()
+            finished = processed < batch_size
+
+            if time_budget is not None and time.time() - start >= time_budget:
+                break
+
+        notify_garbage(removed)
+        self._log_garbage_collection(removed, batches, finished, session)
+
+        return GarbageCollectionResult(
+            removed=removed,
+            batches=batches,
+            finished=finished,
+        )
@@ -0,0 +1,148 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Transaction decorator used by all methods of the database handlers.
+
+It behaves as :func:`zeo_connector.transaction_manager`, but it is also the
+place, where each handler method is measured for the :mod:`.metrics` and
+the :mod:`.slow_log`, and where the transactions are retried after
+``ConflictError``.
+
+ZODB aborts the whole transaction on conflict, so running the method again
+is safe, as long as it has no side effects outside of the database before
+the commit. Handler methods have to keep such side effects (notifications,
+storing of the files) outside of the transaction, do them after the commit
+(:meth:`transaction.Transaction.addAfterCommitHook`), or make them safe to
+repeat, like the linking of the files to the cache.
+"""
+# Imports =====================================================================
+import time
+import random
+from functools import wraps
+
+import transaction
+from ZODB.POSException import ConflictError
+
+from .. import metrics
+from .. import settings
+from . import slow_log
+
+
+# Functions & classes =========================================================
+def backoff(attempt):
+    """
+    Return randomized delay before the `attempt`-th retry ("full jitter"),
+    so the conflicting transactions don't retry at the same time again.
+
+    Args:
+        attempt (int): Number of the retry, starting from 1.
+
+    Returns:
+        float: Delay in seconds.
+    """
+    max_delay = settings.DB_CONFLICT_BACKOFF * 2 ** (attempt - 1)
+
+    return random.uniform(0, max_delay)
+
+
+def _count_conflict(handler_name, method, outcome):
+    if metrics.is_enabled():
+        metrics.HANDLER_CONFLICTS.inc(handler_name, method, outcome)
+
+
+def _measure(handler, method, duration, counts, conflicts, measure_latency,
+             log_slow):
+    """
+    Record the call of the `method` to the metrics and to the slow log.
+
+    Args:
+        handler (obj): Database handler.
+        method (str): Name of the method.
+        duration (float): Duration of the call.
+        counts (tuple): :func:`.slow_log.transfer_counts` before the call.
+        conflicts (int): Number of ConflictErrors.
+        measure_latency (bool): Record to the metrics.
+        log_slow (bool): Record to the slow log.
+    """
+    handler_name = handler.__class__.__name__
+
+    if measure_latency:
+        metrics.HANDLER_LATENCY.observe(duration, handler_name, method)
+
+    if not log_slow:
+        return
+
+    loads, stores = None, None
+    new_counts = slow_log.transfer_counts(handler)
+
+    # counters start from zero, if the connection was reopened
+    if counts is not None and new_counts is not None:
+        loads = max(0, new_counts[0] - counts[0])
+        stores = max(0, new_counts[1] - counts[1])
+
+    slow_log.record(
+        handler_name,
+        method,
+        duration,
+        loads=loads,
+        stores=stores,
+        conflicts=conflicts,
+    )
+
+
+def transaction_manager(fn):
+    """
+    Decorator which wraps whole method into ``with transaction.manager:``.
+
+    Transaction failed with ``ConflictError`` is run again up to
+    :attr:`.settings.DB_CONFLICT_RETRIES` times with :func:`backoff`.
+    Retries and failures are counted in :attr:`.metrics.HANDLER_CONFLICTS`.
+
+    Duration of the call (including the retries) is recorded to
+    :attr:`.metrics.HANDLER_LATENCY` under the name of the handler class and
+    the method, if the metrics are enabled. Slow calls are logged by
+    :func:`.slow_log.record`.
+    """
+    @wraps(fn)
+    def transaction_manager_decorator(self, *args, **kwargs):
+        measure_latency = metrics.is_enabled()
+        log_slow = slow_log.is_enabled()
+
+        counts = slow_log.transfer_counts(self) if log_slow else None
+        conflicts = 0
+        start = time.time()
+        try:
+            while True:
+                try:
+                    with transaction.manager:
+                        return fn(self, *args, **kwargs)
+                except ConflictError:
+                    conflicts += 1
+                    retry = conflicts <= settings.DB_CONFLICT_RETRIES
+
+                    _count_conflict(
+                        self.__class__.__name__,
+                        fn.__name__,
+                        "retried" if retry else "failed",
+                    )
+
+                    if not retry:
+                        raise
+
+                    time.sleep(backoff(conflicts))
+        finally:
+            if measure_latency or log_slow:
+                _measure(
+                    self,
+                    fn.__name__,
+                    time.time() - start,
+                    counts,
+                    conflicts,
+                    measure_latency,
+                    log_slow,
+                )
+
+    return transaction_manager_decorator
@@ -4,13 +4,22 @@
 # Interpreter version: python 2.7
 #
 # Imports =====================================================================
+import os
+import hmac
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
 import bcrypt
 import transaction
 
-from zeo_connector import transaction_manager
 from zeo_connector.examples import DatabaseHandler
 
+from .transaction_manager import transaction_manager
 from ..settings import PROJECT_KEY
+from ..settings import AUTH_CACHE_TTL
+from ..settings import AUTH_CACHE_SIZE
 from ..settings import ZEO_CLIENT_CONF_FILE
 
 
@@ -28,6 +37,162 @@ def create_hash(password):
     return bcrypt.hashpw(str(password), bcrypt.gensalt())
 
 
+def _to_bytes(data):
+    """
+    Convert `data` to utf-8 encoded string.
+    """
+    if isinstance(data, unicode):
+        return data.encode("utf-8")
+
+    return str(data)
+
+
+class CredentialCache(object):
+    """
+    Size-bounded LRU cache of successfully verified logins, which allows to
+    skip the expensive bcrypt computation for repeated requests.
+
+    Plain passwords are never stored. The key is HMAC of the username and
+    password with random secret generated for each process. The cached
+    record is valid only until `ttl` expires and only while the stored
+    password hash is the same as the one used for the verification, so
+    changes made by other processes are respected.
+
+    Attributes:
+        max_size (int): Maximal number of records. 0 disables the cache.
+        ttl (float): How long (in seconds) is the record valid.
+        hits (int): Number of successful lookups.
+        misses (int): Number of unsuccessful lookups.
+    """
+    def __init__(self, max_size=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL):
+        """
+        Constructor.
+
+        Args:
+            max_size (int): See :attr:`max_size`. Default
+                :attr:`.settings.AUTH_CACHE_SIZE`.
+            ttl (float): See :attr:`ttl`. Default
+                :attr:`.settings.AUTH_CACHE_TTL`.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._secret = os.urandom(32)
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, username, password):
+        return hmac.new(
+            self._secret,
+            _to_bytes(username) + "\0" + _to_bytes(password),
+            hashlib.sha256
+        ).digest()
+
+    def is_valid(self, username, password, pw_hash):
+        """
+        Was the `username` with `password` already verified against `pw_hash`?
+
+        Args:
+            username (str): Username.
+            password (str): Cleantext version of the password.
+            pw_hash (str): Currently stored hash of the password.
+
+        Returns:
+            bool: True if it was and the record is still valid.
+        """
+        key = self._key(username, password)
+
+        with self._lock:
+            record = self._records.pop(key, None)
+
+            if record is None:
+                self.misses += 1
+                return False
+
+            stored_username, stored_hash, expires = record
+            if stored_hash != pw_hash or expires < time.time():
+                self.misses += 1
+                return False
+
+            self._records[key] = record  # move to the end of LRU
+            self.hits += 1
+
+            return True
+
+    def add(self, username, password, pw_hash):
+        """
+        Remember successful verification of `username` and `password`.
+
+        Args:
+            username (str): Username.
+            password (str): Cleantext version of the password.
+            pw_hash (str): Stored hash of the password.
+        """
+        if self.max_size <= 0:
+            return
+
+        key = self._key(username, password)
+        expires = time.time() + self.ttl
+
+        with self._lock:
+            self._records.pop(key, None)
+            self._records[key] = (username, pw_hash, expires)
+
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+
+    def invalidate(self, username):
+        """
+        Remove all records for given `username`.
+
+        Args:
+            username (str): Username.
+        """
+        with self._lock:
+            keys = [
+                key
+                for key, record in self._records.iteritems()
+                if record[0] == username
+            ]
+
+            for key in keys:
+                del self._records[key]
+
+    def clear(self):
+        """
+        Remove all records and reset the counters.
+        """
+        with self._lock:
+            self._records.clear()
+
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return the counters.
+
+        Returns:
+            dict: ``{"hits": int, "misses": int, "hit_rate": float, \
+                  "size": int}``.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+                "size": len(self._records),
+            }
+
+
+CREDENTIAL_CACHE = CredentialCache()  #: Process-wide cache of logins.
+
+
 class UserHandler(DatabaseHandler):
     """
     User database.
@@ -35,6 +200,7 @@ class UserHandler(DatabaseHandler):
     Attributes:
         users_key (str): Key which is used to access database.
         users (obj): Dict-like object in ZEO.
+        credential_cache (obj): :class:`CredentialCache` instance.
     """
     def __init__(self, conf_path=ZEO_CLIENT_CONF_FILE,
                  project_key=PROJECT_KEY):
@@ -56,6 +222,8 @@ class UserHandler(DatabaseHandler):
         self.users_key = "users"
         self.users = self._get_key_or_create(self.users_key)
 
+        self.credential_cache = CREDENTIAL_CACHE
+
     @transaction_manager
     def add_user(self, username, pw_hash):
         """
@@ -67,6 +235,7 @@ class UserHandler(DatabaseHandler):
                 for details.
         """
         self.users[username] = pw_hash
+        self.credential_cache.invalidate(username)
 
     @transaction_manager
     def remove_user(self, username):
@@ -77,6 +246,7 @@ class UserHandler(DatabaseHandler):
             username (str): Username of the new user.
         """
         del self.users[username]
+        self.credential_cache.invalidate(username)
 
     def is_valid_user(self, username, password):
         """
@@ -95,9 +265,18 @@ class UserHandler(DatabaseHandler):
         if stored_pass_hash is None:
             return False
 
+        cache = self.credential_cache
+        if cache.is_valid(username, password, stored_pass_hash):
+            return True
+
         hashed = bcrypt.hashpw(str(password), stored_pass_hash)
 
-        return hashed == stored_pass_hash
+        if hashed != stored_pass_hash:
+            return False
+
+        cache.add(username, password, stored_pass_hash)
+
+        return True
 
     @transaction_manager
     def is_registered(self, username):
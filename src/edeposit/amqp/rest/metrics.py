@@ -0,0 +1,394 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+In-process metrics rendered in the Prometheus text format.
+
+Latencies are collected into :class:`Histogram` objects with fixed buckets,
+so the observation is just a binary search and increment under lock. Gauges
+are computed by callbacks only when the metrics are rendered.
+
+Everything is switched off by default, see :attr:`.settings.METRICS_ENABLED`.
+The ``/metrics`` page is not protected by any authentication, so enable it only
+when the webserver is not reachable from the public network, or when the path
+is restricted by the proxy in front of it.
+"""
+# Imports =====================================================================
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from . import settings
+
+
+# Variables ===================================================================
+#: Default buckets in seconds.
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0,
+)
+
+
+# Functions & classes =========================================================
+def _escape(value):
+    """
+    Escape the label `value`.
+    """
+    value = unicode(value) if not isinstance(value, basestring) else value
+
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """
+    Format the labels to ``{name="value",..}`` string.
+    """
+    pairs = zip(label_names, label_values)
+    if extra:
+        pairs.append(extra)
+
+    if not pairs:
+        return ""
+
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, _escape(value))
+        for name, value in pairs
+    )
+
+
+def _format_value(value):
+    """
+    Format the number for the Prometheus.
+    """
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value))
+
+
+class Histogram(object):
+    """
+    Histogram of observed values with labels.
+
+    Attributes:
+        name (str): Name of the metric.
+        help (str): Description of the metric.
+        label_names (tuple): Names of the labels.
+        buckets (tuple): Upper bounds of the buckets.
+    """
+    def __init__(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """
+        Record the `value`.
+
+        Args:
+            value (float): Observed value.
+            *label_values: Values of the labels in order of
+                :attr:`label_names`.
+        """
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[label_values] = series
+
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        """
+        Observe the duration of the ``with`` block.
+
+        Args:
+            *label_values: Values of the labels.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, *label_values)
+
+    def series(self):
+        """
+        Return copy of the data.
+
+        Returns:
+            dict: ``{label_values: (bucket_counts, sum, count)}``.
+        """
+        with self._lock:
+            return {
+                labels: (list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            }
+
+    def clear(self):
+        """
+        Forget all observations.
+        """
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """
+        Return the histogram in the Prometheus text format.
+
+        Returns:
+            list: Lines.
+        """
+        lines = [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s histogram" % self.name,
+        ]
+
+        for label_values, (counts, total, count) in \
+                sorted(self.series().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),),
+                                           counts):
+                cumulative += bucket_count
+                lines.append("%s_bucket%s %d" % (
+                    self.name,
+                    _format_labels(
+                        self.label_names,
+                        label_values,
+                        ("le", _format_value(bound))
+                    ),
+                    cumulative,
+                ))
+
+            labels = _format_labels(self.label_names, label_values)
+            lines.append("%s_sum%s %s" % (self.name, labels,
+                                          _format_value(total)))
+            lines.append("%s_count%s %d" % (self.name, labels, count))
+
+        return lines
+
+
+class Counter(object):
+    """
+    Monotonically increasing counter with labels.
+
+    Attributes:
+        name (str): Name of the metric.
+        help (str): Description of the metric.
+        label_names (tuple): Names of the labels.
+    """
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+
+        self._values = {}  # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, **kwargs):
+        """
+        Increment the counter.
+
+        Args:
+            *label_values: Values of the labels in order of
+                :attr:`label_names`.
+            amount (int, default 1): Keyword argument - size of the increment.
+        """
+        amount = kwargs.get("amount", 1)
+
+        with self._lock:
+            self._values[label_values] = \
+                self._values.get(label_values, 0) + amount
+
+    def values(self):
+        """
+        Return copy of the data.
+
+        Returns:
+            dict: ``{label_values: count}``.
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def clear(self):
+        """
+        Reset all values.
+        """
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        """
+        Return the counter in the Prometheus text format.
+
+        Returns:
+            list: Lines.
+        """
+        lines = [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s counter" % self.name,
+        ]
+
+        for label_values, value in sorted(self.values().items()):
+            lines.append("%s%s %s" % (
+                self.name,
+                _format_labels(self.label_names, label_values),
+                _format_value(value),
+            ))
+
+        return lines
+
+
+class Gauge(object):
+    """
+    Gauge computed by `callback` when the metrics are rendered.
+
+    Attributes:
+        name (str): Name of the metric.
+        help (str): Description of the metric.
+        callback (fn): Function returning the value, or dict mapping tuples
+            of label values to values.
+        label_names (tuple): Names of the labels.
+    """
+    def __init__(self, name, help, callback, label_names=()):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.label_names = tuple(label_names)
+
+    def render(self):
+        """
+        Return the gauge in the Prometheus text format. Errors of the
+        callback are rendered as a comment.
+
+        Returns:
+            list: Lines.
+        """
+        lines = [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s gauge" % self.name,
+        ]
+
+        try:
+            values = self.callback()
+        except Exception as e:
+            lines.append("# ERROR %s" % str(e).replace("\n", " "))
+            return lines
+
+        if not isinstance(values, dict):
+            values = {(): values}
+
+        for label_values, value in sorted(values.items()):
+            if value is None:
+                continue
+
+            lines.append("%s%s %s" % (
+                self.name,
+                _format_labels(self.label_names, label_values),
+                _format_value(value),
+            ))
+
+        return lines
+
+
+class Registry(object):
+    """
+    Collection of the metrics.
+    """
+    def __init__(self):
+        self._metrics = []
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add `metric`, or return already registered metric with the same name.
+
+        Args:
+            metric (obj): :class:`Histogram`, :class:`Counter` or
+                :class:`Gauge`.
+
+        Returns:
+            obj: Registered metric.
+        """
+        with self._lock:
+            if metric.name in self._names:
+                return self._names[metric.name]
+
+            self._metrics.append(metric)
+            self._names[metric.name] = metric
+
+            return metric
+
+    def histogram(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+        """
+        Create and register :class:`Histogram`.
+        """
+        return self.register(Histogram(name, help, label_names, buckets))
+
+    def counter(self, name, help, label_names=()):
+        """
+        Create and register :class:`Counter`.
+        """
+        return self.register(Counter(name, help, label_names))
+
+    def gauge(self, name, help, callback, label_names=()):
+        """
+        Create and register :class:`Gauge`.
+        """
+        return self.register(Gauge(name, help, callback, label_names))
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text format.
+
+        Returns:
+            str: Metrics.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()  #: Process-wide registry.
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    "edeposit_rest_handler_seconds",
+    "Duration of the transactions of the database handler methods.",
+    ["handler", "method"],
+)
+HANDLER_CONFLICTS = REGISTRY.counter(
+    "edeposit_rest_handler_conflicts_total",
+    "ConflictErrors of the database handler methods, by the outcome "
+    "(retried / failed).",
+    ["handler", "method", "outcome"],
+)
+AMQP_LATENCY = REGISTRY.histogram(
+    "edeposit_rest_amqp_message_seconds",
+    "Duration of the processing of the AMQP messages.",
+    ["message"],
+)
+
+
+def is_enabled():
+    """
+    Are the metrics enabled in :attr:`.settings.METRICS_ENABLED`?
+    """
+    return settings.METRICS_ENABLED
+
@@ -0,0 +1,205 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Sampling profiler of the HTTP requests and AMQP messages.
+
+Part of the requests given by :attr:`.settings.PROFILE_SAMPLE_RATE`, which
+names match :attr:`.settings.PROFILE_FILTER`, is run under :mod:`cProfile`
+and the stats are dumped to :attr:`.settings.PROFILE_DIR`. Dumps can be
+aggregated by :func:`load_stats`, or by the
+``edeposit_rest_profile_report.py`` script.
+
+Note:
+    The profiler records only the thread of the request. Calls made in the
+    thread pool of the cooperative webserver are not included.
+
+Note:
+    :mod:`cProfile` hooks the whole OS thread, so only one profile may be
+    active in a thread. Requests started while other request is profiled in
+    the same thread are not profiled. In the cooperative (`gevent`) mode all
+    greenlets share one thread, so the profile of the request also contains
+    the work of other greenlets switched to while it waits.
+"""
+# Imports =====================================================================
+import os
+import re
+import time
+import uuid
+import pstats
+import random
+import cProfile
+import thread
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from . import settings
+
+
+# Variables ===================================================================
+DUMP_SUFFIX = ".prof"  #: Suffix of the files with profiles.
+
+_ACTIVE_THREADS = set()  # idents of the OS threads with active profile
+_ACTIVE_LOCK = threading.Lock()
+
+
+# Functions & classes =========================================================
+def profile_dir():
+    """
+    Return :attr:`.settings.PROFILE_DIR`, or temporary directory if not set.
+    """
+    return settings.PROFILE_DIR or os.path.join(
+        tempfile.gettempdir(),
+        "edeposit_rest_profiles"
+    )
+
+
+def is_sampled(name):
+    """
+    Should the request `name` be profiled?
+
+    Args:
+        name (str): Route (``"GET /api/v1/track"``) or name of the AMQP
+            message.
+
+    Returns:
+        bool: True if the request is sampled.
+    """
+    rate = settings.PROFILE_SAMPLE_RATE
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return False
+
+    return not settings.PROFILE_FILTER or \
+        bool(re.search(settings.PROFILE_FILTER, name))
+
+
+def dump_path(name):
+    """
+    Return path for the new dump of the request `name`.
+
+    The name is converted to be safe to use in filename, and timestamp and
+    random suffix are added, so the dumps of the same request don't collide.
+    """
+    safe_name = re.sub(r"[^\w.-]+", "_", name).strip("_") or "request"
+
+    return os.path.join(
+        profile_dir(),
+        "%s_%d_%s%s" % (
+            safe_name,
+            time.time(),
+            uuid.uuid4().hex[:8],
+            DUMP_SUFFIX,
+        )
+    )
+
+
+def _acquire_thread():
+    """
+    Mark the current OS thread as profiled.
+
+    :func:`thread.get_ident` is used instead of :class:`threading.local`,
+    because the webserver replaces it by greenlet-local storage in the
+    cooperative mode.
+
+    Returns:
+        bool: False if there already is active profile in the thread.
+    """
+    ident = thread.get_ident()
+
+    with _ACTIVE_LOCK:
+        if ident in _ACTIVE_THREADS:
+            return False
+
+        _ACTIVE_THREADS.add(ident)
+        return True
+
+
+def _release_thread():
+    with _ACTIVE_LOCK:
+        _ACTIVE_THREADS.discard(thread.get_ident())
+
+
+@contextmanager
+def profiled(name):
+    """
+    Profile the ``with`` block, if the request `name` is sampled by
+    :func:`is_sampled` and there is no other active profile in the thread.
+
+    Args:
+        name (str): Route or name of the AMQP message.
+    """
+    if not is_sampled(name) or not _acquire_thread():
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        _release_thread()
+
+        path = dump_path(name)
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:  # created by other thread in the meantime
+                pass
+
+        profile.dump_stats(path)
+
+
+def dump_paths(paths, name_filter=None):
+    """
+    Find the dumps in `paths`.
+
+    Args:
+        paths (list): Files or directories with the dumps. Missing paths
+            are ignored.
+        name_filter (str, default None): Regexp, which has to match the
+            filename of the dump.
+
+    Returns:
+        list: Sorted paths of the dump files.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(
+                os.path.join(path, filename)
+                for filename in os.listdir(path)
+                if filename.endswith(DUMP_SUFFIX)
+            )
+        elif os.path.isfile(path):
+            found.append(path)
+
+    if name_filter:
+        found = [
+            path for path in found
+            if re.search(name_filter, os.path.basename(path))
+        ]
+
+    return sorted(found)
+
+
+def load_stats(paths, name_filter=None):
+    """
+    Aggregate the dumps in `paths` to one :class:`pstats.Stats` object.
+
+    Args:
+        paths (list): Files or directories with the dumps.
+        name_filter (str, default None): See :func:`dump_paths`.
+
+    Returns:
+        tuple: ``(stats, number_of_dumps)``. `stats` is None, if there are \
+               no dumps.
+    """
+    found = dump_paths(paths, name_filter)
+    if not found:
+        return None, 0
+
+    return pstats.Stats(*found), len(found)
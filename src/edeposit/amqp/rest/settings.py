@@ -39,12 +39,45 @@ PROJECT_KEY = "edeposit_rest"  #: Don't change this!
 
 WEB_ADDR = "localhost"  #: Address where the webserver should listen.
 WEB_PORT = 8080  #: Port for the webserver.
-WEB_SERVER = 'paste'  #: Use `paste` for threading.
+WEB_SERVER = 'paste'  #: `paste` for threading, `gevent` for cooperative mode.
 WEB_DEBUG = False  #: Turn on web debug messages?
 WEB_RELOADER = False  #: Turn on reloader for webserver?
 WEB_BE_QUIET = False  #: Be quiet and don't emit debug messages to terminal.
+WEB_THREADS = 10  #: Number of worker threads (`paste` only).
+WEB_MAX_CONNECTIONS = 10000  #: Maximal open connections (`gevent` only).
+WEB_DB_POOL_SIZE = 10  #: How many threads may access the database at once.
+WEB_DB_POOL_RECYCLE = 1000  #: Reconnect thread's handlers after n requests.
+WEB_STRUCTURES_MAX_AGE = 60 * 60 * 24  #: Client cache time of /structures.
+WEB_LONG_POLL_TIMEOUT = 30  #: Maximal wait of /track/poll in seconds.
+WEB_MAX_LONG_POLLS = 5  #: Max. waiting /track/poll (`paste` only, 0 = any).
+WEB_NOTIFY_POLL_INTERVAL = 1.0  #: How often check the DB for status updates.
 
 WEB_CACHE = ""  #: Cache for the WEB upload.
+WEB_MAX_UPLOAD_SIZE = 0  #: Maximal size of uploaded file in bytes (0 = any).
+
+AUTH_CACHE_SIZE = 1024  #: How many verified logins to cache (0 = disable).
+AUTH_CACHE_TTL = 5 * 60  #: How long (in seconds) is the verification valid.
+CACHE_LEASE_TIMEOUT = 60 * 10  #: Seconds before claimed upload is requeued.
+CACHE_REFERENCE_TIMEOUT = 60 * 60  #: Same for uploads sent by reference.
+
+PACK_ENABLED = False  #: Pack the DB in this process (only one reactor!).
+PACK_INTERVAL = 60 * 60  #: Pack the garbage every n seconds (0 = never).
+PACK_GARBAGE_THRESHOLD = 1000  #: Pack after n removed objects (0 = never).
+PACK_QUIET_HOURS = ""  #: Pack only in hours like ``"1-5"`` (empty = always).
+PACK_CHECK_PERIOD = 60  #: How often (in seconds) check whether to pack.
+
+DB_CONFLICT_RETRIES = 3  #: Retry DB transactions after ConflictError n times.
+DB_CONFLICT_BACKOFF = 0.02  #: Base of the randomized backoff in seconds.
+
+METRICS_ENABLED = False  #: Serve latencies at ``/metrics`` (public, no auth!)
+
+SLOW_OPERATION_TIME = 1.0  #: Log DB calls slower than n seconds (0 = never).
+SLOW_OPERATION_LOADS = 10000  #: Log DB calls loading n objects (0 = never).
+SLOW_OPERATION_LOG = ""  #: File for the slow DB calls (empty = use logging).
+
+PROFILE_SAMPLE_RATE = 0.0  #: Part of requests to profile (0 = off, 1 = all).
+PROFILE_FILTER = ""  #: Regexp of profiled routes and AMQP messages.
+PROFILE_DIR = ""  #: Where to save the profiles (empty = temp directory).
 
 
 # User configuration reader (don't edit this) =================================
@@ -8,6 +8,9 @@ from incomming import CacheTick
 from incomming import SaveLogin
 from incomming import RemoveLogin
 from incomming import StatusUpdate
+from incomming import UploadReferenceAck
 
 from outgoing import UploadRequest
+from outgoing import UploadRequestChunk
+from outgoing import UploadRequestReference
 from outgoing import AfterDBCleanupRequest
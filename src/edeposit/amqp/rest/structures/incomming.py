@@ -48,10 +48,51 @@ class StatusUpdate(namedtuple("StatusUpdate", ["rest_id",
     """
 
 
-class CacheTick(namedtuple("CacheTick", [])):
+class CacheTick(namedtuple("CacheTick", ["max_items",
+                                         "max_bytes",
+                                         "chunk_size",
+                                         "by_reference"])):
     """
     Tick for the cached uploader, telling it that it is OK to upload one more
     request, if present.
 
+    If `max_items` or `max_bytes` is set, the cache is drained in batch and
+    all :class:`.UploadRequest` structures are sent thru `send_back` callback.
+
+    If `chunk_size` is set, the files are sent as sequences of
+    :class:`.UploadRequestChunk` structures thru `send_back` callback.
+
+    If `by_reference` is set, :class:`.UploadRequestReference` structures are
+    sent instead of the data. This may be used only by consumers, which can
+    read the cache directly.
+
     This structure may also emit the :class:`.AfterDBCleanupRequest`.
+
+    Attributes:
+        max_items (int, default None): How many requests may be sent at most.
+        max_bytes (int, default None): Limit for the sum of sizes of the sent
+            files. At least one request is always sent, even if it is bigger.
+        chunk_size (int, default None): Size of the file chunk in bytes.
+        by_reference (bool, default False): Send only references to files.
+    """
+    def __new__(cls, max_items=None, max_bytes=None, chunk_size=None,
+                by_reference=False):
+        return super(CacheTick, cls).__new__(
+            cls,
+            max_items=max_items,
+            max_bytes=max_bytes,
+            chunk_size=chunk_size,
+            by_reference=by_reference,
+        )
+
+
+class UploadReferenceAck(namedtuple("UploadReferenceAck", ["rest_id",
+                                                           "lease_id"])):
+    """
+    Acknowledgement, that the file sent in :class:`.UploadRequestReference`
+    was processed and may be removed from the cache.
+
+    Attributes:
+        rest_id (str): :attr:`.UploadRequestReference.rest_id`.
+        lease_id (str): :attr:`.UploadRequestReference.lease_id`.
     """
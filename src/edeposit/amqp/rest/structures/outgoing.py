@@ -27,6 +27,63 @@ class UploadRequest(namedtuple("UploadRequest", ["username",
     """
 
 
+class UploadRequestChunk(namedtuple("UploadRequestChunk", ["username",
+                                                           "rest_id",
+                                                           "seq",
+                                                           "chunks",
+                                                           "total_size",
+                                                           "checksum",
+                                                           "b64_data",
+                                                           "metadata"])):
+    """
+    One part of the user's upload request, used when the file is sent in
+    chunks (see :class:`.CacheTick`).
+
+    Attributes:
+        username (str): User's handle in the REST system.
+        rest_id (str): Unique identificator of the request.
+        seq (int): Sequence number of the chunk, starting from 0.
+        chunks (int): Total number of chunks.
+        total_size (int): Size of the whole (decoded) file in bytes.
+        checksum (str): SHA256 hexdigest of the whole (decoded) file.
+        b64_data (str): Content of the chunk packed as base64 data. Each chunk
+            is encoded separately.
+        metadata (dict): Dictionary with metadata. Sent only in the first
+            chunk, None in others.
+    """
+
+
+class UploadRequestReference(namedtuple("UploadRequestReference",
+                                        ["username",
+                                         "rest_id",
+                                         "checksum",
+                                         "size",
+                                         "file_path",
+                                         "bds_id",
+                                         "lease_id",
+                                         "metadata"])):
+    """
+    User's upload request, which doesn't contain the data, only the path to
+    the file in the shared cache (see :class:`.CacheTick`).
+
+    The file is kept in the cache until the :class:`.UploadReferenceAck` is
+    received. If it doesn't arrive before
+    :attr:`.settings.CACHE_REFERENCE_TIMEOUT`, the request is sent again.
+
+    Attributes:
+        username (str): User's handle in the REST system.
+        rest_id (str): Unique identificator of the request.
+        checksum (str): SHA256 hexdigest of the file.
+        size (int): Size of the file in bytes.
+        file_path (str): Absolute path to the file in the cache.
+        bds_id (str): ID of the file in the cache. More requests may share
+            the same file.
+        lease_id (str): ID of this transfer. Has to be sent back in the
+            :class:`.UploadReferenceAck`.
+        metadata (dict): Dictionary with metadata.
+    """
+
+
 class AfterDBCleanupRequest(namedtuple("AfterDBCleanupRequest", [])):
     """
     Request refill of the user-related informations after the database was
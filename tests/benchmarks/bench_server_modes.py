@@ -0,0 +1,242 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Compare the threaded (`paste`) and cooperative (`gevent`) server modes.
+
+For each mode, the webserver is started against temporary ZEO database, then
+the `--idle` connections are opened (slow clients, which never finish their
+request) and the `GET /api/v1/track` is measured with `--concurrency`
+parallel clients.
+
+Example::
+
+    python tests/benchmarks/bench_server_modes.py --idle 1000 --requests 2000
+"""
+# Imports =====================================================================
+import os
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+from zeo_connector_defaults import tmp_context_name
+from zeo_connector_defaults import generate_environment
+from zeo_connector_defaults import cleanup_environment
+
+from bench_utils import summarize
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../../src/edeposit/amqp")
+)
+
+
+# Variables ===================================================================
+USERNAME = "benchmark"
+PASSWORD = "benchmark"
+WEBSERVER_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "../../bin/edeposit_rest_webserver.py"
+)
+
+
+# Functions & classes =========================================================
+def write_settings(mode, port):
+    """
+    Write settings for the temporary ZEO database to file.
+
+    Returns:
+        str: Path to the file.
+    """
+    alt_settings = {
+        "ZEO_CLIENT_CONF_FILE": tmp_context_name("zeo_client.conf"),
+        "ZEO_SERVER_CONF_FILE": tmp_context_name("zeo.conf"),
+        "WEB_ADDR": "127.0.0.1",
+        "WEB_PORT": port,
+        "WEB_SERVER": mode,
+        "WEB_BE_QUIET": True,
+        "WEB_CACHE": tempfile.mkdtemp(),
+    }
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.write(json.dumps(alt_settings))
+
+    return f.name
+
+
+def create_user():
+    """
+    Register the :attr:`USERNAME` in the database.
+    """
+    # settings are read at import and they have to point to temporary ZEO
+    from rest.database import UserHandler
+    from rest.database.user_handler import create_hash
+
+    UserHandler(conf_path=tmp_context_name("zeo_client.conf")).add_user(
+        USERNAME,
+        create_hash(PASSWORD),
+    )
+
+
+def start_server(mode, port):
+    """
+    Start the webserver in `mode` and wait until it responds.
+
+    Returns:
+        tuple: ``(process, settings_path)``.
+    """
+    settings_path = write_settings(mode, port)
+
+    env = dict(os.environ, SETTINGS_PATH=settings_path)
+    process = subprocess.Popen([sys.executable, WEBSERVER_PATH], env=env)
+
+    url = "http://127.0.0.1:%d/" % port
+    for _ in range(30):
+        try:
+            requests.get(url, timeout=1).raise_for_status()
+            return process, settings_path
+        except Exception:
+            time.sleep(0.5)
+
+    process.terminate()
+    raise IOError("Server in mode `%s` didn't start." % mode)
+
+
+def open_idle_connections(port, count):
+    """
+    Open `count` connections, which send only part of the request headers.
+
+    Returns:
+        list: Sockets.
+    """
+    connections = []
+    for _ in range(count):
+        try:
+            sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+            sock.sendall("GET /api/v1/track HTTP/1.1\r\nHost: localhost\r\n")
+            connections.append(sock)
+        except socket.error:
+            break
+
+    return connections
+
+
+def measure(url, requests_count, concurrency):
+    """
+    Send `requests_count` GET requests to `url` from `concurrency` threads.
+
+    Returns:
+        dict: Throughput, latency percentiles and number of errors.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    auth = HTTPBasicAuth(USERNAME, PASSWORD)
+    per_thread = requests_count // concurrency
+
+    def client():
+        session = requests.Session()
+        for _ in range(per_thread):
+            start = time.time()
+            try:
+                session.get(url, auth=auth, timeout=30).raise_for_status()
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+
+            with lock:
+                latencies.append(time.time() - start)
+
+    start = time.time()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start
+
+    return summarize(latencies, errors[0], duration)
+
+
+def bench_mode(mode, args):
+    """
+    Run the benchmark for one server `mode`.
+
+    Returns:
+        dict: Results from :func:`measure` with the number of idle
+              connections.
+    """
+    port = random.randint(20000, 60000)
+    process, settings_path = start_server(mode, port)
+
+    try:
+        idle = open_idle_connections(port, args.idle)
+        result = measure(
+            "http://127.0.0.1:%d/api/v1/track" % port,
+            args.requests,
+            args.concurrency,
+        )
+        result["idle_connections"] = len(idle)
+
+        for sock in idle:
+            sock.close()
+
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+        os.unlink(settings_path)
+
+
+# Main program ================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--modes",
+        default="paste,gevent",
+        help="Comma separated server modes. Default `paste,gevent`."
+    )
+    parser.add_argument(
+        "--idle",
+        type=int,
+        default=500,
+        help="Number of idle connections. Default 500."
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=1000,
+        help="Number of measured requests. Default 1000."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=10,
+        help="Number of parallel clients. Default 10."
+    )
+    args = parser.parse_args()
+
+    generate_environment()
+    try:
+        os.environ["SETTINGS_PATH"] = write_settings("paste", 0)
+        create_user()
+
+        results = {
+            mode: bench_mode(mode, args)
+            for mode in args.modes.split(",")
+        }
+    finally:
+        cleanup_environment()
+
+    print json.dumps(results, indent=4, sort_keys=True)
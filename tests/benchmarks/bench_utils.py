@@ -0,0 +1,194 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Shared functions of the benchmarks - running the measured calls in threads
+and worker processes, summarizing the latencies and comparing the results
+with the baseline.
+"""
+# Imports =====================================================================
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+
+
+# Variables ===================================================================
+REACTOR_WORKER_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "reactor_worker.py"
+)
+
+
+# Functions & classes =========================================================
+def percentile(values, percent):
+    """
+    Return `percent` percentile of the sorted `values`.
+    """
+    if not values:
+        return None
+
+    index = int(round((len(values) - 1) * percent / 100.0))
+    return values[index]
+
+
+def summarize(latencies, errors, duration):
+    """
+    Compute throughput and latency percentiles.
+
+    Args:
+        latencies (list): Latencies of the successful calls in seconds.
+        errors (int): Number of failed calls.
+        duration (float): Wall-clock time of the whole run.
+
+    Returns:
+        dict: ``{"requests": int, "errors": int, "duration": float, \
+              "throughput": float, "p50": float, "p95": float, \
+              "p99": float}``.
+    """
+    latencies = sorted(latencies)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration": duration,
+        "throughput": len(latencies) / duration if duration else 0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def run_threads(fn, count, concurrency):
+    """
+    Call `fn` `count` times from `concurrency` threads.
+
+    Args:
+        fn (fn): Function taking the sequence number of the call. Exception
+            counts as error.
+        count (int): Number of calls.
+        concurrency (int): Number of threads.
+
+    Returns:
+        dict: Result of :func:`summarize`.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(thread_no):
+        for call_no in xrange(thread_no, count, concurrency):
+            start = time.time()
+            try:
+                fn(call_no)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+
+            with lock:
+                latencies.append(time.time() - start)
+
+    threads = [
+        threading.Thread(target=worker, args=(thread_no,))
+        for thread_no in xrange(concurrency)
+    ]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return summarize(latencies, errors[0], time.time() - start)
+
+
+def run_reactor_workers(jobs, settings_path):
+    """
+    Run each job in separate `reactor_worker.py` process, same as with more
+    AMQP consumers.
+
+    The measurement starts after all workers imported the modules and
+    connected to the database.
+
+    Args:
+        jobs (list): Dicts describing the work for the workers. See
+            `reactor_worker.py`.
+        settings_path (str): Path to the settings of the workers.
+
+    Returns:
+        dict: Result of :func:`summarize`.
+    """
+    env = dict(os.environ, SETTINGS_PATH=settings_path)
+    workers = [
+        subprocess.Popen(
+            [sys.executable, REACTOR_WORKER_PATH],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+        for _ in jobs
+    ]
+
+    try:
+        for worker in workers:
+            if worker.stdout.readline().strip() != "ready":
+                raise IOError("Reactor worker failed to start.")
+
+        for worker, job in zip(workers, jobs):
+            worker.stdin.write(json.dumps(job) + "\n")
+            worker.stdin.flush()
+
+        results = [json.loads(worker.stdout.readline()) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+
+    return summarize(
+        latencies=sum((result["latencies"] for result in results), []),
+        errors=sum(result["errors"] for result in results),
+        duration=(
+            max(result["end"] for result in results) -
+            min(result["start"] for result in results)
+        ),
+    )
+
+
+def compare(result, baseline, tolerance):
+    """
+    Compare `result` of one benchmark with its `baseline`.
+
+    Args:
+        result (dict): Result of :func:`summarize`.
+        baseline (dict): Result of the same benchmark from the baseline run.
+        tolerance (float): Allowed relative slowdown, ``0.2`` = 20%.
+
+    Returns:
+        list: Descriptions of the regressions. Empty if there is none.
+    """
+    regressions = []
+
+    old_throughput = baseline.get("throughput")
+    if old_throughput and \
+       result["throughput"] < old_throughput * (1 - tolerance):
+        regressions.append(
+            "throughput %.1f/s < baseline %.1f/s" % (
+                result["throughput"],
+                old_throughput,
+            )
+        )
+
+    for key in ("p50", "p95", "p99"):
+        old_latency = baseline.get(key)
+        if old_latency and result[key] is not None and \
+           result[key] > old_latency * (1 + tolerance):
+            regressions.append(
+                "%s %.4fs > baseline %.4fs" % (key, result[key], old_latency)
+            )
+
+    return regressions
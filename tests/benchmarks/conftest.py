@@ -0,0 +1,149 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import sys
+import json
+import time
+import platform
+
+import pytest
+
+from bench_utils import compare
+
+
+# Variables ===================================================================
+USERNAME = "benchmark"
+PASSWORD = "benchmark"
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Functions & classes =========================================================
+class BenchmarkRecorder(object):
+    """
+    Collect results of the benchmarks and compare them with the baseline.
+
+    Attributes:
+        options (dict): Options of the run.
+        baseline (dict): Results of the baseline run, or None.
+        tolerance (float): Allowed relative slowdown.
+        results (dict): Results of the benchmarks by name.
+        regressions (dict): Lists of regressions by name of the benchmark.
+    """
+    def __init__(self, options, baseline=None, tolerance=0.2):
+        self.options = options
+        self.baseline = baseline
+        self.tolerance = tolerance
+
+        self.results = {}
+        self.regressions = {}
+
+    def record(self, name, result):
+        """
+        Save `result` of the benchmark `name`.
+
+        Returns:
+            list: Regressions against the baseline.
+        """
+        self.results[name] = result
+
+        baseline_results = (self.baseline or {}).get("results", {})
+        if name not in baseline_results:
+            return []
+
+        regressions = compare(result, baseline_results[name], self.tolerance)
+        if regressions:
+            self.regressions[name] = regressions
+
+        return regressions
+
+    def to_dict(self):
+        return {
+            "created": time.time(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "options": self.options,
+            "results": self.results,
+            "regressions": self.regressions,
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4, sort_keys=True)
+
+
+def _file_sizes(config):
+    return [
+        int(size)
+        for size in config.getoption("--benchmark-file-sizes").split(",")
+    ]
+
+
+# Hooks =======================================================================
+def pytest_generate_tests(metafunc):
+    if "file_size" in metafunc.fixturenames:
+        metafunc.parametrize("file_size", _file_sizes(metafunc.config))
+
+
+def pytest_collection_modifyitems(config, items):
+    """
+    Skip the benchmarks already at the collection, so the session fixtures
+    (benchmark user, results file) are not set up without ``--benchmark``.
+    """
+    if config.getoption("--benchmark"):
+        return
+
+    skip = pytest.mark.skip(reason="Benchmarks are run only with --benchmark.")
+    for item in items:
+        if str(item.fspath).startswith(BENCHMARK_DIR + os.sep):
+            item.add_marker(skip)
+
+
+# Fixtures ====================================================================
+@pytest.fixture(scope="session")
+def bench_options(request):
+    config = request.config
+
+    return {
+        "requests": config.getoption("--benchmark-requests"),
+        "concurrency": config.getoption("--benchmark-concurrency"),
+        "file_sizes": _file_sizes(config),
+    }
+
+
+@pytest.fixture(scope="session")
+def bench_recorder(request, bench_options):
+    config = request.config
+
+    baseline = None
+    baseline_path = config.getoption("--benchmark-baseline")
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    recorder = BenchmarkRecorder(
+        options=bench_options,
+        baseline=baseline,
+        tolerance=config.getoption("--benchmark-tolerance"),
+    )
+
+    output_path = config.getoption("--benchmark-output")
+    request.addfinalizer(lambda: recorder.save(output_path))
+
+    return recorder
+
+
+@pytest.fixture(scope="session")
+def bench_user(client_conf_path):
+    from rest.database import UserHandler
+    from rest.database.user_handler import create_hash
+
+    UserHandler(conf_path=client_conf_path).add_user(
+        USERNAME,
+        create_hash(PASSWORD),
+    )
+
+    return USERNAME, PASSWORD
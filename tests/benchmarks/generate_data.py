@@ -0,0 +1,343 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Fill the ZEO database with synthetic users, trackings and queued uploads.
+
+Objects are written in transactions of `--batch-size` objects using the same
+code as the handlers, so all the indexes are consistent. Passwords of all
+users share one bcrypt hash, because hashing each of them would take hours.
+
+Distributions are given as ``kind:param[:param]``:
+
+    - ``const:N`` - always `N`
+    - ``uniform:A:B`` - integer from `A` to `B`
+    - ``lognormal:MU:SIGMA`` - :func:`random.lognormvariate`
+    - ``pareto:ALPHA`` - :func:`random.paretovariate`, heavy tail
+
+Example::
+
+    python tests/benchmarks/generate_data.py --users 1000 \\
+        --trackings 1000000 --uploads 10000 --messages uniform:1:12 \\
+        --file-size lognormal:10:2 --owner pareto:1.16
+"""
+# Imports =====================================================================
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+import transaction
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../../src/edeposit/amqp")
+)
+
+from rest import settings
+from rest.database import UserHandler
+from rest.database import CacheHandler
+from rest.database import StatusHandler
+from rest.database import store_file
+from rest.database.user_handler import create_hash
+from rest.database.cache_handler import UploadRequest
+
+
+# Variables ===================================================================
+DAY = 60 * 60 * 24
+
+MESSAGES = [
+    u"Publikace byla přijata ke zpracování.",
+    u"Metadata byla odeslána do Alephu.",
+    u"Bylo přiděleno ISBN.",
+    u"Publikace čeká na kontrolu zpracovatelem.",
+    u"Byl vytvořen záznam v Krameriu.",
+    u"Publikace byla zpřístupněna.",
+    u"Chyba při zpracování souboru, zkouším znovu.",
+]
+
+
+# Functions & classes =========================================================
+def parse_distribution(spec):
+    """
+    Convert `spec` to function generating non-negative integers.
+
+    Args:
+        spec (str): Distribution in the format described in the module
+            docstring.
+
+    Raises:
+        ValueError: If the `spec` is not valid.
+
+    Returns:
+        fn: Function without parameters.
+    """
+    kind, _, params = spec.partition(":")
+    try:
+        params = [float(param) for param in params.split(":") if param]
+    except ValueError:
+        raise ValueError("Invalid parameters of distribution `%s`." % spec)
+
+    generators = {
+        "const": (1, lambda n: n),
+        "uniform": (2, lambda a, b: random.randint(int(a), int(b))),
+        "lognormal": (2, random.lognormvariate),
+        "pareto": (1, random.paretovariate),
+    }
+    if kind not in generators:
+        raise ValueError("Unknown distribution `%s`." % kind)
+
+    param_count, generator = generators[kind]
+    if len(params) != param_count:
+        raise ValueError(
+            "Distribution `%s` takes %d parameters." % (kind, param_count)
+        )
+
+    return lambda: max(0, int(generator(*params)))
+
+
+def batches(count, batch_size):
+    """
+    Split `count` to ranges of `batch_size`.
+
+    Yields:
+        xrange: Ranges of indexes.
+    """
+    for start in xrange(0, count, batch_size):
+        yield xrange(start, min(start + batch_size, count))
+
+
+def commit_batches(handler, count, batch_size, add_fn, name):
+    """
+    Call `add_fn` with each index from ``0`` to `count` in transactions of
+    `batch_size` calls, and report the progress to stderr.
+
+    Args:
+        handler (obj): Database handler, which cache is minimized after each
+            batch to keep the memory usage constant.
+        count (int): Number of objects.
+        batch_size (int): Objects in one transaction.
+        add_fn (fn): Function taking the index of the object.
+        name (str): Name of the objects in the progress messages.
+    """
+    start = time.time()
+    done = 0
+
+    for indexes in batches(count, batch_size):
+        with transaction.manager:
+            for index in indexes:
+                add_fn(index)
+
+        handler.zeo._connection.cacheMinimize()
+
+        done += len(indexes)
+        duration = time.time() - start
+        sys.stderr.write(
+            "\r%s: %d/%d (%.0f/s)" % (
+                name,
+                done,
+                count,
+                done / duration if duration else 0,
+            )
+        )
+
+    sys.stderr.write("\n")
+
+
+def username(index):
+    return "user_%d" % index
+
+
+def random_id():
+    """
+    Return ID in the format of :func:`uuid.uuid4`, but generated by the
+    seeded :mod:`random`.
+    """
+    return "%032x" % random.getrandbits(128)
+
+
+def generate_users(conf_path, args):
+    """
+    Add `args.users` users with the same `args.password`.
+    """
+    user_db = UserHandler(conf_path=conf_path)
+    pw_hash = create_hash(args.password)
+
+    def add_user(index):
+        user_db.users[username(index)] = pw_hash
+
+    commit_batches(user_db, args.users, args.batch_size, add_user, "users")
+
+
+def generate_trackings(conf_path, args):
+    """
+    Register `args.trackings` :class:`.StatusInfo` objects with the history
+    of messages to the users picked by `args.owner` distribution.
+    """
+    status_db = StatusHandler(conf_path=conf_path)
+    owner = parse_distribution(args.owner)
+    messages = parse_distribution(args.messages)
+    now = time.time()
+
+    def add_tracking(index):
+        registered_ts = now - random.uniform(0, args.age * DAY)
+        status_info = status_db._register_status_tracking(
+            username=username(owner() % args.users),
+            rest_id=random_id(),
+            registered_ts=registered_ts,
+        )
+        status_info.book_name = "Publikace %d" % index
+
+        timestamp = registered_ts
+        for _ in xrange(messages()):
+            timestamp = min(now, timestamp + random.expovariate(1.0 / DAY))
+            status_info.add_message(random.choice(MESSAGES), timestamp)
+            status_info.bump_version()
+
+    commit_batches(
+        status_db,
+        args.trackings,
+        args.batch_size,
+        add_tracking,
+        "trackings",
+    )
+
+
+def generate_uploads(conf_path, args):
+    """
+    Queue `args.uploads` :class:`.UploadRequest` objects with random files of
+    `args.file_size` sizes. Every `args.duplicates`-th file is shared with
+    the previous request.
+    """
+    cache_db = CacheHandler(conf_path=conf_path)
+    file_size = parse_distribution(args.file_size)
+    now = time.time()
+    last_bds_id = [None]
+
+    def add_upload(index):
+        bds_id = last_bds_id[0]
+        if bds_id is None or not args.duplicates or \
+           index % args.duplicates:
+            with tempfile.TemporaryFile() as file_obj:
+                file_obj.write(os.urandom(file_size()))
+                bds_id = store_file(file_obj, args.cache_dir)
+
+        upload_request = UploadRequest(
+            username=username(random.randrange(args.users)),
+            rest_id=random_id(),
+            metadata={"title": "Publikace %d" % index},
+            cache_dir=args.cache_dir,
+            bds_id=bds_id,
+        )
+        upload_request.created = now - random.uniform(0, args.age * DAY)
+        cache_db._add_upload_request(upload_request)
+
+        last_bds_id[0] = bds_id
+
+    commit_batches(
+        cache_db,
+        args.uploads,
+        args.batch_size,
+        add_upload,
+        "uploads",
+    )
+
+
+# Main program ================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--conf-path",
+        default=settings.ZEO_CLIENT_CONF_FILE,
+        help="ZEO client configuration. Default from the settings."
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=settings.WEB_CACHE,
+        help="Directory for the files. Default from the settings."
+    )
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=100,
+        help="Number of users. Default 100."
+    )
+    parser.add_argument(
+        "--password",
+        default="password",
+        help="Password of all users. Default `password`."
+    )
+    parser.add_argument(
+        "--trackings",
+        type=int,
+        default=10000,
+        help="Number of tracked publications. Default 10000."
+    )
+    parser.add_argument(
+        "--messages",
+        default="uniform:1:10",
+        help="Status messages per tracking. Default `uniform:1:10`."
+    )
+    parser.add_argument(
+        "--owner",
+        default="pareto:1.16",
+        help="Index of the owner of the tracking (modulo --users). Default "
+             "`pareto:1.16` (few users own most of the trackings)."
+    )
+    parser.add_argument(
+        "--age",
+        type=float,
+        default=365,
+        help="Maximal age of the objects in days. Default 365."
+    )
+    parser.add_argument(
+        "--uploads",
+        type=int,
+        default=1000,
+        help="Number of queued uploads. Default 1000."
+    )
+    parser.add_argument(
+        "--file-size",
+        default="lognormal:9:1.5",
+        help="Size of the uploaded files in bytes. Default `lognormal:9:1.5` "
+             "(median 8kB)."
+    )
+    parser.add_argument(
+        "--duplicates",
+        type=int,
+        default=0,
+        help="Share the file with previous upload for each n-th upload. "
+             "Default 0 (never)."
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Objects in one transaction. Default 1000."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the distributions, for reproducible data."
+    )
+    args = parser.parse_args()
+
+    for spec in (args.messages, args.owner, args.file_size):
+        try:
+            parse_distribution(spec)
+        except ValueError as e:
+            parser.error(e.message)
+
+    if args.users <= 0 and (args.trackings or args.uploads):
+        parser.error("--trackings and --uploads require some --users.")
+
+    random.seed(args.seed)
+
+    generate_users(args.conf_path, args)
+    generate_trackings(args.conf_path, args)
+    generate_uploads(args.conf_path, args)
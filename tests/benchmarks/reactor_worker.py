@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Worker process of the reactor benchmarks, which behaves as one AMQP consumer.
+
+Settings are read from ``SETTINGS_PATH``. The worker prints ``ready`` after
+the start, then reads one line with the JSON job from stdin::
+
+    {"kind": "status_update", "count": 100, "rest_ids": ["..", ..]}
+    {"kind": "cache_tick", "count": 100}
+
+and prints one line with JSON result::
+
+    {"latencies": [..], "errors": 0, "start": 1.0, "end": 2.0}
+"""
+# Imports =====================================================================
+import os
+import sys
+import json
+import time
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../../src/edeposit/amqp")
+)
+
+import rest
+
+
+# Functions & classes =========================================================
+def status_update_messages(job):
+    """
+    Generate :class:`.StatusUpdate` messages for the `rest_ids` of the `job`.
+    """
+    rest_ids = job["rest_ids"]
+
+    for i in xrange(job["count"]):
+        yield rest.StatusUpdate(
+            rest_id=rest_ids[i % len(rest_ids)],
+            timestamp=time.time(),
+            message="Benchmark update %d." % i,
+            pub_url=None,
+            book_name=None,
+        )
+
+
+def cache_tick_messages(job):
+    """
+    Generate :class:`.CacheTick` messages, each pops one upload.
+    """
+    for _ in xrange(job["count"]):
+        yield rest.CacheTick()
+
+
+MESSAGES = {
+    "status_update": status_update_messages,
+    "cache_tick": cache_tick_messages,
+}
+
+#: Handlers used by the messages, connected before the measurement.
+MESSAGE_HANDLERS = [
+    rest._UserHandler,
+    rest._CacheHandler,
+    rest._StatusHandler,
+]
+
+
+def run_job(job):
+    """
+    Send messages of the `job` to :func:`rest.reactToAMQPMessage`.
+
+    Returns:
+        dict: Latencies, number of errors and start and end of the run.
+    """
+    latencies = []
+    errors = 0
+
+    start = time.time()
+    for message in MESSAGES[job["kind"]](job):
+        message_start = time.time()
+        try:
+            rest.reactToAMQPMessage(message, lambda x: x)
+        except Exception:
+            errors += 1
+            continue
+
+        latencies.append(time.time() - message_start)
+
+    return {
+        "latencies": latencies,
+        "errors": errors,
+        "start": start,
+        "end": time.time(),
+    }
+
+
+# Main program ================================================================
+if __name__ == '__main__':
+    # open the ZEO connections before the measurement
+    for handler_cls in MESSAGE_HANDLERS:
+        rest._handler(handler_cls)
+
+    print "ready"
+    sys.stdout.flush()
+
+    job = json.loads(sys.stdin.readline())
+    print json.dumps(run_job(job))
+    sys.stdout.flush()
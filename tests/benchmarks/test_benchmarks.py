@@ -0,0 +1,148 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Benchmarks of the REST API and the AMQP reactor. Run them with::
+
+    ./run_tests.sh tests/benchmarks --benchmark --benchmark-concurrency 8
+
+Results are saved to ``--benchmark-output`` and, when ``--benchmark-baseline``
+is given, compared with the previous results.
+"""
+# Imports =====================================================================
+import os
+import json
+import uuid
+import tempfile
+import urlparse
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+from rest.database import CacheHandler
+from rest.database import StatusHandler
+from rest.database.cache_handler import UploadRequest
+
+from bench_utils import run_threads
+from bench_utils import run_reactor_workers
+
+
+# Variables ===================================================================
+METADATA = {
+    "nazev": "Benchmark",
+    "poradi_vydani": "1",
+    "misto_vydani": "Praha",
+    "rok_vydani": "2016",
+    "zpracovatel_zaznamu": "/benchmark",
+    "nazev_souboru": "benchmark.pdf",
+}
+
+
+# Functions ===================================================================
+def check_result(recorder, name, result):
+    regressions = recorder.record(name, result)
+
+    assert not result["errors"], "%d calls failed" % result["errors"]
+    assert not regressions, "; ".join(regressions)
+
+
+# Tests =======================================================================
+def test_bench_submit(web_api_url, bench_user, bench_options, bench_recorder,
+                      file_size):
+    url = urlparse.urljoin(web_api_url, "submit")
+    auth = HTTPBasicAuth(*bench_user)
+    data = os.urandom(file_size)
+
+    def submit(call_no):
+        metadata = dict(METADATA, nazev="Benchmark %d" % call_no)
+
+        requests.post(
+            url,
+            data={"json_metadata": json.dumps(metadata)},
+            files={"file": ("benchmark.pdf", data)},
+            auth=auth,
+            timeout=60,
+        ).raise_for_status()
+
+    result = run_threads(
+        submit,
+        bench_options["requests"],
+        bench_options["concurrency"],
+    )
+
+    check_result(bench_recorder, "submit_%d" % file_size, result)
+
+
+def test_bench_track(web_api_url, bench_user, bench_options, bench_recorder):
+    url = urlparse.urljoin(web_api_url, "track")
+    auth = HTTPBasicAuth(*bench_user)
+
+    def track(call_no):
+        requests.get(url, auth=auth, timeout=60).raise_for_status()
+
+    result = run_threads(
+        track,
+        bench_options["requests"],
+        bench_options["concurrency"],
+    )
+
+    check_result(bench_recorder, "track", result)
+
+
+def test_bench_status_update(client_conf_path, alt_conf_path, bench_user,
+                             bench_options, bench_recorder):
+    username = bench_user[0]
+    concurrency = bench_options["concurrency"]
+    status_db = StatusHandler(conf_path=client_conf_path)
+
+    rest_ids = [str(uuid.uuid4()) for _ in xrange(concurrency * 10)]
+    for rest_id in rest_ids:
+        status_db.register_status_tracking(username, rest_id)
+
+    # each consumer updates different trackings
+    jobs = [
+        {
+            "kind": "status_update",
+            "count": bench_options["requests"] // concurrency,
+            "rest_ids": rest_ids[worker_no::concurrency],
+        }
+        for worker_no in xrange(concurrency)
+    ]
+
+    result = run_reactor_workers(jobs, alt_conf_path)
+
+    check_result(bench_recorder, "amqp_status_update", result)
+
+
+def test_bench_cache_tick(client_conf_path, alt_conf_path, tmpdir,
+                          bench_user, bench_options, bench_recorder,
+                          file_size):
+    concurrency = bench_options["concurrency"]
+    count = bench_options["requests"] // concurrency * concurrency
+    cache_db = CacheHandler(conf_path=client_conf_path)
+
+    for _ in xrange(count):
+        with tempfile.TemporaryFile() as file_obj:
+            file_obj.write(os.urandom(file_size))
+            file_obj.seek(0)
+
+            cache_db.add_upload_request(
+                UploadRequest(
+                    username=bench_user[0],
+                    rest_id=str(uuid.uuid4()),
+                    metadata={"title": "Benchmark"},
+                    file_obj=file_obj,
+                    cache_dir=str(tmpdir),
+                )
+            )
+
+    jobs = [
+        {"kind": "cache_tick", "count": count // concurrency}
+        for _ in xrange(concurrency)
+    ]
+
+    result = run_reactor_workers(jobs, alt_conf_path)
+
+    check_result(bench_recorder, "amqp_cache_tick_%d" % file_size, result)
@@ -53,6 +53,7 @@ def _create_alt_settings(client_path, server_path):
         "WEB_RELOADER": True,
         "WEB_BE_QUIET": True,
         "WEB_CACHE": "/tmp",
+        "METRICS_ENABLED": True,
     }
 
     with tempfile.NamedTemporaryFile(delete=False) as f:
@@ -60,6 +61,50 @@ def _create_alt_settings(client_path, server_path):
         return f.name
 
 
+# Hooks =======================================================================
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark", "benchmarks in tests/benchmarks")
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="Run the benchmarks, they are skipped otherwise.",
+    )
+    group.addoption(
+        "--benchmark-requests",
+        type=int,
+        default=200,
+        help="Number of measured calls of each benchmark. Default 200.",
+    )
+    group.addoption(
+        "--benchmark-concurrency",
+        type=int,
+        default=4,
+        help="Number of parallel clients / AMQP consumers. Default 4.",
+    )
+    group.addoption(
+        "--benchmark-file-sizes",
+        default="1024,1048576",
+        help="Comma separated sizes of uploaded files. Default 1kB,1MB.",
+    )
+    group.addoption(
+        "--benchmark-output",
+        default="benchmark_results.json",
+        help="Where to save the results. Default benchmark_results.json.",
+    )
+    group.addoption(
+        "--benchmark-baseline",
+        default=None,
+        help="Results of previous run to compare with.",
+    )
+    group.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown against the baseline. Default 0.2 (20%%).",
+    )
+
+
 # Setup =======================================================================
 @pytest.fixture(scope="session", autouse=True)
 def zeo(request):
@@ -4,18 +4,31 @@
 # Interpreter version: python 2.7
 #
 # Imports =====================================================================
+import stat
+import fcntl
 import random
 import string
 import os.path
+import hashlib
+import threading
+from StringIO import StringIO
 
 import pytest
+import transaction
+from ZODB.POSException import ConflictError
 
 from BalancedDiscStorage import BalancedDiscStorage
 
 from rest import settings
 
+from rest.database import cache_handler as cache_handler_module
+from rest.database import transaction_manager as tm_module
 from rest.database.cache_handler import CacheHandler
+from rest.database.cache_handler import store_file
+from rest.database.cache_handler import cache_lock
+from rest.database.cache_handler import write_temp_file
 from rest.database.cache_handler import UploadRequest
+from rest.database.cache_handler import UploadTooLargeException
 
 
 # Functions ===================================================================
@@ -37,7 +50,7 @@ def upload_request(tmpdir_factory):
 
     return UploadRequest(
         username="someuser",
-        rest_id="rest_id",
+        rest_id=random_string(10),
         metadata={"meta": "data"},
         file_obj=open(file_path),
         cache_dir=str(tmpdir_factory.mktemp("bds")),
@@ -91,3 +104,375 @@ def test_CacheHandler(cache_handler, upload_request):
     assert cache_handler.is_empty()
     assert not cache_handler
     assert not cache_handler.pop()
+
+
+def test_CacheHandler_pop_batch_manager(cache_handler, tmpdir_factory):
+    upload_requests = [upload_request(tmpdir_factory) for _ in range(3)]
+    for request in upload_requests:
+        cache_handler.add_upload_request(request)
+
+    with cache_handler.pop_batch_manager(max_items=2) as batch:
+        assert batch == upload_requests[:2]
+
+    assert len(cache_handler) == 1
+
+    with cache_handler.pop_batch_manager(max_bytes=1) as batch:
+        assert batch == upload_requests[2:]
+
+    assert cache_handler.is_empty()
+
+    with cache_handler.pop_batch_manager(max_items=10) as batch:
+        assert batch == []
+
+
+def test_CacheHandler_rebuild_index(cache_handler, tmpdir_factory):
+    first = upload_request(tmpdir_factory)
+    second = upload_request(tmpdir_factory)
+
+    cache_handler.add_upload_request(second)
+    cache_handler.add_upload_request(first)
+
+    with transaction.manager:
+        cache_handler.created_index.clear()
+
+    cache_handler.rebuild_index()
+
+    assert cache_handler.top() == first
+    assert cache_handler.pop() == first
+    assert cache_handler.pop() == second
+    assert cache_handler.is_empty()
+
+
+def test_CacheHandler_leases(cache_handler, tmpdir_factory):
+    first = upload_request(tmpdir_factory)
+    second = upload_request(tmpdir_factory)
+
+    cache_handler.add_upload_request(first)
+    cache_handler.add_upload_request(second)
+
+    leases = cache_handler.claim(max_items=1)
+    assert [lease.upload_request for lease in leases] == [first]
+
+    # claimed item is invisible for other consumers
+    assert cache_handler.top() == second
+    second_leases = cache_handler.claim(max_items=5)
+    assert [lease.upload_request for lease in second_leases] == [second]
+    assert cache_handler.claim() == []
+
+    assert cache_handler.release(leases) == 1
+    assert cache_handler.top() == first
+
+    # expired leases are returned back to queue
+    expired_leases = cache_handler.claim(timeout=-1)
+    leases = cache_handler.claim()
+    assert [lease.upload_request for lease in leases] == [first]
+
+    # lost lease can't be acknowledged
+    assert cache_handler.ack(expired_leases) == 0
+
+    assert cache_handler.ack(leases + second_leases) == 2
+    assert cache_handler.is_empty()
+
+
+def test_CacheHandler_pop_requeues_expired(cache_handler, tmpdir_factory):
+    request = upload_request(tmpdir_factory)
+    cache_handler.add_upload_request(request)
+
+    # expired lease is visible to `top()` and `pop()` without `claim()`
+    expired_leases = cache_handler.claim(timeout=-1)
+    assert [lease.upload_request for lease in expired_leases] == [request]
+
+    assert cache_handler.top() == request
+    assert cache_handler.pop() == request
+    assert cache_handler.ack(expired_leases) == 0
+
+    cache_handler.remove_file(request)
+    assert cache_handler.is_empty()
+
+
+def test_CacheHandler_queue_stats(cache_handler, tmpdir_factory):
+    before = cache_handler.queue_stats()
+
+    first = upload_request(tmpdir_factory)
+    second = upload_request(tmpdir_factory)
+    cache_handler.add_upload_request(first)
+    cache_handler.add_upload_request(second)
+
+    leases = cache_handler.claim(max_items=1)
+    stats = cache_handler.queue_stats()
+
+    assert stats["queued"] == before["queued"] + 1
+    assert stats["claimed"] == before["claimed"] + 1
+    assert stats["oldest_age"] >= 0
+
+    # counters are kept in sync with the indexes
+    cache_handler.rebuild_index()
+    assert cache_handler.queue_stats()["queued"] == stats["queued"]
+    assert cache_handler.queue_stats()["claimed"] == stats["claimed"]
+
+    cache_handler.ack(leases)
+    cache_handler.ack(cache_handler.claim(max_items=stats["queued"]))
+
+    assert cache_handler.queue_stats()["queued"] == 0
+
+
+def test_CacheHandler_ack_by_id(cache_handler, tmpdir_factory):
+    request = upload_request(tmpdir_factory)
+    cache_handler.add_upload_request(request)
+
+    lease = cache_handler.claim()[0]
+    file_path = request.get_file_path()
+
+    assert cache_handler.ack_by_id([(request.rest_id, "unknown lease")]) == 0
+    assert os.path.exists(file_path)
+
+    assert cache_handler.ack_by_id([(request.rest_id, lease.lease_id)]) == 1
+    assert not os.path.exists(file_path)
+    assert cache_handler.is_empty()
+
+
+def test_CacheHandler_add_is_retried(cache_handler, tmpdir_factory,
+                                    monkeypatch):
+    request = upload_request(tmpdir_factory)
+    add_upload_request = cache_handler._add_upload_request
+    calls = []
+
+    def conflicting_add(new_request):
+        calls.append(new_request.rest_id)
+        if len(calls) == 1:
+            raise ConflictError()
+
+        return add_upload_request(new_request)
+
+    monkeypatch.setattr(settings, "DB_CONFLICT_BACKOFF", 0.001)
+    monkeypatch.setattr(cache_handler, "_add_upload_request", conflicting_add)
+
+    cache_handler.add_upload_request(request)
+
+    assert calls == [request.rest_id, request.rest_id]
+    assert request.rest_id in cache_handler.cache
+
+    cache_handler.ack(cache_handler.claim(max_items=len(cache_handler)))
+
+
+def test_CacheHandler_add_temp_file_backoff_is_unlocked(cache_handler,
+                                                        tmpdir_factory,
+                                                        monkeypatch):
+    cache_dir = str(tmpdir_factory.mktemp("bds"))
+    tmp_path, bds_id = write_temp_file(StringIO("data"), cache_dir=cache_dir)
+
+    add_upload_request = cache_handler._add_upload_request
+    calls = []
+
+    def conflicting_add(new_request):
+        calls.append(new_request.rest_id)
+        if len(calls) == 1:
+            raise ConflictError()
+
+        return add_upload_request(new_request)
+
+    lock_is_free = []
+
+    def backoff(attempt):
+        with open(os.path.join(cache_dir, ".lock"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                lock_is_free.append(False)
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_is_free.append(True)
+
+        return 0
+
+    monkeypatch.setattr(tm_module, "backoff", backoff)
+    monkeypatch.setattr(cache_handler, "_add_upload_request", conflicting_add)
+
+    request = cache_handler.add_temp_file(
+        username="someuser",
+        rest_id="retried_temp_file",
+        metadata={},
+        tmp_path=tmp_path,
+        bds_id=bds_id,
+        cache_dir=cache_dir,
+    )
+    monkeypatch.undo()
+
+    assert lock_is_free == [True]
+    assert not os.path.exists(tmp_path)
+    with request.get_file_obj() as f:
+        assert f.read() == "data"
+
+    cache_handler.ack(cache_handler.claim(max_items=len(cache_handler)))
+
+
+def test_CacheHandler_garbage_is_counted_after_commit(cache_handler,
+                                                      tmpdir_factory,
+                                                      monkeypatch):
+    cache_handler.add_upload_request(upload_request(tmpdir_factory))
+    leases = cache_handler.claim()
+
+    garbage = []
+    calls = []
+    remove_upload_request = cache_handler._remove_upload_request
+
+    def raise_conflict():
+        raise ConflictError()
+
+    def conflicting_remove(removed_request):
+        calls.append(removed_request.rest_id)
+
+        # the first commit fails, after the request was already removed
+        if len(calls) == 1:
+            transaction.get().addBeforeCommitHook(raise_conflict)
+
+        return remove_upload_request(removed_request)
+
+    monkeypatch.setattr(settings, "DB_CONFLICT_BACKOFF", 0.001)
+    monkeypatch.setattr(cache_handler_module, "notify_garbage", garbage.append)
+    monkeypatch.setattr(
+        cache_handler,
+        "_remove_upload_request",
+        conflicting_remove
+    )
+
+    assert cache_handler.ack(leases) == 1
+    assert len(calls) == 2
+    assert garbage == [1]
+
+
+def test_CacheHandler_dedup(cache_handler, tmpdir_factory):
+    cache_dir = str(tmpdir_factory.mktemp("bds"))
+    bds_id = store_file(StringIO("same data"), cache_dir=cache_dir)
+
+    first, second = [
+        UploadRequest(
+            username="someuser",
+            rest_id=rest_id,
+            metadata={},
+            cache_dir=cache_dir,
+            bds_id=bds_id,
+        )
+        for rest_id in ["first", "second"]
+    ]
+
+    cache_handler.add_upload_request(first)
+    cache_handler.add_upload_request(second)
+    file_path = first.get_file_path()
+
+    # both requests are kept, but share one file
+    assert len(cache_handler) == 2
+    assert cache_handler.file_refs[bds_id] == 2
+
+    assert cache_handler.ack(cache_handler.claim()) == 1
+    assert os.path.exists(file_path)
+
+    # file is removed with the last reference
+    assert cache_handler.ack(cache_handler.claim()) == 1
+    assert not os.path.exists(file_path)
+    assert bds_id not in cache_handler.file_refs
+    assert cache_handler.is_empty()
+
+
+def test_CacheHandler_ack_concurrent_upload(cache_handler, tmpdir_factory,
+                                           monkeypatch):
+    cache_dir = str(tmpdir_factory.mktemp("bds"))
+
+    def add_request(rest_id):
+        request = UploadRequest(
+            username="someuser",
+            rest_id=rest_id,
+            metadata={},
+            cache_dir=cache_dir,
+            bds_id=store_file(StringIO("same data"), cache_dir=cache_dir),
+        )
+        return cache_handler.add_upload_request(request)
+
+    first = add_request("first")
+    file_path = first.get_file_path()
+    leases = cache_handler.claim(max_items=len(cache_handler))
+
+    # the same content is uploaded after the ack dropped the last reference,
+    # but before the file is removed
+    remove_unused_files = cache_handler._remove_unused_files
+
+    def upload_and_remove(files):
+        add_request("second")
+        return remove_unused_files(files)
+
+    monkeypatch.setattr(
+        cache_handler,
+        "_remove_unused_files",
+        upload_and_remove
+    )
+    assert cache_handler.ack(leases) == len(leases)
+    monkeypatch.undo()
+
+    assert os.path.exists(file_path)
+    assert cache_handler.file_refs[first.bds_id] == 1
+
+    leases = cache_handler.claim()
+    with leases[0].upload_request.get_file_obj() as f:
+        assert f.read() == "same data"
+
+    assert cache_handler.ack(leases) == 1
+    assert not os.path.exists(file_path)
+
+
+def test_cache_lock(tmpdir_factory):
+    cache_dir = str(tmpdir_factory.mktemp("bds"))
+    locked = []
+
+    def lock_in_thread():
+        with cache_lock(cache_dir):
+            locked.append(True)
+
+    with cache_lock(cache_dir):
+        thread = threading.Thread(target=lock_in_thread)
+        thread.start()
+        thread.join(0.2)
+
+        assert not locked
+
+    thread.join()
+    assert locked
+
+
+def test_store_file(tmpdir_factory):
+    cache_dir = str(tmpdir_factory.mktemp("bds"))
+    data = random_string(100)
+
+    bds_id = store_file(StringIO(data), cache_dir=cache_dir)
+
+    assert bds_id == "%s_%x" % (hashlib.sha256(data).hexdigest(), len(data))
+    with open(BalancedDiscStorage(cache_dir).file_path_from_hash(bds_id)) as f:
+        assert f.read() == data
+
+    # only part of the stream
+    bds_id = store_file(StringIO(data), cache_dir=cache_dir, size=10)
+    assert bds_id.endswith("_a")
+
+    with pytest.raises(IOError):
+        store_file(StringIO(data), cache_dir=cache_dir, size=1000)
+
+    with pytest.raises(UploadTooLargeException):
+        store_file(StringIO(data), cache_dir=cache_dir, max_size=10)
+
+    # no temporary files are left behind
+    assert not [
+        fn for fn in os.listdir(cache_dir)
+        if fn.startswith(".upload_")
+    ]
+
+
+def test_store_file_mode(tmpdir_factory):
+    cache_dir = str(tmpdir_factory.mktemp("bds"))
+
+    old_umask = os.umask(0022)
+    try:
+        bds_id = store_file(StringIO("data"), cache_dir=cache_dir)
+    finally:
+        os.umask(old_umask)
+
+    file_path = BalancedDiscStorage(cache_dir).file_path_from_hash(bds_id)
+    assert stat.S_IMODE(os.stat(file_path).st_mode) == 0644
@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import pytest
+
+from rest.database import UserHandler
+from rest.database import CacheHandler
+from rest.database import HandlerPool
+from rest.database import ThreadHandlerPool
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def pool():
+    return HandlerPool()
+
+
+# Tests =======================================================================
+def test_handler_pool_reuse(pool, client_conf_path):
+    first = pool.get(UserHandler, conf_path=client_conf_path)
+    second = pool.get(UserHandler, conf_path=client_conf_path)
+
+    assert first is second
+    assert isinstance(first, UserHandler)
+    assert pool.stats()["hits"] == 1
+    assert pool.stats()["misses"] == 1
+
+
+def test_handler_pool_keys(pool, client_conf_path):
+    user_db = pool.get(UserHandler, conf_path=client_conf_path)
+    cache_db = pool.get(CacheHandler, conf_path=client_conf_path)
+    alt_user_db = pool.get(
+        UserHandler,
+        conf_path=client_conf_path,
+        project_key="alt_key",
+    )
+
+    assert user_db is not alt_user_db
+    assert isinstance(cache_db, CacheHandler)
+    assert pool.stats()["misses"] == 3
+    assert pool.stats()["handlers"] == 3
+
+
+def test_handler_pool_discard(pool, client_conf_path):
+    first = pool.get(UserHandler, conf_path=client_conf_path)
+    pool.discard(conf_path=client_conf_path)
+
+    assert pool.get(UserHandler, conf_path=client_conf_path) is not first
+
+    pool.clear()
+
+    assert pool.stats() == {
+        "hits": 0,
+        "misses": 0,
+        "reconnects": 0,
+        "handlers": 0,
+    }
+
+
+def test_thread_handler_pool(client_conf_path):
+    thread_pool = ThreadHandlerPool(size=2, max_requests=2)
+
+    with thread_pool.checkout() as handlers:
+        first = handlers.get(UserHandler, conf_path=client_conf_path)
+
+    with thread_pool.checkout() as handlers:
+        assert handlers.get(UserHandler, conf_path=client_conf_path) is first
+
+    # recycled after `max_requests`
+    with thread_pool.checkout() as handlers:
+        second = handlers.get(UserHandler, conf_path=client_conf_path)
+
+    assert second is not first
+
+    stats = thread_pool.stats()
+    assert stats["checkouts"] == 3
+    assert stats["recycled"] == 1
+    assert stats["wait_max"] >= 0
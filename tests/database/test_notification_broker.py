@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import time
+import threading
+
+import pytest
+
+from rest.database import StatusHandler
+from rest.database import NotificationBroker
+
+
+# Variables ===================================================================
+PROJECT_KEY = "broker"
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def broker(client_conf_path):
+    return NotificationBroker(
+        conf_path=client_conf_path,
+        project_key=PROJECT_KEY,
+        poll_interval=0.1,
+    )
+
+
+@pytest.fixture
+def status_handler(client_conf_path):
+    return StatusHandler(
+        conf_path=client_conf_path,
+        project_key=PROJECT_KEY,
+    )
+
+
+# Tests =======================================================================
+def test_wait_timeout(broker):
+    start = time.time()
+    assert broker.wait("user", since=5, timeout=0.2, version=3) == 3
+    assert time.time() - start >= 0.2
+
+    # nothing is remembered after the wait
+    assert broker.stats()["users"] == 0
+
+
+def test_wait_cooperative_sleep(broker):
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        broker.notify("user", 4)
+
+    assert broker.wait("user", since=3, timeout=10, version=3,
+                       sleep=sleep) == 4
+    assert sleeps == [broker.poll_interval]
+
+
+def test_wait_returns_newer_version(broker):
+    assert broker.wait("user", since=1, timeout=10, version=2) == 2
+
+
+def test_notify(broker):
+    timer = threading.Timer(0.1, lambda: broker.notify("user", 4))
+    timer.start()
+
+    assert broker.wait("user", since=3, timeout=10, version=3) == 4
+
+    # unwatched users are ignored
+    broker.notify("other", 10)
+    assert broker.stats()["users"] == 0
+
+
+def test_check(broker, status_handler):
+    username = "broker_user"
+    status_handler.register_status_tracking(username, "broker_id")
+    version = status_handler.query_user_version(username)
+
+    broker.start()
+    try:
+        result = []
+        waiter = threading.Thread(
+            target=lambda: result.append(
+                broker.wait(username, since=version, timeout=10)
+            )
+        )
+        waiter.start()
+
+        # ZEO connection of the handler is bound to this thread
+        time.sleep(0.2)
+        status_handler.save_status_update(
+            rest_id="broker_id",
+            message="Update.",
+            timestamp=time.time(),
+        )
+
+        waiter.join(10)
+        assert result and result[0] > version
+    finally:
+        broker.stop()
+
+    assert broker.last_error is None
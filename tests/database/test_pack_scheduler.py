@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import time
+
+import pytest
+
+from rest.database import PackScheduler
+from rest.database.pack_scheduler import _in_quiet_hours
+from rest.database.pack_scheduler import _parse_quiet_hours
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def scheduler(client_conf_path):
+    return PackScheduler(
+        conf_path=client_conf_path,
+        interval=60,
+        garbage_threshold=10,
+        quiet_hours="",
+    )
+
+
+# Tests =======================================================================
+def test_parse_quiet_hours():
+    assert _parse_quiet_hours("") is None
+    assert _parse_quiet_hours("1-5") == (1, 5)
+    assert _parse_quiet_hours("22-4") == (22, 4)
+
+    with pytest.raises(ValueError):
+        _parse_quiet_hours("azgabash")
+
+    with pytest.raises(ValueError):
+        _parse_quiet_hours("1-25")
+
+    with pytest.raises(ValueError):
+        _parse_quiet_hours("3-3")
+
+
+def test_in_quiet_hours():
+    assert _in_quiet_hours(12, None)
+
+    assert _in_quiet_hours(1, (1, 5))
+    assert not _in_quiet_hours(5, (1, 5))
+
+    assert _in_quiet_hours(23, (22, 4))
+    assert _in_quiet_hours(3, (22, 4))
+    assert not _in_quiet_hours(12, (22, 4))
+
+
+def test_pack_scheduler_policies(scheduler):
+    now = time.time()
+    assert not scheduler.should_pack(now)
+
+    scheduler.add_garbage(10)
+    assert scheduler.should_pack(now)
+
+    # the interval doesn't pack the database without garbage
+    scheduler.pending_garbage = 0
+    assert not scheduler.should_pack(now + 61)
+
+    scheduler.add_garbage(1)
+    assert not scheduler.should_pack(now)
+    assert scheduler.should_pack(now + 61)
+
+
+def test_pack_scheduler_pack(scheduler):
+    scheduler.add_garbage(10)
+    scheduler.pack()
+
+    stats = scheduler.stats()
+    assert stats["runs"] == 1
+    assert stats["last_error"] is None
+    assert stats["pending_garbage"] == 0
+    assert stats["last_run"]
+    assert stats["last_duration"] >= 0
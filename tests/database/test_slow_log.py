@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import json
+import logging
+
+import pytest
+
+from rest import settings
+from rest.database import UserHandler
+from rest.database import slow_log
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def slow_settings(request):
+    old = (
+        settings.SLOW_OPERATION_TIME,
+        settings.SLOW_OPERATION_LOADS,
+        settings.SLOW_OPERATION_LOG,
+    )
+
+    def restore_settings():
+        (settings.SLOW_OPERATION_TIME,
+         settings.SLOW_OPERATION_LOADS,
+         settings.SLOW_OPERATION_LOG) = old
+
+    request.addfinalizer(restore_settings)
+
+
+@pytest.fixture
+def records(request):
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            logging.Handler.__init__(self)
+            self.records = []
+
+        def emit(self, record):
+            self.records.append(record.getMessage())
+
+    handler = ListHandler()
+    slow_log.LOGGER.addHandler(handler)
+    request.addfinalizer(lambda: slow_log.LOGGER.removeHandler(handler))
+
+    return handler.records
+
+
+# Tests =======================================================================
+def test_is_slow(slow_settings):
+    settings.SLOW_OPERATION_TIME = 1.0
+    settings.SLOW_OPERATION_LOADS = 100
+
+    assert not slow_log.is_slow(0.5, 10)
+    assert not slow_log.is_slow(0.5, None)
+    assert slow_log.is_slow(1.5, 10)
+    assert slow_log.is_slow(0.5, 100)
+
+    settings.SLOW_OPERATION_TIME = 0
+    settings.SLOW_OPERATION_LOADS = 0
+    assert not slow_log.is_enabled()
+    assert not slow_log.is_slow(100, 100000)
+
+
+def test_record(slow_settings, records, tmpdir):
+    settings.SLOW_OPERATION_TIME = 1.0
+    settings.SLOW_OPERATION_LOADS = 0
+    settings.SLOW_OPERATION_LOG = ""
+
+    assert not slow_log.record("StatusHandler", "query", 0.5, loads=10)
+    assert slow_log.record("StatusHandler", "query", 1.5, loads=10)
+
+    prefix, data = records[-1].split(" ", 1)
+    assert prefix == "slow_operation"
+    assert json.loads(data)["method"] == "query"
+    assert json.loads(data)["loads"] == 10
+
+    log_path = tmpdir.join("slow.log")
+    settings.SLOW_OPERATION_LOG = str(log_path)
+    assert slow_log.record("StatusHandler", "query", 2)
+
+    assert "slow_operation" in log_path.read()
+
+
+def test_handler_calls_are_logged(slow_settings, records, client_conf_path):
+    settings.SLOW_OPERATION_TIME = 0
+    settings.SLOW_OPERATION_LOADS = 1
+    settings.SLOW_OPERATION_LOG = ""
+
+    user_db = UserHandler(conf_path=client_conf_path)
+    user_db.add_user("slow_user", "hash")
+
+    # new connection has to load the index of the users
+    UserHandler(conf_path=client_conf_path).is_registered("slow_user")
+
+    data = [json.loads(record.split(" ", 1)[1]) for record in records]
+    assert any(
+        record["handler"] == "UserHandler" and
+        record["method"] == "is_registered" and
+        record["loads"] >= 1
+        for record in data
+    )
@@ -7,11 +7,13 @@
 import time
 
 import pytest
+import transaction
 
 from zeo_connector_defaults import tmp_context_name
 
 from rest.database import StatusHandler
 from rest.database.status_handler import StatusInfo
+from rest.database.status_handler import MessageLog
 from rest.database.status_handler import StatusMessage
 from rest.database.status_handler import AccessDeniedException
 
@@ -69,6 +71,32 @@ def test_status_info_get_messages():
     assert si.get_messages() == [StatusMessage(*params)]
 
 
+def test_status_info_message_log():
+    si = StatusInfo(rest_id=REST_ID)
+
+    first = StatusMessage("first", 1)
+    second = StatusMessage("second", 2)
+    si.add_status_message(second)
+    si.add_status_message(first)
+    si.add_status_message(StatusMessage("first", 1))
+
+    assert si.get_messages() == [first, second]
+
+
+def test_status_info_message_set_migration():
+    si = StatusInfo(rest_id=REST_ID)
+
+    first = StatusMessage("first", 1)
+    si.messages = set([first])
+    assert si.get_messages() == [first]
+
+    second = StatusMessage("second", 2)
+    si.add_status_message(second)
+
+    assert isinstance(si.messages, MessageLog)
+    assert si.get_messages() == [first, second]
+
+
 def test_status_info_sorting():
     s1 = StatusInfo(rest_id=REST_ID)
     s2 = StatusInfo(rest_id=REST_ID)
@@ -161,3 +189,146 @@ def test_status_handler_trigger_garbage_collection(status_handler):
 
     with pytest.raises(IndexError):
         status_handler.query_statuses(USERNAME)
+
+
+def test_status_handler_query_statuses_page(status_handler):
+    username = "paginated"
+    rest_ids = ["id_%d" % i for i in range(5)]
+    for rest_id in rest_ids:
+        status_handler.register_status_tracking(username, rest_id)
+
+    page, cursor = status_handler.query_statuses_page(username, limit=2)
+    assert [status.rest_id for status in page] == rest_ids[:2]
+    assert cursor
+
+    page, cursor = status_handler.query_statuses_page(
+        username,
+        limit=2,
+        cursor=cursor,
+    )
+    assert [status.rest_id for status in page] == rest_ids[2:4]
+
+    page, cursor = status_handler.query_statuses_page(
+        username,
+        limit=2,
+        cursor=cursor,
+    )
+    assert [status.rest_id for status in page] == rest_ids[4:]
+    assert cursor is None
+
+    since = status_handler.query_statuses(username)[3].registered_ts
+    page, cursor = status_handler.query_statuses_page(username, since=since)
+    assert [status.rest_id for status in page] == rest_ids[3:]
+
+    with pytest.raises(ValueError):
+        status_handler.query_statuses_page(username, cursor="azgabash")
+
+    status_handler.remove_user(username)
+
+    with pytest.raises(IndexError):
+        status_handler.query_statuses_page(username)
+
+
+def test_status_info_version_conflict_resolution():
+    status_info = StatusInfo(rest_id=REST_ID)
+    old_state = status_info.__getstate__()
+
+    status_info.bump_version()
+    saved_state = status_info.__getstate__()
+    new_state = dict(saved_state)
+
+    # two concurrent increments are summed
+    resolved = status_info._p_resolveConflict(
+        old_state,
+        saved_state,
+        new_state,
+    )
+    assert resolved["version"] == 2
+
+
+def test_status_handler_versions(status_handler):
+    username = "versioned"
+    rest_id = "versioned_id"
+
+    assert status_handler.query_user_version(username) == 0
+
+    status_handler.register_status_tracking(username, rest_id)
+    user_version = status_handler.query_user_version(username)
+    version = status_handler.query_status_version(rest_id, username)
+    assert user_version > 0
+    assert version > 0
+
+    status_handler.save_status_update(
+        rest_id=rest_id,
+        message="Update.",
+        timestamp=time.time(),
+    )
+    assert status_handler.query_status_version(rest_id, username) > version
+    assert status_handler.query_user_version(username) > user_version
+
+    assert status_handler.query_user_versions([username, "azgabash"]) == {
+        username: status_handler.query_user_version(username),
+        "azgabash": 0,
+    }
+
+    with pytest.raises(AccessDeniedException):
+        status_handler.query_status_version(rest_id, "azgabash")
+
+    # version of the user never goes back
+    user_version = status_handler.query_user_version(username)
+    status_handler.remove_user(username)
+    assert status_handler.query_user_version(username) > user_version
+
+
+def test_status_handler_incremental_garbage_collection(status_handler):
+    status_handler.trigger_garbage_collection(interval=0)
+
+    username = "garbage"
+    for i in range(5):
+        status_handler.register_status_tracking(username, "garbage_%d" % i)
+
+    # not old enough
+    result = status_handler.trigger_garbage_collection()
+    assert result.removed == 0
+    assert result.finished
+
+    result = status_handler.trigger_garbage_collection(
+        interval=0,
+        batch_size=2,
+        time_budget=0,
+    )
+    assert result.removed == 2
+    assert result.batches == 1
+    assert not result.finished
+    assert len(status_handler.query_statuses(username)) == 3
+
+    result = status_handler.trigger_garbage_collection(
+        interval=0,
+        batch_size=2,
+    )
+    assert result.removed == 3
+    assert result.batches == 2
+    assert result.finished
+
+    with pytest.raises(IndexError):
+        status_handler.query_statuses(username)
+
+
+def test_status_handler_garbage_collection_orphaned_keys(status_handler):
+    status_handler.trigger_garbage_collection(interval=0)
+
+    # keys of the index without StatusInfo in the database
+    with transaction.manager:
+        for i in range(5):
+            orphan = StatusInfo(rest_id="orphan_%d" % i)
+            status_handler.registered_index[(i, orphan.rest_id)] = orphan
+
+    result = status_handler.trigger_garbage_collection(
+        interval=0,
+        batch_size=2,
+    )
+    assert result.removed == 0
+    assert result.finished
+
+    with transaction.manager:
+        assert not list(status_handler.registered_index.keys())
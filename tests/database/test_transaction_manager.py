@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import pytest
+from ZODB.POSException import ConflictError
+
+from rest import settings
+from rest import metrics
+from rest.database.transaction_manager import backoff
+from rest.database.transaction_manager import transaction_manager
+
+
+# Functions & classes =========================================================
+class ConflictingHandler(object):
+    """
+    Handler, which methods fail with ConflictError `conflicts` times.
+    """
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        self.calls = 0
+
+    def _conflict(self):
+        self.calls += 1
+        if self.calls <= self.conflicts:
+            raise ConflictError()
+
+        return self.calls
+
+    @transaction_manager
+    def retried(self):
+        return self._conflict()
+
+
+def conflict_count(method, outcome):
+    return metrics.HANDLER_CONFLICTS.values().get(
+        ("ConflictingHandler", method, outcome),
+        0
+    )
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def retry_settings(request):
+    old = (
+        settings.DB_CONFLICT_RETRIES,
+        settings.DB_CONFLICT_BACKOFF,
+        settings.METRICS_ENABLED,
+    )
+
+    settings.DB_CONFLICT_RETRIES = 3
+    settings.DB_CONFLICT_BACKOFF = 0.001
+    settings.METRICS_ENABLED = True
+    metrics.HANDLER_CONFLICTS.clear()
+
+    def restore_settings():
+        (
+            settings.DB_CONFLICT_RETRIES,
+            settings.DB_CONFLICT_BACKOFF,
+            settings.METRICS_ENABLED,
+        ) = old
+
+    request.addfinalizer(restore_settings)
+
+
+# Tests =======================================================================
+def test_backoff(retry_settings):
+    for attempt in range(1, 5):
+        delay = backoff(attempt)
+        assert 0 <= delay <= settings.DB_CONFLICT_BACKOFF * 2 ** (attempt - 1)
+
+
+def test_conflict_is_retried(retry_settings):
+    handler = ConflictingHandler(conflicts=2)
+
+    assert handler.retried() == 3
+    assert conflict_count("retried", "retried") == 2
+    assert conflict_count("retried", "failed") == 0
+
+
+def test_retries_give_up(retry_settings):
+    handler = ConflictingHandler(conflicts=10)
+
+    with pytest.raises(ConflictError):
+        handler.retried()
+
+    assert handler.calls == settings.DB_CONFLICT_RETRIES + 1
+    assert conflict_count("retried", "retried") == 3
+    assert conflict_count("retried", "failed") == 1
+
@@ -10,6 +10,7 @@ import pytest
 
 from rest.database import UserHandler
 from rest.database.user_handler import create_hash
+from rest.database.user_handler import CredentialCache
 
 
 # Fixtures ====================================================================
@@ -59,4 +60,43 @@ def test_multiple_users_querying(user_db):
 
 def test_is_registered(user_db):
     assert user_db.is_registered("foo")
-    assert not user_db.is_registered("bar")
\ No newline at end of file
+    assert not user_db.is_registered("bar")
+
+
+def test_credential_cache(user_db):
+    cache = user_db.credential_cache
+    user_db.add_user("cached", create_hash("pass"))
+    cache.clear()
+
+    assert user_db.is_valid_user("cached", "pass")
+    assert user_db.is_valid_user("cached", "pass")
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["size"] == 1
+
+    # wrong passwords are not cached
+    assert not user_db.is_valid_user("cached", "azgabash")
+    assert cache.stats()["size"] == 1
+
+    # change of the password invalidates the record
+    user_db.add_user("cached", create_hash("other"))
+    assert not user_db.is_valid_user("cached", "pass")
+    assert user_db.is_valid_user("cached", "other")
+
+    user_db.remove_user("cached")
+    assert not user_db.is_valid_user("cached", "other")
+
+
+def test_credential_cache_limits():
+    cache = CredentialCache(max_size=2, ttl=60)
+
+    for username in ["a", "b", "c"]:
+        cache.add(username, "pass", "hash")
+
+    assert cache.stats()["size"] == 2
+    assert not cache.is_valid("a", "pass", "hash")
+    assert cache.is_valid("c", "pass", "hash")
+    assert not cache.is_valid("c", "pass", "other hash")
+
+    cache = CredentialCache(max_size=2, ttl=-1)
+    cache.add("a", "pass", "hash")
+    assert not cache.is_valid("a", "pass", "hash")
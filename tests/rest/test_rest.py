@@ -6,14 +6,23 @@
 # Imports =====================================================================
 from __future__ import unicode_literals
 
+import sys
 import json
+import base64
+import random
+import hashlib
+import tempfile
+import threading
+import subprocess
 import urlparse
+from contextlib import contextmanager
 
 import os
 import time
 import pytest
 import os.path
 import requests
+import transaction
 import dhtmlparser
 from requests.auth import HTTPBasicAuth
 
@@ -22,11 +31,24 @@ from rest.database import UserHandler
 from rest.database import CacheHandler
 from rest.database import StatusHandler
 from rest.database.user_handler import create_hash
+from rest.database.cache_handler import UploadRequest
 
 
 # Variables ===================================================================
 USERNAME = "user"
 PASSWORD = "pass"
+MINIMAL_METADATA = {
+    "nazev": "Název",
+    "poradi_vydani": "3",
+    "misto_vydani": "Praha",
+    "rok_vydani": "1989",
+    "zpracovatel_zaznamu": "/me",
+    "nazev_souboru": "story_of_mighty_azgabash.pdf",
+}
+WEBSERVER_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "../../bin/edeposit_rest_webserver.py"
+)
 
 
 # Fixtures ====================================================================
@@ -45,6 +67,33 @@ def status_db(client_conf_path):
     return StatusHandler(conf_path=client_conf_path)
 
 
+@pytest.fixture
+def tracker(request, user_db, status_db):
+    """
+    User with three tracked requests. Returns ``(auth, rest_ids)``.
+    """
+    username = "tracker"
+    password = "tracker_pass"
+    rest_ids = ["tracked_%d" % i for i in range(3)]
+
+    user_db.add_user(username, create_hash(password))
+    for rest_id in rest_ids:
+        status_db.register_status_tracking(username, rest_id)
+        status_db.save_status_update(
+            rest_id=rest_id,
+            message="Registered.",
+            timestamp=time.time(),
+        )
+
+    def remove_tracker():
+        status_db.remove_user(username)
+        user_db.remove_user(username)
+
+    request.addfinalizer(remove_tracker)
+
+    return HTTPBasicAuth(username, password), rest_ids
+
+
 
 # Functions ===================================================================
 def check_errors(response):
@@ -68,6 +117,47 @@ def check_errors(response):
     return response.text
 
 
+@contextmanager
+def webserver(client_conf_path, server_conf_path, **alt_settings):
+    """
+    Run separate webserver with `alt_settings` and yield its API url.
+    """
+    port = random.randint(20000, 60000)
+    settings = {
+        "ZEO_CLIENT_CONF_FILE": client_conf_path,
+        "ZEO_SERVER_CONF_FILE": server_conf_path,
+        "WEB_ADDR": "127.0.0.1",
+        "WEB_PORT": port,
+        "WEB_BE_QUIET": True,
+        "WEB_CACHE": tempfile.mkdtemp(),
+    }
+    settings.update(alt_settings)
+
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.write(json.dumps(settings))
+
+    process = subprocess.Popen(
+        [sys.executable, WEBSERVER_PATH],
+        env=dict(os.environ, SETTINGS_PATH=f.name),
+    )
+    url = "http://127.0.0.1:%d" % port
+    try:
+        for _ in range(30):
+            try:
+                requests.get(url, timeout=1).raise_for_status()
+                break
+            except Exception:
+                time.sleep(0.5)
+        else:
+            raise IOError("Couldn't connect to the webserver.")
+
+        yield url + "/api/v1/"
+    finally:
+        process.terminate()
+        process.wait()
+        os.unlink(f.name)
+
+
 def send_request(url, data):
     return requests.post(
         urlparse.urljoin(url, "submit"),
@@ -78,6 +168,25 @@ def send_request(url, data):
     )
 
 
+def get_track(url, auth, path="track", **params):
+    return requests.get(
+        urlparse.urljoin(url, path),
+        params=params,
+        auth=auth,
+        timeout=5,
+    )
+
+
+def send_stream(url, data, body):
+    return requests.put(
+        urlparse.urljoin(url, "submit"),
+        params={"json_metadata": json.dumps(data)},
+        data=body,
+        auth=HTTPBasicAuth(USERNAME, PASSWORD),
+        timeout=5,
+    )
+
+
 # Tests =======================================================================
 def test_create_user_for_rest(user_db, zeo, client_conf_path):
     user_db.add_user(USERNAME, create_hash(PASSWORD))
@@ -230,6 +339,332 @@ def test_submit_epub_optionals_riv_error(web_api_url):
         check_errors(resp)
 
 
+def test_submit_stream(web_api_url, cache_db, status_db):
+    resp = send_stream(web_api_url, MINIMAL_METADATA, b"Whatever")
+    rest_id = check_errors(resp)
+
+    assert rest_id in [
+        status_info.rest_id
+        for status_info in status_db.query_statuses(USERNAME)
+    ]
+
+    with transaction.manager:
+        file_path = cache_db.cache[rest_id].get_file_path()
+
+    with open(file_path) as f:
+        assert f.read() == b"Whatever"
+
+
+def test_submit_stream_without_length(web_api_url):
+    # generator is sent chunked, without the Content-Length
+    resp = send_stream(web_api_url, MINIMAL_METADATA, iter([b"Whatever"]))
+
+    assert resp.status_code == 411
+
+
+def test_submit_too_large(client_conf_path, server_conf_path):
+    with webserver(client_conf_path, server_conf_path,
+                   WEB_MAX_UPLOAD_SIZE=4) as api_url:
+        resp = send_stream(api_url, MINIMAL_METADATA, b"Whatever")
+        assert resp.status_code == 413
+
+        # the size is known only after the upload of the form
+        resp = send_request(api_url, MINIMAL_METADATA)
+        assert resp.status_code == 413
+
+        resp = send_stream(api_url, MINIMAL_METADATA, b"What")
+        assert check_errors(resp)
+
+
+def test_track(web_api_url, tracker):
+    auth, rest_ids = tracker
+
+    # without parameters, the response is the same as before the pagination
+    resp = get_track(web_api_url, auth)
+    resp.raise_for_status()
+
+    data = resp.json()
+    assert sorted(data.keys()) == rest_ids
+    assert sorted(data[rest_ids[0]].keys()) == [
+        "book_name",
+        "messages",
+        "pub_url",
+    ]
+    assert data[rest_ids[0]]["messages"][0]["message"] == "Registered."
+
+
+def test_track_pagination(web_api_url, tracker):
+    auth, rest_ids = tracker
+
+    resp = get_track(web_api_url, auth, limit=2)
+    resp.raise_for_status()
+    page = resp.json()
+
+    assert [item["rest_id"] for item in page["items"]] == rest_ids[:2]
+    assert page["items"][0]["messages"]
+    assert page["next_cursor"]
+
+    resp = get_track(web_api_url, auth, limit=2, cursor=page["next_cursor"])
+    resp.raise_for_status()
+    page = resp.json()
+
+    assert [item["rest_id"] for item in page["items"]] == rest_ids[2:]
+    assert page["next_cursor"] is None
+
+    resp = get_track(web_api_url, auth, summary=1)
+    resp.raise_for_status()
+    items = resp.json()["items"]
+
+    assert [item["rest_id"] for item in items] == rest_ids
+    assert all("messages" not in item for item in items)
+    assert all(item["registered_ts"] for item in items)
+
+    # str() of the float would be rounded
+    since = repr(items[1]["registered_ts"])
+    resp = get_track(web_api_url, auth, since=since)
+    resp.raise_for_status()
+
+    assert [item["rest_id"] for item in resp.json()["items"]] == rest_ids[1:]
+
+
+def test_track_invalid_parameters(web_api_url, tracker):
+    auth, _ = tracker
+
+    resp = get_track(web_api_url, auth, cursor="azgabash")
+    assert resp.status_code == 400
+    assert resp.json()["error"]
+
+    resp = get_track(web_api_url, auth, limit="azgabash")
+    assert resp.status_code == 400
+    assert "limit" in resp.json()["error"]
+
+    resp = get_track(web_api_url, auth, limit=0)
+    assert resp.status_code == 400
+
+
+def test_track_etag(web_api_url, tracker, status_db):
+    auth, rest_ids = tracker
+
+    for path in ["track", "track/%s" % rest_ids[0]]:
+        resp = get_track(web_api_url, auth, path=path)
+        resp.raise_for_status()
+        etag = resp.headers["ETag"]
+        assert etag.startswith('"v')
+
+        # nothing changed
+        resp = requests.get(
+            urlparse.urljoin(web_api_url, path),
+            headers={"If-None-Match": etag},
+            auth=auth,
+            timeout=5,
+        )
+        assert resp.status_code == 304
+        assert resp.headers["ETag"] == etag
+        assert not resp.content
+
+        status_db.save_status_update(
+            rest_id=rest_ids[0],
+            message="Updated.",
+            timestamp=time.time(),
+        )
+
+        resp = requests.get(
+            urlparse.urljoin(web_api_url, path),
+            headers={"If-None-Match": etag},
+            auth=auth,
+            timeout=5,
+        )
+        assert resp.status_code == 200
+        assert resp.headers["ETag"] != etag
+        assert "Updated." in resp.text
+
+
+def test_track_poll(web_api_url, tracker, status_db):
+    auth, rest_ids = tracker
+
+    resp = get_track(web_api_url, auth, path="track/poll")
+    resp.raise_for_status()
+    version = resp.json()["version"]
+    assert resp.json()["changed"]
+
+    # nothing changed until the timeout
+    start = time.time()
+    resp = get_track(
+        web_api_url,
+        auth,
+        path="track/poll",
+        since=version,
+        timeout=0.5,
+    )
+    resp.raise_for_status()
+    assert time.time() - start >= 0.5
+    assert resp.json() == {"version": version, "changed": False}
+
+    # returns, when the status is updated
+    def update_status():
+        time.sleep(0.5)
+        status_db.save_status_update(
+            rest_id=rest_ids[0],
+            message="Updated.",
+            timestamp=time.time(),
+        )
+
+    updater = threading.Thread(target=update_status)
+    updater.start()
+
+    start = time.time()
+    resp = get_track(
+        web_api_url,
+        auth,
+        path="track/poll",
+        since=version,
+        timeout=4,
+    )
+    updater.join()
+
+    resp.raise_for_status()
+    assert time.time() - start < 4
+    assert resp.json()["changed"]
+    assert resp.json()["version"] > version
+
+
+def test_track_poll_limit(client_conf_path, server_conf_path, tracker):
+    auth, _ = tracker
+
+    with webserver(client_conf_path, server_conf_path,
+                   WEB_MAX_LONG_POLLS=1) as api_url:
+        resp = get_track(api_url, auth, path="track/poll")
+        version = resp.json()["version"]
+
+        def wait():
+            get_track(api_url, auth, path="track/poll", since=version,
+                      timeout=2)
+
+        waiting = threading.Thread(target=wait)
+        waiting.start()
+        time.sleep(0.5)
+
+        resp = get_track(
+            api_url,
+            auth,
+            path="track/poll",
+            since=version,
+            timeout=2,
+        )
+        waiting.join()
+
+        assert resp.status_code == 503
+        assert resp.headers["Retry-After"] == "1"
+
+        # the slot is free again
+        resp = get_track(
+            api_url,
+            auth,
+            path="track/poll",
+            since=version,
+            timeout=0.1,
+        )
+        assert resp.status_code == 200
+
+
+def test_description_page_cache(bottle_server, web_api_url):
+    url = urlparse.urljoin(web_api_url, "/")
+
+    resp = requests.get(url, timeout=5)
+    resp.raise_for_status()
+
+    assert resp.headers["ETag"]
+    assert resp.headers["Last-Modified"]
+
+    resp = requests.get(
+        url,
+        headers={"If-None-Match": resp.headers["ETag"]},
+        timeout=5,
+    )
+    assert resp.status_code == 304
+    assert not resp.content
+
+    resp = requests.get(
+        url,
+        headers={"If-None-Match": '"other"'},
+        timeout=5,
+    )
+    assert resp.status_code == 200
+    assert resp.content
+
+
+def test_static_structures(bottle_server, web_api_url):
+    url = urlparse.urljoin(web_api_url, "structures/riv")
+
+    resp = requests.get(url, headers={"Accept-Encoding": "gzip"}, timeout=5)
+    resp.raise_for_status()
+
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "max-age" in resp.headers["Cache-Control"]
+    assert resp.json()
+
+    plain = requests.get(
+        url,
+        headers={"Accept-Encoding": "identity"},
+        timeout=5,
+    )
+    assert "Content-Encoding" not in plain.headers
+    assert plain.json() == resp.json()
+    assert plain.headers["ETag"] != resp.headers["ETag"]
+
+    resp = requests.get(
+        url,
+        headers={
+            "Accept-Encoding": "identity",
+            "If-None-Match": plain.headers["ETag"],
+        },
+        timeout=5,
+    )
+    assert resp.status_code == 304
+
+
+def test_metrics(bottle_server, web_api_url):
+    requests.get(urlparse.urljoin(web_api_url, "structures/riv"), timeout=5)
+
+    resp = requests.get(urlparse.urljoin(web_api_url, "/metrics"), timeout=5)
+    resp.raise_for_status()
+
+    assert resp.headers["Content-Type"].startswith("text/plain")
+    assert "# TYPE edeposit_rest_http_request_seconds histogram" in resp.text
+    assert 'route="/api/v1/structures/riv"' in resp.text
+    assert "edeposit_rest_handler_seconds" in resp.text
+    assert "edeposit_rest_cache_queue_size" in resp.text
+
+
+def test_upload_request_chunks(tmpdir_factory):
+    file_path = str(tmpdir_factory.mktemp("tmp").join("chunks.pdf"))
+    data = os.urandom(1000)
+    with open(file_path, "wb") as f:
+        f.write(data)
+
+    cached_request = UploadRequest(
+        username=USERNAME,
+        rest_id="chunked",
+        metadata={"meta": "data"},
+        file_obj=open(file_path, "rb"),
+        cache_dir=str(tmpdir_factory.mktemp("bds")),
+    )
+
+    chunks = list(rest._to_upload_request_chunks(cached_request, 300))
+
+    assert [chunk.seq for chunk in chunks] == [0, 1, 2, 3]
+    assert all(chunk.chunks == 4 for chunk in chunks)
+    assert all(chunk.total_size == len(data) for chunk in chunks)
+    assert chunks[0].metadata == {"meta": "data"}
+    assert chunks[1].metadata is None
+
+    decoded = b"".join(base64.b64decode(chunk.b64_data) for chunk in chunks)
+    assert decoded == data
+    assert chunks[0].checksum == hashlib.sha256(data).hexdigest()
+
+    cached_request.remove_file()
+
+
 def test_amqp_chain(web_api_url, user_db, cache_db, status_db, alt_conf_path):
     global USERNAME
     global PASSWORD
@@ -330,3 +765,45 @@ def test_amqp_chain(web_api_url, user_db, cache_db, status_db, alt_conf_path):
     with pytest.raises(IndexError):
         status_db.query_statuses(USERNAME)
     assert not os.path.exists(file_path)
+
+
+def test_gevent_mode(client_conf_path, server_conf_path):
+    pytest.importorskip("gevent")
+
+    with webserver(client_conf_path, server_conf_path,
+                   WEB_SERVER="gevent") as api_url:
+        results = {}
+
+        def get(name, url, auth):
+            resp = requests.get(url, auth=auth, timeout=10)
+            results.setdefault(name, []).append(resp)
+
+        # concurrent requests don't share bottle's request and response
+        urls = {
+            "riv": (urlparse.urljoin(api_url, "structures/riv"), None),
+            "track": (
+                urlparse.urljoin(api_url, "track"),
+                HTTPBasicAuth(USERNAME, PASSWORD),
+            ),
+            "denied": (
+                urlparse.urljoin(api_url, "track"),
+                HTTPBasicAuth(USERNAME, "azgabash"),
+            ),
+        }
+        threads = [
+            threading.Thread(target=get, args=(name, url, auth))
+            for name, (url, auth) in urls.items() * 5
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert all(resp.status_code == 200 for resp in results["riv"])
+        assert all(resp.json() for resp in results["riv"])
+        assert all(resp.status_code == 200 for resp in results["track"])
+        assert all(
+            resp.headers["ETag"].startswith('"v')
+            for resp in results["track"]
+        )
+        assert all(resp.status_code == 401 for resp in results["denied"])
@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+from rest.metrics import Gauge
+from rest.metrics import Registry
+from rest.metrics import Histogram
+
+
+# Tests =======================================================================
+def test_histogram():
+    histogram = Histogram("latency", "Latency.", ["route"], buckets=(1, 2))
+    histogram.observe(0.5, "/")
+    histogram.observe(2, "/")
+    histogram.observe(3, "/")
+
+    counts, total, count = histogram.series()[("/",)]
+    assert counts == [1, 1, 1]
+    assert total == 5.5
+    assert count == 3
+
+    lines = histogram.render()
+    assert 'latency_bucket{route="/",le="1.0"} 1' in lines
+    assert 'latency_bucket{route="/",le="2.0"} 2' in lines
+    assert 'latency_bucket{route="/",le="+Inf"} 3' in lines
+    assert 'latency_count{route="/"} 3' in lines
+
+    histogram.clear()
+    assert histogram.series() == {}
+
+
+def test_gauge():
+    gauge = Gauge("queue", "Queue.", lambda: {("a",): 1, ("b",): None},
+                  ["state"])
+    assert gauge.render()[2:] == ['queue{state="a"} 1.0']
+
+    def broken():
+        raise ValueError("Broken.")
+
+    assert Gauge("broken", "Broken.", broken).render()[2] == "# ERROR Broken."
+
+
+def test_registry():
+    registry = Registry()
+    histogram = registry.histogram("latency", "Latency.")
+
+    assert registry.histogram("latency", "Latency.") is histogram
+
+    histogram.observe(0.1)
+    assert "latency_count 1" in registry.render()
+
+
+def test_counter():
+    registry = Registry()
+    counter = registry.counter("conflicts", "Conflicts.", ["outcome"])
+    counter.inc("retried")
+    counter.inc("retried", amount=2)
+
+    assert counter.values() == {("retried",): 3}
+    assert 'conflicts{outcome="retried"} 3.0' in registry.render()
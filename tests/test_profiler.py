@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+
+import pytest
+
+from rest import settings
+from rest import profiler
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def profile_settings(request, tmpdir):
+    old = (
+        settings.PROFILE_SAMPLE_RATE,
+        settings.PROFILE_FILTER,
+        settings.PROFILE_DIR,
+    )
+
+    settings.PROFILE_SAMPLE_RATE = 1.0
+    settings.PROFILE_FILTER = ""
+    settings.PROFILE_DIR = str(tmpdir.join("profiles"))
+
+    def restore_settings():
+        (settings.PROFILE_SAMPLE_RATE,
+         settings.PROFILE_FILTER,
+         settings.PROFILE_DIR) = old
+
+    request.addfinalizer(restore_settings)
+
+    return settings.PROFILE_DIR
+
+
+# Functions ===================================================================
+def busy_function():
+    return sum(x * x for x in xrange(1000))
+
+
+# Tests =======================================================================
+def test_is_sampled(profile_settings):
+    assert profiler.is_sampled("GET /api/v1/track")
+
+    settings.PROFILE_FILTER = "^CacheTick$"
+    assert not profiler.is_sampled("GET /api/v1/track")
+    assert profiler.is_sampled("CacheTick")
+
+    settings.PROFILE_SAMPLE_RATE = 0
+    assert not profiler.is_sampled("CacheTick")
+
+
+def test_profiled(profile_settings):
+    with profiler.profiled("GET /api/v1/track"):
+        busy_function()
+
+    with profiler.profiled("CacheTick"):
+        busy_function()
+
+    dumps = os.listdir(profile_settings)
+    assert len(dumps) == 2
+    assert any(dump.startswith("GET_api_v1_track_") for dump in dumps)
+
+    stats, count = profiler.load_stats([profile_settings])
+    assert count == 2
+    assert any(
+        func[2] == "busy_function"
+        for func in stats.stats
+    )
+
+    stats, count = profiler.load_stats([profile_settings], "^CacheTick")
+    assert count == 1
+
+
+def test_profiled_disabled(profile_settings):
+    settings.PROFILE_SAMPLE_RATE = 0
+
+    with profiler.profiled("CacheTick"):
+        busy_function()
+
+    assert not os.path.exists(profile_settings)
+    assert profiler.load_stats([profile_settings]) == (None, 0)
+
+
+def test_profiled_nested(profile_settings):
+    with profiler.profiled("GET /api/v1/track"):
+        with profiler.profiled("CacheTick"):
+            busy_function()
+
+    # the inner block would stop the outer profile, so it is not profiled
+    dumps = os.listdir(profile_settings)
+    assert len(dumps) == 1
+    assert dumps[0].startswith("GET_api_v1_track_")
+
+    with profiler.profiled("CacheTick"):
+        busy_function()
+
+    assert len(os.listdir(profile_settings)) == 2